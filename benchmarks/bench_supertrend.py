@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+SuperTrend 基准测试：对比逐行 pandas 循环实现与 factors_lib 中的数组内核
+
+用法:
+    python bench_supertrend.py --bars 1000000 --legacy-bars 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from lib import factors_lib
+
+
+def make_bars(n, seed=42):
+    """
+    生成随机游走的 OHLCV 数据
+
+    :param n: K线数量
+    :param seed: 随机种子
+    :return: 包含 open/high/low/close/volume 列的 DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    close = 30000 + np.cumsum(rng.normal(0, 20, n))
+    spread = np.abs(rng.normal(0, 15, n))
+    return pd.DataFrame({
+        'open': np.r_[close[0], close[:-1]],
+        'high': close + spread,
+        'low': close - spread,
+        'close': close,
+        'volume': rng.uniform(1, 100, n),
+    })
+
+
+def legacy_supertrend(data, period=14, multiplier=3):
+    """
+    原有的逐行循环实现，仅用于对比（按位置读写单个元素）
+    """
+    result = pd.DataFrame(index=data.index)
+    ATR = factors_lib.atr(data.copy(), period)
+
+    upper_band = (data['high'] + data['low']) / 2 + multiplier * ATR.shift()
+    lower_band = (data['high'] + data['low']) / 2 - multiplier * ATR.shift()
+
+    result['SuperTrend'] = np.nan
+    column = result.columns.get_loc('SuperTrend')
+    for i in range(1, len(data)):
+        if data['close'].iloc[i - 1] <= upper_band.iloc[i - 1]:
+            result.iloc[i, column] = upper_band.iloc[i]
+        elif data['close'].iloc[i - 1] >= lower_band.iloc[i - 1]:
+            result.iloc[i, column] = lower_band.iloc[i]
+        else:
+            result.iloc[i, column] = result.iloc[i - 1, column]
+
+    return result
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SuperTrend benchmark')
+    parser.add_argument('--bars', type=int, default=1_000_000, help='number of bars for the array kernel')
+    parser.add_argument('--legacy-bars', type=int, default=1_000_000,
+                        help='number of bars for the legacy loop (it is slow, lower it for a quick run)')
+    parser.add_argument('--period', type=int, default=14)
+    parser.add_argument('--multiplier', type=float, default=3)
+    args = parser.parse_args()
+
+    data = make_bars(max(args.bars, args.legacy_bars))
+
+    # 预热：首次调用包含 numba 的编译时间
+    factors_lib.SuperTrend(data.iloc[:100], args.period, args.multiplier)
+
+    fast, fast_time = timed(factors_lib.SuperTrend, data.iloc[:args.bars], args.period, args.multiplier)
+    print(f"kernel ({'numba' if factors_lib.njit is not None else 'numpy'}): "
+          f"{args.bars} bars in {fast_time:.3f}s")
+
+    legacy_data = data.iloc[:args.legacy_bars]
+    slow, slow_time = timed(legacy_supertrend, legacy_data, args.period, args.multiplier)
+    print(f"legacy loop: {args.legacy_bars} bars in {slow_time:.3f}s")
+
+    n = min(args.bars, args.legacy_bars)
+    np.testing.assert_allclose(fast['SuperTrend'].to_numpy()[:n], slow['SuperTrend'].to_numpy(dtype=np.float64)[:n])
+    per_bar_fast = fast_time / args.bars
+    per_bar_slow = slow_time / args.legacy_bars
+    print(f"outputs match, speed-up per bar: {per_bar_slow / per_bar_fast:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
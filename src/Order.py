@@ -9,7 +9,7 @@ from dataclasses import asdict
 
 
 class Order:
-    def __init__(self, symbol, quantity, action, exec_settings, order_type=None, price=None, position_effect=None,
+    def __init__(self, symbol, quantity, action, exec_settings=None, order_type=None, price=None, position_effect=None,
                  status='PENDING', order_id=None, creation_time=None, execution_time=None, cancellation_time=None):
         """
         Initialize a generic order.
@@ -29,8 +29,9 @@ class Order:
         self.price = price
         self.position_effect = position_effect
         self.status = status
-        self.slippage = exec_settings.slippage
-        self.transaction_fee = exec_settings.transaction_fee
+        # Orders created without execution settings trade without fee and slippage
+        self.slippage = exec_settings.slippage if exec_settings is not None else 0.0
+        self.transaction_fee = exec_settings.transaction_fee if exec_settings is not None else 0.0
 
         # Order execution params
         self.order_id = order_id
@@ -284,8 +285,8 @@ class LimitOrder(Order):
         TODO: the specify input parameters
         TODO: more functions
         """
-        super().__init__(symbol, quantity, action, exec_settings)
-        self.type = 'LIMIT'
+        super().__init__(symbol, quantity, action, exec_settings, order_type='LIMIT', price=limit_price)
+        self.limit_price = limit_price
 
 
 class MarketOrder(Order):
@@ -296,8 +297,7 @@ class MarketOrder(Order):
         TODO: the specify input parameters
         TODO: more functions
         """
-        super().__init__(symbol, quantity, action, exec_settings)
-        self.type = 'MARKET'
+        super().__init__(symbol, quantity, action, exec_settings, order_type='MARKET')
 
 
 class StopOrder(Order):
@@ -310,8 +310,8 @@ class StopOrder(Order):
         TODO: the specify input parameters
         TODO: more functions
         """
-        super().__init__(symbol, quantity, action, exec_settings)
-        self.type = 'STOP'
+        super().__init__(symbol, quantity, action, exec_settings, order_type='STOP')
+        self.stop_price = stop_price
 
 
 class TakeProfitOrder(Order):
@@ -324,8 +324,8 @@ class TakeProfitOrder(Order):
         TODO: the specify input parameters
         TODO: more functions
         """
-        super().__init__(symbol, quantity, action, exec_settings)
-        self.type = 'TAKE_PROFIT'
+        super().__init__(symbol, quantity, action, exec_settings, order_type='TAKE_PROFIT', price=take_profit_price)
+        self.take_profit_price = take_profit_price
 
 
 class StopLossOrder(Order):
@@ -338,8 +338,10 @@ class StopLossOrder(Order):
         TODO: the specify input parameters
         TODO: more functions
         """
-        super().__init__(symbol, quantity, action, exec_settings)
-        self.type = 'STOP_LOSS'
+        super().__init__(symbol, quantity, action, exec_settings, order_type='STOP_LOSS')
+        self.stop_loss_price = stop_loss_price
+        # Triggers like a stop order
+        self.stop_price = stop_loss_price
 
 
 class IcebergOrder(LimitOrder):
@@ -352,8 +354,8 @@ class IcebergOrder(LimitOrder):
         TODO: the specify input parameters
         TODO: more functions
         """
-        super().__init__(symbol, quantity, action, exec_settings)
-        self.type = 'ICEBERG'
+        super().__init__(symbol, quantity, action, limit_price, exec_settings)
+        self.order_type = 'ICEBERG'
         self.display_quantity = display_quantity
 
 
@@ -367,8 +369,9 @@ class TrailingStopOrder(StopOrder):
         TODO: the specify input parameters
         TODO: more functions
         """
-        super().__init__(symbol, quantity, action, exec_settings)
-        self.type = 'TRAILING_STOP'
+        # The stop price follows the market and is only known once the first price is seen
+        super().__init__(symbol, quantity, action, None, exec_settings)
+        self.order_type = 'TRAILING_STOP'
         self.stop_percent = stop_percent
 
 
@@ -383,17 +386,17 @@ class OCOOrder(Order):
         TODO: the specify input parameters
         TODO: more functions
         """
-        super().__init__(symbol, quantity, action, exec_settings)
-        self.type = 'OCO'
-        self.limit_order = LimitOrder(symbol, quantity, action, limit_price)
-        self.stop_order = StopOrder(symbol, quantity, action, stop_price)
+        super().__init__(symbol, quantity, action, exec_settings, order_type='OCO')
+        self.limit_order = LimitOrder(symbol, quantity, action, limit_price, exec_settings)
+        self.stop_order = StopOrder(symbol, quantity, action, stop_price, exec_settings)
 
 
 # Example usage
-exec_settings = execution.Execution_settings(transaction_fee=0.00002, slippage=0.01)
-
-with Order('AAPL', 10, 'BUY', exec_settings, 'OPEN', price=150.0) as order_instance:
-    # Some operations within the context
-    order_instance.status = 'EXECUTED'
-    order_instance.execution_time = datetime.now()
-    # Exiting the context will call __exit__, and if the status is still 'PENDING', it will cancel the order
+if __name__ == "__main__":
+    exec_settings = execution.ExecutionSettings(transaction_fee=0.00002, slippage=0.01)
+
+    with Order('AAPL', 10, 'BUY', exec_settings, 'OPEN', price=150.0) as order_instance:
+        # Some operations within the context
+        order_instance.status = 'EXECUTED'
+        order_instance.execution_time = datetime.now()
+        # Exiting the context will call __exit__, and if the status is still 'PENDING', it will cancel the order
@@ -0,0 +1,444 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Asyncio execution service for live order routing.
+
+Orders are placed, modified and cancelled through one shared ccxt async client per exchange, so a slow REST call
+only holds up its own order. The number of requests in flight is capped by a semaphore and every request has its
+own timeout. Order state, the waitlist and the response handling are those of execution.ExecutingSystem.
+
+The clients can be injected (e.g. a mock exchange in tests), or configured per exchange, e.g. with
+{'binance': {'urls': {'api': {...}}}} to point ccxt at a local mock server.
+"""
+import asyncio
+import logging
+import re
+from datetime import datetime
+
+from lib import execution
+
+try:
+    import ccxt.async_support as ccxt_async
+except ImportError:
+    ccxt_async = None
+
+# Errors after which the exchange may have accepted the order anyway: the request timed out on our side, or ccxt
+# reported a network failure (RequestTimeout is a NetworkError). Orders are looked up again instead of failed.
+UNCERTAIN_ERRORS = (asyncio.TimeoutError,) + ((ccxt_async.NetworkError,) if ccxt_async is not None else ())
+
+# Order types of Order.py mapped to ccxt order types
+CCXT_ORDER_TYPES = {
+    'MARKET': 'market', 'LIMIT': 'limit', 'ICEBERG': 'limit', 'TAKE_PROFIT': 'limit',
+    'STOP': 'market', 'STOP_LOSS': 'market', 'TRAILING_STOP': 'market',
+}
+# Status of ccxt orders mapped to the statuses used by the ExecutingSystem
+CCXT_STATUSES = {'closed': 'SUCCESS', 'canceled': 'CANCELLED', 'expired': 'CANCELLED', 'rejected': 'FAILED'}
+
+
+def client_order_id(order):
+    """
+    :param order: Order object.
+    :return: Client order id sent with the order: its order id reduced to letters and digits, at most 32 of them
+             (the strictest exchange limit), so the order can be found again when a request times out. None for
+             orders without an id.
+    """
+    order_id = order.get_order_id()
+    return None if order_id is None else re.sub(r'[^0-9A-Za-z]', '', str(order_id))[-32:]
+
+
+def order_request(order, order_args=None, with_client_id=True):
+    """
+    Build the ccxt create_order / edit_order arguments of an order.
+
+    :param order: Order object.
+    :param order_args: Optional parameters overriding the order's, e.g. for a modification.
+    :param with_client_id: Send the order's client_order_id as params['clientOrderId'].
+    :return: Dictionary with symbol, type, side, amount, price and params.
+    """
+    args = {**order.get_order_args(), **(order_args or {})}
+    order_type = args['order_type'] or ('LIMIT' if args['price'] is not None else 'MARKET')
+    params = {}
+    if order_type in ('STOP', 'STOP_LOSS'):
+        params['triggerPrice'] = getattr(order, 'stop_price', None)
+    elif order_type == 'TAKE_PROFIT':
+        params['takeProfitPrice'] = getattr(order, 'take_profit_price', None)
+    elif order_type == 'TRAILING_STOP':
+        params['trailingPercent'] = order.stop_percent * 100
+    if args.get('position_effect') == 'CLOSE':
+        params['reduceOnly'] = True
+    if with_client_id and client_order_id(order) is not None:
+        params['clientOrderId'] = client_order_id(order)
+    return {
+        'symbol': args['symbol'],
+        'type': CCXT_ORDER_TYPES.get(order_type, 'limit'),
+        'side': args['action'].lower(),
+        'amount': args['quantity'],
+        'price': args['price'] if CCXT_ORDER_TYPES.get(order_type) == 'limit' else None,
+        'params': params,
+    }
+
+
+class AsyncExecutingSystem:
+    def __init__(self, executing_system=None, exchange='binance', clients=None, exchange_config=None,
+                 max_in_flight=10, timeout=10.0, batch_size=5):
+        """
+        :param executing_system: execution.ExecutingSystem keeping the waitlist, a new one if None.
+        :param exchange: Default exchange id for orders without one, e.g. 'binance' or 'okx'.
+        :param clients: Optional {exchange id: async client} to use instead of creating ccxt clients.
+        :param exchange_config: Optional {exchange id: ccxt config} used when creating clients (keys, urls, ...).
+        :param max_in_flight: Largest number of requests waiting on the exchanges at the same time.
+        :param timeout: Seconds before a request is abandoned.
+        :param batch_size: Largest number of orders per batch request (e.g. 5 on Binance futures, 20 on OKX).
+        """
+        self.executing_system = executing_system or execution.ExecutingSystem()
+        self.exchange = exchange
+        self.clients = dict(clients or {})
+        self.exchange_config = exchange_config or {}
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self._owned_clients = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def client(self, exchange=None):
+        """
+        :return: The shared async client of an exchange, created on first use.
+        """
+        exchange = exchange or self.exchange
+        if exchange not in self.clients:
+            if ccxt_async is None:
+                raise ImportError("ccxt with async support is required to create exchange clients")
+            # ccxt's own timeout (milliseconds) is longer than the service's, so a slow request ends in one place
+            config = {'enableRateLimit': True, 'timeout': int(self.timeout * 1000) + 1000,
+                      **self.exchange_config.get(exchange, {})}
+            self.clients[exchange] = getattr(ccxt_async, exchange)(config)
+            self._owned_clients.add(exchange)
+        return self.clients[exchange]
+
+    async def close(self):
+        """
+        Close the clients created by this service, injected clients are left to their owner.
+        """
+        for exchange in list(self._owned_clients):
+            await self.clients.pop(exchange).close()
+        self._owned_clients.clear()
+
+    async def request(self, exchange, method, *args, **kwargs):
+        """
+        Call a client method within the in-flight limit and the timeout.
+
+        :raise asyncio.TimeoutError: If the exchange did not answer in time.
+        """
+        async with self.in_flight:
+            return await asyncio.wait_for(getattr(self.client(exchange), method)(*args, **kwargs), self.timeout)
+
+    @staticmethod
+    def _exchange_of(order, exchange):
+        return exchange or getattr(order, 'exchange', None)
+
+    async def place_order(self, order, exchange=None):
+        """
+        Place an order on the exchange and record it in the ExecutingSystem.
+
+        :param order: Order object.
+        :param exchange: Exchange id, defaults to the order's exchange attribute or the service default.
+        :return: Execution response with the status, filled quantity and exchange order id.
+        """
+        order_id = order.get_order_id()
+        exchange = self._exchange_of(order, exchange) or self.exchange
+        try:
+            result = await self.request(exchange, 'create_order', **order_request(order))
+            return self._record_execution(order, exchange, result)
+        except UNCERTAIN_ERRORS:
+            # The exchange may have accepted the order before the request was abandoned
+            return await self.reconcile_order(order, exchange)
+        except Exception as e:
+            execution.handle_execution_error(order_id, e)
+            return {'status': 'FAILED', 'order_id': order_id, 'time': datetime.now(), 'message': str(e),
+                    'executed_quantity': 0}
+
+    async def reconcile_order(self, order, exchange=None):
+        """
+        Look an order up on the exchange by its client order id and record what the exchange knows of it, e.g.
+        after a placement timed out or failed with a network error. Placing it again instead could create a duplicate.
+
+        :param order: Order object.
+        :param exchange: Exchange id, defaults to the order's exchange attribute or the service default.
+        :return: Execution response, with status 'UNKNOWN' if the order could not be looked up.
+        """
+        exchange = self._exchange_of(order, exchange) or self.exchange
+        try:
+            if client_order_id(order) is None:
+                raise ValueError("the order has no order id to look it up by")
+            result = await self.request(exchange, 'fetch_order', None, order.get_symbol(),
+                                        {'clientOrderId': client_order_id(order)})
+            return self._record_execution(order, exchange, result)
+        except Exception as e:
+            order.exchange = exchange
+            logging.warning(f"Order {order.get_order_id()} state on {exchange} is unknown: {str(e) or repr(e)}")
+            return {'status': 'UNKNOWN', 'order_id': order.get_order_id(), 'time': datetime.now(),
+                    'message': f"Request timed out and the order could not be looked up: {str(e) or repr(e)}",
+                    'executed_quantity': 0}
+
+    def _reject(self, order, exchange, result):
+        """
+        Record an order the exchange rejected in a batch: it fails and leaves the waitlist.
+        """
+        error = Exception(f"{exchange} rejected the order: {result.get('info') or result}")
+        execution.handle_execution_error(order.get_order_id(), error)
+        order.exchange = exchange
+        with self.executing_system.lock:
+            order.set_status('FAILED')
+            self.executing_system.order_waitlist.discard(order)
+        return {'status': 'FAILED', 'order_id': order.get_order_id(), 'time': datetime.now(), 'message': str(error),
+                'executed_quantity': 0}
+
+    def _record_execution(self, order, exchange, result):
+        """
+        Apply a ccxt order structure to the order and the waitlist, then process the response.
+        """
+        filled = result.get('filled') or 0.0
+        remaining = result.get('remaining')
+        if remaining is None:
+            remaining = order.get_quantity() - filled
+        status = CCXT_STATUSES.get(result.get('status'), 'PARTIAL' if filled else 'PENDING')
+        execution_time = datetime.now()
+        order.exchange = exchange
+        order.exchange_order_id = result.get('id')
+
+        system = self.executing_system
+        with system.lock:
+            order.execute(status, execution_time, remaining)
+            if status in ('PENDING', 'PARTIAL'):
+                system.order_waitlist.add(order)
+            else:
+                system.order_waitlist.discard(order)
+
+        response = {
+            'status': status,
+            'order_id': order.get_order_id(),
+            'exchange_order_id': order.exchange_order_id,
+            'time': execution_time,
+            'message': f"{exchange} order {result.get('status') or 'accepted'}",
+            'executed_quantity': filled,
+            'price': result.get('average') or result.get('price'),
+        }
+        if status in ('PENDING', 'PARTIAL'):
+            logging.info(f"Order {response['order_id']} resting on {exchange} ({status}).")
+        else:
+            execution.process_execution_response(response)
+        return response
+
+    async def modify_order(self, order, order_args, exchange=None):
+        """
+        Modify an order resting on the exchange.
+
+        :param order: Order object placed by place_order.
+        :param order_args: Dictionary of the modified order parameters (quantity, price, ...).
+        :return: Modification response.
+        """
+        order_id = order.get_order_id()
+        exchange = self._exchange_of(order, exchange) or self.exchange
+        try:
+            request = order_request(order, order_args, with_client_id=False)
+            result = await self.request(exchange, 'edit_order', order.exchange_order_id, request['symbol'],
+                                        request['type'], request['side'], request['amount'], request['price'],
+                                        request['params'])
+            modify_response = {'status': 'SUCCESS', 'order_id': order_id, 'time': datetime.now(),
+                               'message': 'Order modified successfully'}
+            with self.executing_system.lock:
+                order.set_order_args(order_args)
+                order.exchange_order_id = result.get('id') or order.exchange_order_id
+                if order in self.executing_system.order_waitlist:
+                    self.executing_system.order_waitlist.refresh(order)
+            execution.process_modification_response(modify_response)
+            return modify_response
+        except Exception as e:
+            execution.handle_modification_error(order_id, e)
+            return {'status': 'FAILED', 'order_id': order_id, 'time': datetime.now(), 'message': str(e)}
+
+    async def cancel_order(self, order, exchange=None):
+        """
+        Cancel an order resting on the exchange.
+
+        :param order: Order object placed by place_order.
+        :return: Cancellation response.
+        """
+        order_id = order.get_order_id()
+        exchange = self._exchange_of(order, exchange) or self.exchange
+        try:
+            await self.request(exchange, 'cancel_order', order.exchange_order_id, order.get_symbol())
+            cancellation_time = datetime.now()
+            with self.executing_system.lock:
+                # Order.cancel only handles untouched orders, a partially filled order is cancelled as well
+                order.set_status('CANCELLED')
+                order.set_cancellation_time(cancellation_time)
+                self.executing_system.order_waitlist.discard(order)
+            cancel_response = {'status': 'SUCCESS', 'order_id': order_id, 'time': cancellation_time,
+                               'message': 'Order canceled successfully'}
+            execution.process_cancellation_response(cancel_response)
+            return cancel_response
+        except Exception as e:
+            execution.handle_cancellation_error(order_id, e)
+            return {'status': 'FAILED', 'order_id': order_id, 'time': datetime.now(), 'message': str(e)}
+
+    def _record_cancellation(self, order, exchange, result, cancellation_time):
+        """
+        Apply the entry of one order in a batch cancellation. Only orders the exchange reports as canceled (or
+        returns without a status) are cancelled, e.g. an order that filled in the meantime keeps its fill.
+
+        :param result: ccxt order structure of the order, None if the exchange returned none.
+        :return: Cancellation response.
+        """
+        order_id = order.get_order_id()
+        status = None if result is None else result.get('status')
+        if result is None or (status is not None and CCXT_STATUSES.get(status) != 'CANCELLED'):
+            message = f"{exchange} did not cancel the order" + (f", it is {status}" if status else "")
+            if result is not None:
+                # Keep the state the exchange reports, e.g. filled or still open
+                self._record_execution(order, exchange, result)
+            execution.handle_cancellation_error(order_id, Exception(message))
+            return {'status': 'FAILED', 'order_id': order_id, 'time': datetime.now(), 'message': message}
+
+        with self.executing_system.lock:
+            order.set_status('CANCELLED')
+            order.set_cancellation_time(cancellation_time)
+            self.executing_system.order_waitlist.discard(order)
+        cancel_response = {'status': 'SUCCESS', 'order_id': order_id, 'time': cancellation_time,
+                           'message': 'Order canceled successfully'}
+        execution.process_cancellation_response(cancel_response)
+        return cancel_response
+
+    def _supports(self, exchange, feature):
+        return bool(getattr(self.client(exchange), 'has', {}).get(feature))
+
+    def _chunks(self, orders):
+        return [orders[start:start + self.batch_size] for start in range(0, len(orders), self.batch_size)]
+
+    async def submit_batch(self, orders):
+        """
+        Place a batch of orders, grouped by exchange and symbol. Groups run concurrently, and exchanges with a
+        batch endpoint (ccxt createOrders) receive batch_size orders per request instead of one request each.
+
+        :param orders: Order objects.
+        :return: Consolidated response (see execution.consolidate_responses) with the response of every order.
+        """
+        groups = execution.group_orders(orders, self.exchange)
+        results = await asyncio.gather(*(self._submit_group(exchange, group)
+                                         for (exchange, _), group in groups.items()))
+        return execution.consolidate_responses([response for group in results for response in group], groups)
+
+    async def _submit_group(self, exchange, orders):
+        if not self._supports(exchange, 'createOrders'):
+            return await asyncio.gather(*(self.place_order(order, exchange) for order in orders))
+
+        async def submit_chunk(chunk):
+            try:
+                results = await self.request(exchange, 'create_orders', [order_request(order) for order in chunk])
+            except UNCERTAIN_ERRORS:
+                return await asyncio.gather(*(self.reconcile_order(order, exchange) for order in chunk))
+            except Exception as e:
+                for order in chunk:
+                    execution.handle_execution_error(order.get_order_id(), e)
+                return [{'status': 'FAILED', 'order_id': order.get_order_id(), 'time': datetime.now(),
+                         'message': str(e), 'executed_quantity': 0} for order in chunk]
+
+            # Every entry is checked on its own: the exchange may reject some orders of an accepted batch
+            results = list(results or [])
+            responses = []
+            for position, order in enumerate(chunk):
+                result = results[position] if position < len(results) else None
+                if result is None:
+                    # No answer for this order, it may still have been placed
+                    responses.append(await self.reconcile_order(order, exchange))
+                elif result.get('status') == 'rejected' or result.get('id') is None:
+                    responses.append(self._reject(order, exchange, result))
+                else:
+                    responses.append(self._record_execution(order, exchange, result))
+            return responses
+
+        chunks = await asyncio.gather(*(submit_chunk(chunk) for chunk in self._chunks(orders)))
+        return [response for chunk in chunks for response in chunk]
+
+    async def cancel_batch(self, orders):
+        """
+        Cancel a batch of orders, grouped by exchange and symbol. Exchanges with a batch endpoint (ccxt
+        cancelOrders) receive batch_size cancellations per request.
+
+        :param orders: Order objects placed by place_order or submit_batch.
+        :return: Consolidated response (see execution.consolidate_responses) with the response of every order.
+        """
+        groups = execution.group_orders(orders, self.exchange)
+        results = await asyncio.gather(*(self._cancel_group(exchange, symbol, group)
+                                         for (exchange, symbol), group in groups.items()))
+        return execution.consolidate_responses([response for group in results for response in group], groups)
+
+    async def _cancel_group(self, exchange, symbol, orders):
+        if not self._supports(exchange, 'cancelOrders'):
+            return await asyncio.gather(*(self.cancel_order(order, exchange) for order in orders))
+
+        async def cancel_chunk(chunk):
+            try:
+                results = await self.request(exchange, 'cancel_orders', [order.exchange_order_id for order in chunk],
+                                             symbol)
+            except Exception as e:
+                for order in chunk:
+                    execution.handle_cancellation_error(order.get_order_id(), e)
+                return [{'status': 'FAILED', 'order_id': order.get_order_id(), 'time': datetime.now(),
+                         'message': str(e)} for order in chunk]
+
+            results = [result for result in results or [] if result]
+            by_id = {result['id']: result for result in results if result.get('id') is not None}
+            cancellation_time = datetime.now()
+            responses = []
+            for position, order in enumerate(chunk):
+                result = by_id.get(order.exchange_order_id)
+                if result is None and position < len(results) and results[position].get('id') is None:
+                    result = results[position]
+                responses.append(self._record_cancellation(order, exchange, result, cancellation_time))
+            cancelled = sum(response['status'] == 'SUCCESS' for response in responses)
+            logging.info(f"{cancelled} of {len(chunk)} orders canceled on {exchange} {symbol}.")
+            return responses
+
+        chunks = await asyncio.gather(*(cancel_chunk(chunk) for chunk in self._chunks(orders)))
+        return [response for chunk in chunks for response in chunk]
+
+
+# Test
+if __name__ == "__main__":
+    import itertools
+
+    import Order
+
+    class MockExchange:
+        """
+        In-process stand-in for a ccxt async client, answering after a delay.
+        """
+        ids = itertools.count()
+
+        async def create_order(self, symbol, type, side, amount, price=None, params=None):
+            await asyncio.sleep(0.1)
+            return {'id': str(next(self.ids)), 'status': 'closed' if type == 'market' else 'open',
+                    'filled': amount if type == 'market' else 0.0, 'average': price or 100.0}
+
+        async def cancel_order(self, exchange_order_id, symbol):
+            await asyncio.sleep(0.1)
+            return {'id': exchange_order_id, 'status': 'canceled'}
+
+    async def main():
+        async with AsyncExecutingSystem(clients={'binance': MockExchange()}, max_in_flight=20) as service:
+            orders = [Order.MarketOrder('BTC/USDT', 1, 'BUY') if i % 2 else Order.LimitOrder('BTC/USDT', 1, 'SELL', 99)
+                      for i in range(20)]
+            for i, test_order in enumerate(orders):
+                test_order.set_order_id(str(i))
+            start = asyncio.get_running_loop().time()
+            responses = await asyncio.gather(*(service.place_order(test_order) for test_order in orders))
+            print(f"{len(responses)} orders in {asyncio.get_running_loop().time() - start:.2f}s,",
+                  f"{len(service.executing_system.order_waitlist)} resting")
+
+    asyncio.run(main())
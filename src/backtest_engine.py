@@ -1,13 +1,12 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
-import itertools
 import logging
 import os
 
 import matplotlib.pyplot as plt
 import pandas as pd
 
-from lib import data_resource, stragety, execution, performance, portfolio
+from lib import data_resource, stragety, execution, performance, portfolio, factor_cache, optimizer, vector_backtest
 
 
 def plot_backtest_results(equity_curve, trade_signals, benchmark_returns, asset_prices):
@@ -93,13 +92,22 @@ class BacktestEngine:
         self.data_path, self.start_date, self.end_date = None, None, None
         self.parameters = None
         self.initial_data = None
+        self.optimization_results = None
         self.initial_cash_list, self.asset_name_list, self.initial_position_list = None, None, None
         self.asset_list, self.assets_data_list, self.underlying_asset_list = None, None, None
         self.transaction_fee_list, self.slippage_list = None, None
         self.order_waitlist, self.system_status = None, None
+        self.factor_cache_dir = None
+        # Produce an intermediate metrics report every metrics_checkpoint bars, None only reports at the end
+        self.metrics_checkpoint = None
+        # Stream the historical data in blocks of chunk_size bars instead of loading it at once
+        self.chunk_size = None
+        self.periods_per_year = 365
 
         # Set parameters using the provided keyword arguments
         self.set_parameters(kwargs)
+        # Keep the construction arguments so isolated copies of the engine can be built for optimization
+        self.engine_kwargs = dict(kwargs)
 
     def __enter__(self):
         """
@@ -117,16 +125,20 @@ class BacktestEngine:
                                                  self.initial_position_list, self.asset_list, self.assets_data_list,
                                                  self.transaction_fee_list, self.slippage_list)
             self.exec_sys = execution.ExecutingSystem(self.order_waitlist, self.system_status)
+            # Factor cache is kept across runs so repeated backtests reuse computed indicators
+            self.factor_cache = factor_cache.FactorCache(self.factor_cache_dir)
+            self.accumulator = performance.PerformanceAccumulator(periods_per_year=self.periods_per_year)
         except Exception as e:
             logging.error(f"Error initializing Backtest Engine: {str(e)}")
             raise e
+        return self
 
     def __exit__(self, exc_type, exc_value, traceback):
         """
         Exit method for context management.
         """
-        # Optional cleanup actions can be added here
-        pass
+        # Write the factors extended during the run to the disk cache
+        self.factor_cache.flush()
 
     def set_parameters(self, paras):
         """
@@ -145,22 +157,31 @@ class BacktestEngine:
     def run_backtest(self, display_result=None, reset=True):
         """
         Run the backtest using historical market data.
+
+        :return: Performance metrics of the finished backtest, None if the backtest failed.
         """
+        metrics = None
         try:
-            historical_data = self.data_source.get_historical_data()
+            historical_data = self.data_source.iter_bars(self.chunk_size)
+            self.accumulator.reset()
 
-            for bar in historical_data:
+            for i, bar in enumerate(historical_data, start=1):
                 signals = self.strategy.generate_signals(bar)
                 trade_history = self.portfolio.handle_signals(signals, bar)
                 self.strategy.execute_trades(self.portfolio, trade_history)
-                metrics = self.get_performance_metrics()
+                # O(1) per bar, the full report is only built at checkpoints and at the end
+                self.accumulator.record_fills(self.match_resting_orders(bar))
+                self.accumulator.update(self.mark_equity(bar))
+                if self.metrics_checkpoint and i % self.metrics_checkpoint == 0:
+                    logging.info(f"Metrics after {i} bars: {self.get_performance_metrics()}")
 
-            self.performance.generate_report()
+            metrics = self.get_performance_metrics()
             if display_result:
                 self.disp_result()
 
             if reset:
                 self.reset()
+            self.factor_cache.log_stats()
             logging.info("Backtest completed.")
 
         except Exception as e:
@@ -171,31 +192,102 @@ class BacktestEngine:
                          f"Title: Backtest Error"
                          f"Message: Exception during backtest: {str(e)}")
 
-    def optimize_parameters(self, parameter_ranges):
+        return metrics
+
+    def match_resting_orders(self, bar):
         """
-        Perform parameter optimization for the backtest.
+        Match the orders resting in the executing system against a bar.
 
-        :param parameter_ranges: Dictionary specifying parameter ranges for optimization.
+        :param bar: Dictionary with open, high, low, close, volume and optionally symbol and time columns. Bars
+                    without a symbol are matched against the orders of the only traded symbol.
+        :return: List of fill responses (see execution.ExecutingSystem.match_bars), fed to the accumulator.
         """
-        best_params = None
-        best_metric = float('-inf')
+        if not len(self.exec_sys.order_waitlist):
+            return []
+        symbol = bar.get('symbol')
+        if symbol is None:
+            symbols = self.exec_sys.order_waitlist.symbols()
+            if len(symbols) != 1:
+                return []
+            symbol = symbols[0]
+        time = next((bar[key] for key in ('timestamp', 'date', 'time') if key in bar), None)
+        return self.exec_sys.match_bars({symbol: bar}, time)
+
+    def mark_equity(self, bar):
+        """
+        Equity at the close of a bar: the portfolio's cash and initial positions, adjusted by the cash flow of the
+        fills and the positions they opened, all valued at the last close of their symbol.
 
-        param_combinations = list(
-            itertools.product(*[range(*param_range) for param_range in parameter_ranges.values()]))
+        :param bar: Dictionary with a close price and optionally a symbol. Bars without a symbol belong to the only
+                    asset of the portfolio, or to the only symbol with an open position.
+        :return: Marked-to-market equity, fed to the accumulator.
+        """
+        symbol = bar.get('symbol')
+        if symbol is None:
+            symbols = {asset.asset_name for asset in self.portfolio.asset_list} or set(self.accumulator.positions)
+            symbol = next(iter(symbols)) if len(symbols) == 1 else None
+        if symbol is not None and bar.get('close') is not None:
+            self.accumulator.mark(symbol, float(bar['close']))
+        return self.accumulator.marked_equity(self.portfolio.get_equity(self.accumulator.marks))
+
+    def run_vectorized(self, target_positions, price_column='close', periods_per_year=365, risk_free_rate=0.0):
+        """
+        Run the backtest with array operations instead of the per-bar event loop.
 
-        for params in param_combinations:
+        Only for strategies that can express their signals as a (time × asset) target weight matrix. Fees and
+        slippage come from transaction_fee_list and slippage_list, one value per asset or a single value.
+
+        :param target_positions: Callable mapping the (time × asset) price DataFrame to target weights, an array or
+                                 a DataFrame with the same index and asset columns.
+        :param price_column: Name of the price column used for fills.
+        :param periods_per_year: Number of bars per year, e.g. 365 for daily crypto data.
+        :param risk_free_rate: Risk-free rate per bar.
+        :return: Dictionary with the equity curve, returns, turnover, costs and metrics, None if the backtest failed.
+        """
+        try:
             self.data_source.set_date_range(self.start_date, self.end_date)
+            prices = vector_backtest.price_matrix(self.data_source.get_historical_data(), price_column)
+            initial_cash = sum(self.initial_cash_list) if self.initial_cash_list else 1.0
 
-            self.run_backtest()
+            result = vector_backtest.run_vectorized(prices, target_positions(prices), self.transaction_fee_list,
+                                                    self.slippage_list, initial_cash, periods_per_year,
+                                                    risk_free_rate)
+            logging.info(f"Vectorized backtest completed: {result['metrics']}")
+            return result
 
-            metric = self.get_performance_metrics()['your_metric_name']
+        except Exception as e:
+            logging.error(f"Error during vectorized backtest: {str(e)}")
+            return None
 
-            if metric > best_metric:
-                best_metric = metric
-                best_params = params
+    def optimize_parameters(self, parameter_ranges, metric='sharpe_ratio', maximize=True, n_jobs=None, patience=None,
+                            target=None, search='grid', search_options=None):
+        """
+        Perform parameter optimization for the backtest.
 
-        logging.info(f"Best parameters: {best_params}")
-        logging.info(f"Best metric: {best_metric}")
+        Every combination runs in an isolated engine on a process pool. The market data is loaded once and
+        shared with the workers through shared memory, or mapped by every worker from a columnar store.
+
+        :param parameter_ranges: Dictionary specifying parameter ranges for optimization.
+        :param metric: Name of the performance metric to optimize.
+        :param maximize: Whether a larger metric is better.
+        :param n_jobs: Number of worker processes, None uses the CPU count.
+        :param patience: Stop after this many finished runs without improvement.
+        :param target: Stop as soon as the best metric reaches this value.
+        :param search: Search strategy, a name in optimizer.SEARCH_STRATEGIES ('grid', 'random', 'lhs', 'halving',
+                       'surrogate') or an optimizer.SearchStrategy instance.
+        :param search_options: Constructor arguments of the search strategy, e.g. {'n_iter': 100, 'seed': 0}.
+        :return: Tuple of best metric and best parameters. The full results table is kept in
+                 self.optimization_results.
+        """
+        self.data_source.set_date_range(self.start_date, self.end_date)
+        # Workers map a columnar store themselves and share its pages, other sources are loaded once here
+        data = None if self.data_source.is_columnar() else self.data_source.get_historical_data()
+
+        parallel = optimizer.ParallelOptimizer(self.engine_kwargs, data=data, metric=metric, maximize=maximize,
+                                               n_jobs=n_jobs, patience=patience, target=target,
+                                               date_range=(self.start_date, self.end_date))
+        strategy = optimizer.make_search(search, **(search_options or {}))
+        best_metric, best_params, self.optimization_results = parallel.run(parameter_ranges, strategy)
 
         return best_metric, best_params
 
@@ -246,7 +338,7 @@ class BacktestEngine:
         Reset the backtest engine to its initial state.
         """
         self.portfolio.reset()
-        self.performance.reset()
+        self.accumulator.reset()
         logging.info("Backtest engine reset.")
 
     def get_performance_metrics(self):
@@ -255,10 +347,23 @@ class BacktestEngine:
 
         :return: Dictionary containing various performance metrics.
         """
-        metrics = self.performance.update_performance()
+        metrics = self.accumulator.report()
         logging.info("Performance metrics retrieved.")
         return metrics
 
+    def get_factor(self, data, name, params=None, symbol=None, timeframe=None):
+        """
+        Compute a factors_lib indicator through the engine's factor cache.
+
+        :param data: Pandas DataFrame containing price data.
+        :param name: Name of the factors_lib function, e.g. 'BB' or 'atr'.
+        :param params: Dictionary of indicator parameters.
+        :param symbol: Trading symbol of the data.
+        :param timeframe: Bar interval of the data.
+        :return: Indicator values as returned by factors_lib, backed by the cache's read-only buffer.
+        """
+        return self.factor_cache.get(data, name, params, symbol=symbol, timeframe=timeframe)
+
     def add_indicator(self, indicator):
         """
         Add a custom performance indicator to the backtest.
@@ -0,0 +1,405 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Partitioned on-disk store for fetched candles.
+
+Candles are stored as one feather file per exchange, timeframe, symbol and month, with one manifest per
+exchange and timeframe:
+    <root>/<exchange>/<timeframe>/manifest.json
+    <root>/<exchange>/<timeframe>/<symbol>/<YYYY-MM>.feather
+
+The manifest records the row count, first and last timestamp and SHA-256 checksum of every partition, so
+readers prune partitions by symbol and time and find the high-water marks without opening any data file.
+
+New candles only touch the partitions of the months they fall in, so an update costs I/O for the new bars
+and at most one existing partition (the month of the previous high-water mark), never the whole history.
+The manifest is written once per batch of symbols (append_many), not once per symbol.
+Partitions and the manifest are written to a temporary file and swapped in, readers never see a half-written
+file.
+"""
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from lib import data_store
+
+MANIFEST_FILE = 'manifest.json'
+# Root of the lake when none is given, can be set with the MARKET_DATA_ROOT environment variable
+DEFAULT_ROOT = os.environ.get('MARKET_DATA_ROOT', os.path.join(os.path.expanduser('~'), 'market_data'))
+
+
+def _replace_file(path, write):
+    """
+    Write a file through a temporary file in the same directory and swap it in atomically.
+
+    :param path: Final path.
+    :param write: Function writing the content to the path it is given.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.tmp{os.getpid()}-{threading.get_ident()}'
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def timestamp_gaps(timestamps, step):
+    """
+    Find the missing candles of a sorted timestamp series with one vectorized diff.
+
+    :param timestamps: Sorted timestamps (array, Series or DatetimeIndex).
+    :param step: Candle interval, pd.Timedelta.
+    :return: List of (first missing candle, last missing candle) pd.Timestamp pairs.
+    """
+    values = np.asarray(timestamps, dtype='datetime64[ns]').view(np.int64)
+    step = pd.Timedelta(step).value
+    holes = np.flatnonzero(np.diff(values) > step)
+    return [(pd.Timestamp(values[i] + step), pd.Timestamp(values[i + 1] - step)) for i in holes]
+
+
+class MarketDataLake:
+    def __init__(self, root=None, exchange='okx'):
+        """
+        :param root: Root directory of the lake, None uses DEFAULT_ROOT.
+        :param exchange: Exchange name, first level of the layout.
+        """
+        self.root = root or DEFAULT_ROOT
+        self.exchange = exchange
+        self.lock = threading.Lock()
+        self._manifests = {}
+
+    def timeframe_dir(self, timeframe):
+        return os.path.join(self.root, self.exchange, timeframe)
+
+    def symbol_dir(self, timeframe, symbol):
+        return os.path.join(self.timeframe_dir(timeframe), data_store.safe_name(symbol))
+
+    def partition_path(self, timeframe, symbol, month):
+        """
+        :param month: 'YYYY-MM'
+        :return: Path of the partition file.
+        """
+        return os.path.join(self.symbol_dir(timeframe, symbol), f'{month}.feather')
+
+    def manifest(self, timeframe):
+        """
+        Load the manifest of a timeframe, cached until the file changes.
+
+        :return: {symbol: {month: {'rows', 'min', 'max', 'sha256'}}}
+        """
+        path = os.path.join(self.timeframe_dir(timeframe), MANIFEST_FILE)
+        if not os.path.exists(path):
+            if os.path.isdir(self.timeframe_dir(timeframe)) and os.listdir(self.timeframe_dir(timeframe)):
+                # Partitions written before manifests existed
+                return self.rebuild_manifest(timeframe)
+            return {}
+        mtime = os.path.getmtime(path)
+        cached = self._manifests.get(timeframe)
+        if cached is None or cached[0] != mtime:
+            with open(path) as file:
+                cached = (mtime, json.load(file)['partitions'])
+            self._manifests[timeframe] = cached
+        return cached[1]
+
+    def write_manifest(self, timeframe, partitions):
+        """
+        Atomically replace the manifest of a timeframe.
+
+        :param partitions: {symbol: {month: entry}}
+        """
+        path = os.path.join(self.timeframe_dir(timeframe), MANIFEST_FILE)
+
+        def write(temp_path):
+            with open(temp_path, 'w') as file:
+                json.dump({'exchange': self.exchange, 'timeframe': timeframe, 'partitions': partitions}, file,
+                          indent=1, sort_keys=True)
+
+        _replace_file(path, write)
+        self._manifests[timeframe] = (os.path.getmtime(path), partitions)
+
+    def rebuild_manifest(self, timeframe):
+        """
+        Scan every partition of a timeframe and write a fresh manifest.
+
+        :return: The new manifest partitions.
+        """
+        partitions = {}
+        directory = self.timeframe_dir(timeframe)
+        for name in sorted(os.listdir(directory)):
+            symbol_dir = os.path.join(directory, name)
+            if not os.path.isdir(symbol_dir):
+                continue
+            for file_name in sorted(os.listdir(symbol_dir)):
+                if not file_name.endswith('.feather'):
+                    continue
+                path = os.path.join(symbol_dir, file_name)
+                try:
+                    data = pd.read_feather(path)
+                except Exception as e:
+                    logging.warning(f"Skipping unreadable partition {path}: {str(e)}")
+                    continue
+                # Older partitions have no symbol column, fall back to the directory name
+                symbol = data['symbol'].iloc[0] if 'symbol' in data.columns and len(data) else name
+                partitions.setdefault(symbol, {})[file_name[:-len('.feather')]] = self._describe(path, data)
+        self.write_manifest(timeframe, partitions)
+        logging.info(f"Rebuilt manifest of {directory}")
+        return partitions
+
+    @staticmethod
+    def _describe(path, data):
+        """
+        :return: Manifest entry of a partition file holding data.
+        """
+        return {
+            'rows': len(data),
+            'min': data['timestamp'].iloc[0].isoformat() if len(data) else None,
+            'max': data['timestamp'].iloc[-1].isoformat() if len(data) else None,
+            'sha256': data_store.file_digest(path),
+        }
+
+    def symbols(self, timeframe):
+        """
+        :return: Sorted list of the symbols stored for a timeframe.
+        """
+        return sorted(self.manifest(timeframe))
+
+    def months(self, timeframe, symbol):
+        """
+        :return: Sorted list of the months stored for a symbol.
+        """
+        return sorted(self.manifest(timeframe).get(symbol, {}))
+
+    def partitions(self, timeframe, symbols=None, start=None, end=None):
+        """
+        Select the partitions holding candles of the given symbols inside [start, end], from the manifest only.
+
+        :param timeframe: Bar interval, e.g. '12h'.
+        :param symbols: Optional list of symbols, None selects every symbol.
+        :param start: First timestamp included.
+        :param end: Last timestamp included.
+        :return: List of (symbol, month, manifest entry), sorted by symbol and month.
+        """
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        manifest = self.manifest(timeframe)
+        selected = []
+        for symbol in sorted(manifest if symbols is None else set(symbols) & set(manifest)):
+            for month, entry in sorted(manifest[symbol].items()):
+                if not entry['rows']:
+                    continue
+                if start is not None and pd.Timestamp(entry['max']) < start:
+                    continue
+                if end is not None and pd.Timestamp(entry['min']) > end:
+                    continue
+                selected.append((symbol, month, entry))
+        return selected
+
+    def high_water_mark(self, timeframe, symbol):
+        """
+        Latest stored candle of a symbol, from the manifest.
+
+        :return: pd.Timestamp, None if nothing is stored.
+        """
+        entries = [entry for entry in self.manifest(timeframe).get(symbol, {}).values() if entry['rows']]
+        return max(pd.Timestamp(entry['max']) for entry in entries) if entries else None
+
+    def gaps(self, timeframe, symbol, step=None):
+        """
+        Find the missing candles of a symbol between its first and last stored candle.
+
+        Gaps between partitions come from the manifest alone. A partition is only opened (its timestamp column)
+        when the manifest shows fewer rows than its first and last candle imply, so complete months are never
+        read.
+
+        :param timeframe: Bar interval, e.g. '12h'.
+        :param symbol: Trading symbol.
+        :param step: Candle interval, pd.Timedelta, None parses the timeframe.
+        :return: List of (first missing candle, last missing candle) pd.Timestamp pairs, in time order.
+        """
+        step = pd.Timedelta(step if step is not None else timeframe)
+        found = []
+        previous_last = None
+        for _, month, entry in self.partitions(timeframe, [symbol]):
+            first, last = pd.Timestamp(entry['min']), pd.Timestamp(entry['max'])
+            if previous_last is not None and first - previous_last > step:
+                found.append((previous_last + step, first - step))
+            if entry['rows'] < (last - first) // step + 1:
+                timestamps = pd.read_feather(self.partition_path(timeframe, symbol, month), columns=['timestamp'])
+                found.extend(timestamp_gaps(timestamps['timestamp'], step))
+            previous_last = last
+        return found
+
+    def append(self, timeframe, symbol, data):
+        """
+        Append candles to the partitions of their months and update the manifest.
+
+        Only a partition that already exists (normally the month of the high-water mark) is read back, and it
+        is only deduplicated when the new candles overlap it.
+
+        :param timeframe: Bar interval, e.g. '12h'.
+        :param symbol: Trading symbol, e.g. 'BTC/USDT:USDT'.
+        :param data: DataFrame with a timestamp column and the OHLCV columns.
+        :return: Number of candles added.
+        """
+        return self.append_many(timeframe, {symbol: data})
+
+    def append_many(self, timeframe, frames):
+        """
+        Append the candles of several symbols and write the manifest once for the whole batch, so an update of
+        every symbol does not rewrite the manifest once per symbol.
+
+        :param timeframe: Bar interval, e.g. '12h'.
+        :param frames: Dictionary mapping symbols to DataFrames with a timestamp column and the OHLCV columns.
+        :return: Number of candles added.
+        """
+        total = 0
+        with self.lock:
+            updates = {}
+            try:
+                for symbol, data in frames.items():
+                    if data is None or data.empty:
+                        continue
+                    # The symbol column is kept in the files so the manifest can be rebuilt from them
+                    data = data.assign(symbol=symbol).sort_values('timestamp', kind='stable')
+                    data = data.drop_duplicates('timestamp', keep='last')
+                    added, updates[symbol] = self._write_months(timeframe, symbol, data)
+                    total += added
+                    logging.info(f"Appended {added} candles to {self.exchange} {timeframe} {symbol}")
+            finally:
+                # Also record the symbols written before a failure, their partitions are already swapped in
+                if updates:
+                    # Copy before updating, the cached manifest may be in use by readers
+                    partitions = {name: dict(months) for name, months in self.manifest(timeframe).items()}
+                    for symbol, entries in updates.items():
+                        partitions.setdefault(symbol, {}).update(entries)
+                    self.write_manifest(timeframe, partitions)
+        return total
+
+    def _write_months(self, timeframe, symbol, data):
+        """
+        Merge sorted, deduplicated candles into their monthly partitions.
+
+        :return: Number of candles added and the new manifest entries by month.
+        """
+        # Settle the manifest first, so an old lake is scanned before any partition changes
+        self.manifest(timeframe)
+        added = 0
+        entries = {}
+        for month, group in data.groupby(data['timestamp'].dt.strftime('%Y-%m'), sort=True):
+            path = self.partition_path(timeframe, symbol, month)
+            if os.path.exists(path):
+                existing = pd.read_feather(path).assign(symbol=symbol)
+                if len(existing) and group['timestamp'].iloc[0] <= existing['timestamp'].iloc[-1]:
+                    # Overlap with the boundary partition: deduplicate, new candles win
+                    merged = pd.concat([existing, group], ignore_index=True)
+                    merged = merged.drop_duplicates('timestamp', keep='last').sort_values('timestamp')
+                else:
+                    merged = pd.concat([existing, group], ignore_index=True)
+                added += len(merged) - len(existing)
+            else:
+                merged = group
+                added += len(group)
+            merged = merged.reset_index(drop=True)
+            self.write_partition(path, merged)
+            entries[month] = self._describe(path, merged)
+        return added, entries
+
+    @staticmethod
+    def write_partition(path, data):
+        """
+        Write a partition to a temporary file and swap it in.
+        """
+        _replace_file(path, data.to_feather)
+
+    def verify(self, timeframe, symbols=None):
+        """
+        Check the partitions against the checksums of the manifest.
+
+        :return: List of (symbol, month) whose file is missing or does not match its checksum.
+        """
+        corrupted = []
+        for symbol, month, entry in self.partitions(timeframe, symbols):
+            path = self.partition_path(timeframe, symbol, month)
+            if not os.path.exists(path) or data_store.file_digest(path) != entry['sha256']:
+                corrupted.append((symbol, month))
+        return corrupted
+
+    def read(self, timeframe, symbol, start=None, end=None, columns=None):
+        """
+        Read the candles of a symbol, opening only the partitions that overlap [start, end].
+
+        :param columns: Optional list of columns, the timestamp column is always read.
+        :return: DataFrame with the timestamp and OHLCV columns and a symbol column.
+        """
+        return self.read_many(timeframe, [symbol], start, end, columns)
+
+    def read_many(self, timeframe, symbols=None, start=None, end=None, columns=None):
+        """
+        Read the candles of several symbols as one long table, opening only the partitions that overlap
+        [start, end].
+
+        :param timeframe: Bar interval, e.g. '12h'.
+        :param symbols: Optional list of symbols, None reads every symbol.
+        :param start: First timestamp included.
+        :param end: Last timestamp included.
+        :param columns: Optional list of columns, the timestamp and symbol columns are always read.
+        :return: DataFrame with the timestamp, OHLCV and symbol columns, sorted by symbol and time.
+        """
+        frames = list(self.iter_partitions(timeframe, symbols, start, end, columns))
+        if not frames:
+            return pd.DataFrame(columns=self._columns(columns) or
+                                ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'symbol'])
+        return pd.concat(frames, ignore_index=True)
+
+    def iter_partitions(self, timeframe, symbols=None, start=None, end=None, columns=None):
+        """
+        Read the selected partitions one at a time, trimmed to [start, end].
+
+        :return: Generator of DataFrames, in the order of read_many.
+        """
+        columns = self._columns(columns)
+        for symbol, month, entry in self.partitions(timeframe, symbols, start, end):
+            data = pd.read_feather(self.partition_path(timeframe, symbol, month), columns=columns)
+            if start is not None and pd.Timestamp(entry['min']) < pd.Timestamp(start):
+                data = data[data['timestamp'] >= pd.Timestamp(start)]
+            if end is not None and pd.Timestamp(entry['max']) > pd.Timestamp(end):
+                data = data[data['timestamp'] <= pd.Timestamp(end)]
+            yield data.reset_index(drop=True)
+
+    @staticmethod
+    def _columns(columns):
+        if columns is None:
+            return None
+        return ['timestamp', *[name for name in columns if name not in ('timestamp', 'symbol')], 'symbol']
+
+    def date_range(self, timeframe, symbols=None):
+        """
+        :return: (first timestamp, last timestamp) of the stored candles, from the manifest.
+        """
+        selected = self.partitions(timeframe, symbols)
+        if not selected:
+            return None, None
+        return (min(pd.Timestamp(entry['min']) for _, _, entry in selected),
+                max(pd.Timestamp(entry['max']) for _, _, entry in selected))
+
+
+def parse_lake_path(data_path):
+    """
+    Split a 'lake://<root>/<exchange>/<timeframe>[?symbols=A,B]' data path.
+
+    :return: Tuple of the MarketDataLake, the timeframe and the list of symbols (None for all).
+    """
+    rest, _, query = data_path.split('://', 1)[1].partition('?')
+    root, exchange, timeframe = rest.rstrip('/').rsplit('/', 2)
+    symbols = None
+    for option in filter(None, query.split('&')):
+        key, _, value = option.partition('=')
+        if key == 'symbols':
+            symbols = value.split(',')
+    return MarketDataLake(root, exchange), timeframe, symbols
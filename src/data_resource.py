@@ -3,22 +3,525 @@
 
 # dataloader.py
 
+import csv
+import datetime
+import decimal
+import io
+import json
+import math
+import os
+import queue
+import shutil
+import threading
+
+import numpy as np
 import pandas as pd
 import pymysql
+import pymysql.cursors
 import logging
 
+from lib import data_lake, data_store
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
 logging.basicConfig(level=logging.INFO)
 
+# Version of the columnar conversion of CSV / Excel files, older conversions are converted again
+COLUMNAR_CACHE_FORMAT = 2
+
+
+def find_date_column(columns):
+    """
+    Find the date column of a table, the first column whose name contains 'date' or 'time'.
+
+    :param columns: Column names.
+    :return: Name of the date column, None if there is none.
+    """
+    return next((col for col in columns if 'date' in col.lower() or 'time' in col.lower()), None)
+
+
+def filter_date_range(data, start_date=None, end_date=None, date_column=None):
+    """
+    Keep the rows of a DataFrame inside a date range, both ends included.
+
+    :param data: Pandas DataFrame containing the loaded data.
+    :param start_date: First date included, None for no lower bound.
+    :param end_date: Last date included, None for no upper bound.
+    :param date_column: Name of the date column, detected if None.
+    :return: Pandas DataFrame, a slice when the dates are sorted.
+    """
+    if data is None or (start_date is None and end_date is None):
+        return data
+    date_column = date_column or find_date_column(data.columns)
+    if date_column is None:
+        return data
+
+    dates = pd.to_datetime(data[date_column]).to_numpy()
+    start = pd.Timestamp(start_date).to_datetime64() if start_date is not None else None
+    end = pd.Timestamp(end_date).to_datetime64() if end_date is not None else None
+    if len(dates) < 2 or not (dates[1:] < dates[:-1]).any():
+        # Sorted dates: binary search, no boolean mask over the whole table
+        first = 0 if start is None else np.searchsorted(dates, start, side='left')
+        last = len(dates) if end is None else np.searchsorted(dates, end, side='right')
+        return data.iloc[first:last]
+
+    mask = np.ones(len(dates), dtype=bool)
+    if start is not None:
+        mask &= dates >= start
+    if end is not None:
+        mask &= dates <= end
+    return data[mask]
+
+
+def _month_key(text):
+    """
+    Month of a date field as 'YYYY-MM', accepting ISO-like dates and epoch seconds or milliseconds.
+    """
+    text = text.strip().strip('"')
+    if len(text) >= 7 and text[:4].isdigit() and text[4] in '-/':
+        return text[:4] + '-' + text[5:7]
+    if text.isdigit():
+        value = int(text)
+        return pd.Timestamp(value, unit='ms' if value > 10 ** 11 else 's').strftime('%Y-%m')
+    return pd.Timestamp(text).strftime('%Y-%m')
+
+
+def _iter_csv_records(file):
+    """
+    Split a binary CSV stream into records, keeping the quoted fields that span several lines in one record.
+
+    :return: Generator of the raw bytes of every record, line endings included, so offsets can be summed.
+    """
+    pending = b''
+    for line in file:
+        pending += line
+        # An odd number of quotes leaves a quoted field open until a later line
+        if pending.count(b'"') % 2 == 0:
+            yield pending
+            pending = b''
+    if pending:
+        yield pending
+
+
+def _parse_csv_record(record):
+    """
+    :return: Fields of one raw CSV record, quoted fields (which may contain commas) are unquoted.
+    """
+    text = record.decode()
+    if '"' not in text:
+        return text.rstrip('\r\n').split(',')
+    return next(csv.reader(io.StringIO(text)), [])
+
+
+def build_csv_index(file_path, date_column=None):
+    """
+    Scan a CSV file once and record the byte offset where every month starts.
+
+    The index is saved next to the file as <file>.index.json and is rebuilt when the file's size or
+    modification time changes.
+
+    :param file_path: Path to the CSV file, sorted by date.
+    :param date_column: Name of the date column, detected if None.
+    :return: Dictionary with the header, the date column and [month, offset] pairs, None if the file has no
+             date column or is not sorted.
+    """
+    stat = os.stat(file_path)
+    with open(file_path, 'rb') as file:
+        records = _iter_csv_records(file)
+        header = next(records, b'')
+        columns = _parse_csv_record(header)
+        date_column = date_column or find_date_column(columns)
+        if date_column is None:
+            return None
+        position = columns.index(date_column)
+
+        months, offset = [], len(header)
+        for record in records:
+            if record.strip():
+                month = _month_key(_parse_csv_record(record)[position])
+                if not months or months[-1][0] != month:
+                    if months and month < months[-1][0]:
+                        logging.warning(f"{file_path} is not sorted by {date_column}, date range pushdown disabled")
+                        return None
+                    months.append([month, offset])
+            offset += len(record)
+
+    index = {'size': stat.st_size, 'mtime': stat.st_mtime, 'date_column': date_column, 'months': months,
+             'end': offset}
+    try:
+        with open(file_path + '.index.json', 'w') as file:
+            json.dump(index, file)
+    except OSError as e:
+        logging.warning(f"Could not save CSV index: {str(e)}")
+    return index
+
+
+def load_csv_index(file_path, date_column=None):
+    """
+    Load the month index of a CSV file, building it if it is missing or stale.
+
+    :param file_path: Path to the CSV file.
+    :param date_column: Name of the date column, detected if None.
+    :return: Index dictionary, see build_csv_index.
+    """
+    stat = os.stat(file_path)
+    try:
+        with open(file_path + '.index.json') as file:
+            index = json.load(file)
+        if index['size'] == stat.st_size and index['mtime'] == stat.st_mtime and \
+                (date_column is None or index['date_column'] == date_column):
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_csv_index(file_path, date_column)
+
+
+def csv_byte_range(file_path, start_date=None, end_date=None, date_column=None):
+    """
+    Find the bytes of a sorted CSV file covering the months that overlap a date range.
+
+    :param file_path: Path to the CSV file.
+    :param start_date: First date included.
+    :param end_date: Last date included.
+    :param date_column: Name of the date column, detected if None.
+    :return: Tuple of header bytes, start offset, end offset and date column, None if the file has no index.
+    """
+    index = load_csv_index(file_path, date_column)
+    if index is None:
+        return None
+
+    months = index['months']
+    keys = [month for month, _ in months]
+    first_month = pd.Timestamp(start_date).strftime('%Y-%m') if start_date is not None else None
+    last_month = pd.Timestamp(end_date).strftime('%Y-%m') if end_date is not None else None
+    first = 0 if first_month is None else int(np.searchsorted(keys, first_month, side='left'))
+    last = len(keys) if last_month is None else int(np.searchsorted(keys, last_month, side='right'))
+
+    with open(file_path, 'rb') as file:
+        header = file.readline()
+    if first >= last:
+        return header, len(header), len(header), index['date_column']
+    end_offset = months[last][1] if last < len(months) else index['end']
+    return header, months[first][1], end_offset, index['date_column']
+
+
+class _ByteRange(io.RawIOBase):
+    """
+    Readable stream of a prefix followed by the bytes [start, end) of a file, consumed lazily.
+    """
+
+    def __init__(self, file_path, prefix, start, end):
+        self.file = open(file_path, 'rb')
+        self.file.seek(start)
+        self.prefix = prefix
+        self.end = end
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.prefix:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        data = self.file.read(max(0, min(len(buffer), self.end - self.file.tell())))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def read_csv_range(file_path, start_date=None, end_date=None, date_column=None, chunk_size=None, usecols=None):
+    """
+    Read only the months of a sorted CSV file that overlap a date range, with the cached schema's dtypes.
+
+    :param file_path: Path to the CSV file.
+    :param start_date: First date included.
+    :param end_date: Last date included.
+    :param date_column: Name of the date column, detected if None.
+    :param chunk_size: If given, return an iterator of DataFrames with at most chunk_size rows.
+    :param usecols: Optional list of columns to load.
+    :return: Pandas DataFrame containing the rows inside the date range, or an iterator of them.
+    """
+    schema = load_csv_schema(file_path)
+    byte_range = csv_byte_range(file_path, start_date, end_date, date_column)
+    if byte_range is None:
+        data = read_csv_typed(file_path, schema, usecols, chunksize=chunk_size)
+        if chunk_size is None:
+            return filter_date_range(data, start_date, end_date, date_column)
+        return (filter_date_range(chunk, start_date, end_date, date_column) for chunk in data)
+
+    header, start, end, date_column = byte_range
+    if chunk_size is None:
+        with open(file_path, 'rb') as file:
+            file.seek(start)
+            data = read_csv_typed(io.BytesIO(header + file.read(end - start)), schema, usecols)
+        return filter_date_range(data, start_date, end_date, date_column).reset_index(drop=True)
+    return _iter_csv_chunks(file_path, schema, usecols, header, start, end, start_date, end_date, date_column,
+                            chunk_size)
+
+
+def _iter_csv_chunks(file_path, schema, usecols, header, start, end, start_date, end_date, date_column, chunk_size):
+    with io.BufferedReader(_ByteRange(file_path, header, start, end)) as stream:
+        for chunk in read_csv_typed(stream, schema, usecols, chunksize=chunk_size):
+            # Only the first and last months can hold rows outside the range
+            yield filter_date_range(chunk, start_date, end_date, date_column)
+
+
+def feather_range(file_path, start_date=None, end_date=None, date_column=None):
+    """
+    Memory map a feather file and read a date range out of it.
+
+    Feather files written by pandas are lz4 compressed by default, so nothing is read in place: the date column
+    is decompressed first to locate the range, then only the record batches covering it (64K rows each by
+    default) are decompressed. Uncompressed files are sliced without copying.
+
+    :param file_path: Path to the feather file.
+    :param start_date: First date included.
+    :param end_date: Last date included.
+    :param date_column: Name of the date column, detected if None.
+    :return: pyarrow Table, or a Pandas DataFrame when the dates are not sorted.
+    """
+    reader = pa.ipc.open_file(pa.memory_map(file_path, 'r'))
+    date_column = date_column or find_date_column(reader.schema.names)
+    if date_column is None or (start_date is None and end_date is None):
+        return reader.read_all()
+
+    options = pa.ipc.IpcReadOptions(included_fields=[reader.schema.get_field_index(date_column)])
+    date_chunks = pa.ipc.open_file(pa.memory_map(file_path, 'r'), options=options).read_all().column(0).chunks
+    dates = pd.to_datetime(np.concatenate([chunk.to_numpy(zero_copy_only=False) for chunk in date_chunks])
+                           if date_chunks else np.array([], dtype='datetime64[ns]')).to_numpy()
+    if (dates[1:] < dates[:-1]).any():
+        return filter_date_range(reader.read_all().to_pandas(), start_date, end_date, date_column)
+    first = 0 if start_date is None else np.searchsorted(dates, pd.Timestamp(start_date).to_datetime64(), 'left')
+    last = len(dates) if end_date is None else np.searchsorted(dates, pd.Timestamp(end_date).to_datetime64(), 'right')
+
+    # One date chunk per record batch, read only the batches overlapping [first, last)
+    bounds = np.cumsum([0] + [len(chunk) for chunk in date_chunks])
+    batches = [i for i in range(len(date_chunks)) if bounds[i] < last and bounds[i + 1] > first]
+    if not batches:
+        return reader.schema.empty_table()
+    table = pa.Table.from_batches([reader.get_batch(i) for i in batches], schema=reader.schema)
+    return table.slice(first - bounds[batches[0]], last - first)
+
+
+def load_feather_range(file_path, start_date=None, end_date=None, date_column=None):
+    """
+    Read a date range from a feather file, see feather_range for what is actually read.
+
+    :param file_path: Path to the feather file.
+    :param start_date: First date included.
+    :param end_date: Last date included.
+    :param date_column: Name of the date column, detected if None.
+    :return: Pandas DataFrame containing the rows inside the date range.
+    """
+    if pa is None:
+        return filter_date_range(pd.read_feather(file_path), start_date, end_date, date_column)
+    table = feather_range(file_path, start_date, end_date, date_column)
+    return table if isinstance(table, pd.DataFrame) else table.to_pandas()
+
+
+def iter_frame_chunks(data, chunk_size):
+    """
+    Split a table into consecutive blocks of at most chunk_size rows.
+
+    :param data: Pandas DataFrame, pyarrow Table or columnar table slice.
+    :param chunk_size: Number of rows per block.
+    :return: Generator of Pandas DataFrames.
+    """
+    for start in range(0, len(data), chunk_size):
+        if isinstance(data, pd.DataFrame):
+            yield data.iloc[start:start + chunk_size]
+        else:
+            yield data.slice(start, chunk_size).to_pandas()
+
+
+def prefetch(iterable, size=2):
+    """
+    Produce the items of an iterable on a background thread, at most size items ahead of the consumer.
+
+    Exceptions raised by the producer are re-raised in the consumer. Closing the generator early stops the
+    producer.
+
+    :param iterable: Iterable to read ahead, e.g. a generator of DataFrame chunks, or a callable returning one.
+                     A callable is called on the background thread, so the files and database connections it
+                     opens belong to that thread (sqlite3 connections can only be used by their own thread).
+    :param size: Maximum number of items buffered, which bounds memory.
+    :return: Generator of the same items.
+    """
+    buffer = queue.Queue(maxsize=max(1, size))
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        items = None
+        try:
+            items = iter(iterable() if callable(iterable) else iterable)
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as e:
+            put((done, e))
+        finally:
+            # Release what the producer holds (e.g. a pooled connection) on its own thread
+            if hasattr(items, 'close'):
+                items.close()
+
+    thread = threading.Thread(target=produce, name='data-prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _read_last_line(file_path, block_size=65536):
+    with open(file_path, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(max(0, size - block_size))
+        lines = [line for line in file.read().splitlines() if line.strip()]
+    return lines[-1].decode() if lines else None
+
+
+def infer_csv_schema(file_path, sample_rows=10_000):
+    """
+    Infer the schema of a CSV file from a sample of rows: the dtype of every column, the date column, whether
+    dates are text or epoch numbers (and their unit), and the first and last dates of the file.
+
+    :param file_path: Path to the CSV file.
+    :param sample_rows: Number of rows used for type inference.
+    :return: Schema dictionary.
+    """
+    sample = pd.read_csv(file_path, nrows=sample_rows)
+    date_column = find_date_column(sample.columns)
+    dtypes = {}
+    for name in sample.columns:
+        values = sample[name]
+        if name == date_column:
+            continue
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            # float64 everywhere: an integer column with a missing value later in the file still loads
+            dtypes[name] = 'float64'
+        elif values.nunique() <= max(1, len(values) // 2):
+            dtypes[name] = 'category'
+        else:
+            dtypes[name] = 'str'
+
+    stat = os.stat(file_path)
+    schema = {'size': stat.st_size, 'mtime': stat.st_mtime, 'columns': list(sample.columns), 'dtypes': dtypes,
+              'date_column': date_column, 'timestamp_unit': None, 'first_date': None, 'last_date': None}
+    if date_column is not None and len(sample):
+        if pd.api.types.is_numeric_dtype(sample[date_column]):
+            schema['timestamp_unit'] = 'ms' if sample[date_column].abs().max() > 10 ** 11 else 's'
+
+        last_line = _read_last_line(file_path)
+        last_value = _parse_csv_record(last_line.encode())[list(sample.columns).index(date_column)] \
+            if last_line else None
+        first_value = sample[date_column].iloc[0]
+        unit = schema['timestamp_unit']
+        schema['first_date'] = str(pd.to_datetime(first_value, unit=unit) if unit else pd.Timestamp(first_value))
+        if last_value is not None:
+            last_value = float(last_value) if unit else last_value.strip().strip('"')
+            schema['last_date'] = str(pd.to_datetime(last_value, unit=unit) if unit else pd.Timestamp(last_value))
+    return schema
+
+
+def load_csv_schema(file_path):
+    """
+    Load the cached schema of a CSV file (<file>.schema.json), inferring it again if the file changed.
+
+    :param file_path: Path to the CSV file.
+    :return: Schema dictionary, see infer_csv_schema.
+    """
+    stat = os.stat(file_path)
+    try:
+        with open(file_path + '.schema.json') as file:
+            schema = json.load(file)
+        if schema['size'] == stat.st_size and schema['mtime'] == stat.st_mtime:
+            return schema
+    except (OSError, ValueError, KeyError):
+        pass
+
+    schema = infer_csv_schema(file_path)
+    try:
+        with open(file_path + '.schema.json', 'w') as file:
+            json.dump(schema, file)
+    except OSError as e:
+        logging.warning(f"Could not save CSV schema: {str(e)}")
+    return schema
+
+
+def read_csv_typed(source, schema, usecols=None, engine=None, chunksize=None):
+    """
+    Read CSV data with the explicit dtypes of a schema instead of letting pandas infer them.
 
-def load_csv(file_path):
+    :param source: Path or file-like object with the CSV data (including the header).
+    :param schema: Schema dictionary of the file.
+    :param usecols: Optional list of columns to load, the date column is always loaded.
+    :param engine: pandas CSV engine, 'pyarrow' by default when pyarrow is installed and chunksize is None.
+    :param chunksize: If given, return an iterator of DataFrames.
+    :return: Pandas DataFrame, or an iterator of them.
+    """
+    date_column, unit = schema['date_column'], schema['timestamp_unit']
+    columns = schema['columns'] if usecols is None else \
+        [name for name in schema['columns'] if name in usecols or name == date_column]
+    kwargs = {'usecols': columns, 'dtype': {name: dtype for name, dtype in schema['dtypes'].items() if name in columns}}
+    if date_column is not None and unit is None:
+        kwargs['parse_dates'] = [date_column]
+    if chunksize is None:
+        kwargs['engine'] = engine or ('pyarrow' if pa is not None else 'c')
+    else:
+        kwargs['chunksize'] = chunksize
+
+    def finish(data):
+        if date_column is not None and unit is not None:
+            data[date_column] = pd.to_datetime(data[date_column], unit=unit)
+        if date_column is not None:
+            # Same resolution as the columnar cache (data_store), whatever the CSV engine parsed
+            data[date_column] = data[date_column].astype('datetime64[ns]')
+        return data
+
+    data = pd.read_csv(source, **kwargs)
+    if chunksize is None:
+        return finish(data)
+    return (finish(chunk) for chunk in data)
+
+
+def load_csv(file_path, usecols=None, engine=None):
     """
     Load data from a CSV file and return a Pandas DataFrame.
 
     :param file_path: Path to the CSV file.
+    :param usecols: Optional list of columns to load.
+    :param engine: Optional pandas CSV engine, see read_csv_typed.
     :return: Pandas DataFrame containing the loaded data.
     """
     try:
-        data = pd.read_csv(file_path)
+        data = read_csv_typed(file_path, load_csv_schema(file_path), usecols, engine)
         return data
     except Exception as e:
         logging.error(f"Error loading data from CSV: {e}")
@@ -40,47 +543,333 @@ def load_excel(file_path):
         return None
 
 
-def load_database(connection_string, query):
+def parse_connection_string(connection_string):
     """
-    Load data from a data source using a SQL query and return a Pandas DataFrame.
+    Parse a 'user/password/host[:port]/database' connection string.
 
     :param connection_string: Database connection string.
+    :return: Dictionary of pymysql.connect arguments.
+    """
+    user, password, host, database = connection_string.split('/')
+    host, _, port = host.partition(':')
+    kwargs = {'user': user, 'password': password, 'host': host, 'database': database}
+    if port:
+        kwargs['port'] = int(port)
+    return kwargs
+
+
+class ConnectionPool:
+    def __init__(self, connect, max_size=4, placeholder='%s'):
+        """
+        Thread-safe pool of DB-API connections, reused across loads instead of connecting for every query.
+
+        Idle connections are kept per thread: a connection is only handed out again on the thread that created
+        it, since drivers such as sqlite3 refuse connections used from another thread. The idle connections of a
+        finished thread are closed when the thread's storage is garbage collected.
+
+        :param connect: Callable returning a new DB-API connection.
+        :param max_size: Maximum number of idle connections kept open per thread.
+        :param placeholder: Parameter placeholder of the driver, '%s' for pymysql and '?' for sqlite3.
+        """
+        self.connect = connect
+        self.max_size = max_size
+        self.placeholder = placeholder
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _idle(self):
+        if not hasattr(self._local, 'idle'):
+            self._local.idle = []
+        return self._local.idle
+
+    def acquire(self):
+        """
+        :return: An idle connection of the calling thread, or a new one if none is available.
+        """
+        idle = self._idle()
+        if not idle:
+            with self._lock:
+                self.created += 1
+            return self.connect()
+        connection = idle.pop()
+        if hasattr(connection, 'ping'):
+            connection.ping(reconnect=True)
+        return connection
+
+    def release(self, connection, broken=False):
+        """
+        Return a connection to the pool of the calling thread, closing it if the pool is full or the connection
+        failed. An open transaction is rolled back first, a connection that cannot be rolled back is dropped.
+        """
+        idle = self._idle()
+        if not broken and len(idle) < self.max_size:
+            try:
+                connection.rollback()
+                idle.append(connection)
+                return
+            except Exception as e:
+                logging.warning(f"Dropping a pooled connection that could not be rolled back: {str(e)}")
+        try:
+            connection.close()
+        except Exception as e:
+            logging.warning(f"Error closing a pooled connection: {str(e)}")
+
+    def close(self):
+        """
+        Close the idle connections of the calling thread.
+        """
+        idle = self._idle()
+        while idle:
+            try:
+                idle.pop().close()
+            except Exception as e:
+                logging.warning(f"Error closing a pooled connection: {str(e)}")
+
+
+_database_factories = {}
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def register_database(name, connect, placeholder='%s', max_size=4):
+    """
+    Register a connection factory under a name usable in 'data_source://<name>/<query>' data paths, e.g. a
+    local SQLite database for tests.
+
+    :param name: Name of the database.
+    :param connect: Callable returning a new DB-API connection on every call, e.g.
+                    lambda: sqlite3.connect(path). Connections never leave the thread that created them, so
+                    sqlite3 needs no check_same_thread=False.
+    :param placeholder: Parameter placeholder of the driver.
+    :param max_size: Maximum number of idle connections kept open per thread.
+    """
+    with _pools_lock:
+        _database_factories[name] = (connect, placeholder, max_size)
+
+
+def get_pool(connection_string):
+    """
+    Get the connection pool of a registered database or a 'user/password/host/database' connection string.
+
+    Pools are created once per process, so optimizer workers never share a connection with their parent.
+
+    :param connection_string: Registered name or connection string.
+    :return: ConnectionPool
+    """
+    key = (os.getpid(), connection_string)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            if connection_string in _database_factories:
+                connect, placeholder, max_size = _database_factories[connection_string]
+                pool = ConnectionPool(connect, max_size, placeholder)
+            else:
+                kwargs = parse_connection_string(connection_string)
+                # Unbuffered cursor: rows stay on the server until they are fetched
+                pool = ConnectionPool(lambda: pymysql.connect(cursorclass=pymysql.cursors.SSCursor, **kwargs))
+            _pools[key] = pool
+    return pool
+
+
+def parse_data_path(data_path):
+    """
+    Split a 'data_source://<connection string or registered name>/<query>' data path.
+
+    :return: Tuple of the connection string and the query.
+    """
+    rest = data_path.split('://', 1)[1]
+    for name in _database_factories:
+        if rest.startswith(name + '/'):
+            return name, rest[len(name) + 1:]
+    parts = rest.split('/', 4)
+    return '/'.join(parts[:4]), parts[4]
+
+
+def date_range_query(query, start_date=None, end_date=None, date_column='date', placeholder='%s'):
+    """
+    Wrap a SQL query with a parameterized date range condition.
+
     :param query: SQL query to retrieve the data.
+    :param start_date: First date included.
+    :param end_date: Last date included.
+    :param date_column: Name of the date column.
+    :param placeholder: Parameter placeholder of the driver.
+    :return: Tuple of the query and its parameters.
+    """
+    conditions, params = [], []
+    if start_date is not None:
+        conditions.append(f"`{date_column}` >= {placeholder}")
+        params.append(pd.Timestamp(start_date).strftime('%Y-%m-%d %H:%M:%S'))
+    if end_date is not None:
+        conditions.append(f"`{date_column}` <= {placeholder}")
+        params.append(pd.Timestamp(end_date).strftime('%Y-%m-%d %H:%M:%S'))
+    if conditions:
+        query = f"SELECT * FROM ({query}) AS q WHERE {' AND '.join(conditions)}"
+    return query, params
+
+
+def _to_array(values):
+    """
+    Convert one fetched column to a typed NumPy array: int64 or float64 for numbers (NULL becomes NaN),
+    datetime64 for dates and object otherwise.
+    """
+    first = next((value for value in values if value is not None), None)
+    if isinstance(first, (int, float, decimal.Decimal)) and not isinstance(first, bool):
+        if isinstance(first, int) and all(type(value) is int for value in values):
+            return np.array(values, dtype=np.int64)
+        return np.array([math.nan if value is None else value for value in values], dtype=np.float64)
+    if isinstance(first, (datetime.date, datetime.datetime)):
+        return pd.to_datetime(list(values)).to_numpy()
+    return np.array(values, dtype=object)
+
+
+def fetch_batches(pool, query, params=None, batch_size=10_000):
+    """
+    Run a query on a pooled connection and fetch the result in batches.
+
+    :param pool: ConnectionPool
+    :param query: SQL query.
+    :param params: Query parameters.
+    :param batch_size: Number of rows fetched per round trip.
+    :return: Generator of Pandas DataFrames with typed columns.
+    """
+    connection = pool.acquire()
+    broken = True
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(query, params or ())
+            columns = [description[0] for description in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield pd.DataFrame({name: _to_array(values) for name, values in zip(columns, zip(*rows))},
+                                   columns=columns)
+        finally:
+            # Closing an unbuffered cursor drains the unread rows so the connection can be reused
+            cursor.close()
+        broken = False
+    finally:
+        pool.release(connection, broken)
+
+
+def load_database(connection_string, query, start_date=None, end_date=None, date_column='date', batch_size=10_000):
+    """
+    Load data from a data source using a SQL query and return a Pandas DataFrame.
+
+    :param connection_string: Database connection string or name given to register_database.
+    :param query: SQL query to retrieve the data.
+    :param start_date: First date included, the range is applied by the database.
+    :param end_date: Last date included.
+    :param date_column: Name of the date column used for the date range.
+    :param batch_size: Number of rows fetched per round trip.
     :return: Pandas DataFrame containing the loaded data.
     """
     try:
-        # Parse the connection string to extract database-related information
-        db_info = connection_string.split('/')
-        user, password, host, database = db_info
+        pool = get_pool(connection_string)
+        # Push the date range down to the database so only the requested window is transferred
+        query, params = date_range_query(query, start_date, end_date, date_column, pool.placeholder)
+        batches = list(fetch_batches(pool, query, params, batch_size))
+        if not batches:
+            return pd.DataFrame()
+        return pd.concat(batches, ignore_index=True) if len(batches) > 1 else batches[0]
+    except Exception as e:
+        logging.error(f"Error loading data from the data source: {e}")
+        return None
 
-        # Create a database connection
-        connection = pymysql.connect(
-            user=user,
-            password=password,
-            host=host,
-            database=database
-        )
 
-        # Execute the query and retrieve data
-        data = pd.read_sql_query(query, connection)
+def iter_database(connection_string, query, start_date=None, end_date=None, date_column='date', chunk_size=100_000):
+    """
+    Stream the result of a SQL query in blocks of chunk_size rows.
+
+    :param connection_string: Database connection string or name given to register_database.
+    :param query: SQL query to retrieve the data.
+    :param start_date: First date included.
+    :param end_date: Last date included.
+    :param date_column: Name of the date column used for the date range.
+    :param chunk_size: Number of rows per block.
+    :return: Generator of Pandas DataFrames.
+    """
+    pool = get_pool(connection_string)
+    query, params = date_range_query(query, start_date, end_date, date_column, pool.placeholder)
+    yield from fetch_batches(pool, query, params, chunk_size)
 
-        # Close the database connection
-        connection.close()
 
-        return data
+def columnar_cache(file_path, cache_dir=None):
+    """
+    Convert a CSV or Excel file once into a columnar table (see data_store) and reuse it while the source
+    does not change.
+
+    The conversion is keyed by the source's size, modification time and content hash, and by
+    COLUMNAR_CACHE_FORMAT. The hash is only
+    computed when the size or time changed, so a touched but unchanged file is not converted again.
+
+    :param file_path: Path to the CSV or Excel file.
+    :param cache_dir: Directory of the converted tables, None stores them next to the source file.
+    :return: data_store.ColumnarTable, None if the file could not be converted.
+    """
+    directory, name = os.path.split(os.path.abspath(file_path))
+    table_path = os.path.join(cache_dir or directory, f'.{name}.columnar')
+    source_file = os.path.join(table_path, 'source.json')
+    stat = os.stat(file_path)
+
+    try:
+        with open(source_file) as file:
+            source = json.load(file)
+        if source['format'] != COLUMNAR_CACHE_FORMAT:
+            raise ValueError(f"Columnar cache format {source['format']}")
+        if (source['size'], source['mtime']) == (stat.st_size, stat.st_mtime):
+            return data_store.open_table(table_path)
+        if source['size'] == stat.st_size and source['sha256'] == data_store.file_digest(file_path):
+            source['mtime'] = stat.st_mtime
+            with open(source_file, 'w') as file:
+                json.dump(source, file)
+            return data_store.open_table(table_path)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    try:
+        if file_path.endswith('.csv'):
+            schema = load_csv_schema(file_path)
+            data, time_column = read_csv_typed(file_path, schema), schema['date_column']
+        else:
+            data = pd.read_excel(file_path)
+            time_column = find_date_column(data.columns)
+            if time_column is not None:
+                data[time_column] = pd.to_datetime(data[time_column])
+
+        # Write next to the final location and swap it in, readers never see a half-written table
+        temp_path = f'{table_path}.tmp{os.getpid()}'
+        shutil.rmtree(temp_path, ignore_errors=True)
+        data_store.write_table(temp_path, data, time_column)
+        with open(os.path.join(temp_path, 'source.json'), 'w') as file:
+            json.dump({'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': data_store.file_digest(file_path),
+                       'format': COLUMNAR_CACHE_FORMAT}, file)
+        shutil.rmtree(table_path, ignore_errors=True)
+        os.replace(temp_path, table_path)
+        logging.info(f"Converted {file_path} to columnar table {table_path}")
+        return data_store.open_table(table_path)
     except Exception as e:
-        logging.error(f"Error loading data from the data source: {e}")
+        logging.warning(f"Could not convert {file_path} to a columnar table: {str(e)}")
         return None
 
 
 class DataSource:
-    def __init__(self, data_path, start_date=None, end_date=None):
-        if start_date is None or end_date is None:
-            self.set_date_range(start_date, end_date)
-        self.end_date = start_date
-        self.start_date = end_date
+    def __init__(self, data_path, start_date=None, end_date=None, date_column=None, columns=None,
+                 columnar_cache=True, cache_dir=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.date_column = date_column
+        # Optional list of columns to load from CSV files, the date column is always loaded
+        self.columns = columns
+        # Convert CSV / Excel files once into a memory-mapped columnar table, see columnar_cache
+        self.columnar_cache = columnar_cache
+        self.cache_dir = cache_dir
         self.data_path = data_path
         self.data = None
+        self.attached = False
 
     def set_date_range(self, start_date, end_date):
         self.start_date = start_date
@@ -91,13 +880,29 @@ class DataSource:
 
     def auto_set_date_range(self):
         try:
+            schema = None
+            if self.data_path is not None and self.data_path.endswith('.csv') and not self.attached:
+                schema = load_csv_schema(self.data_path)
+            if self.data_path is not None and self.data_path.startswith('lake://') and not self.attached:
+                # The lake manifest knows the first and last candles without reading any partition
+                lake, timeframe, symbols = data_lake.parse_lake_path(self.data_path)
+                self.start_date, self.end_date = lake.date_range(timeframe, symbols)
+                return
             if self.data is not None:
                 data = self.data
-                date_column = next((col for col in data.columns if 'date' in col.lower()), None)
-                if date_column is not None:
-                    data.rename(columns={date_column: 'date'}, inplace=True)
-                    start_date = data['date'].min()
-                    end_date = data['date'].max()
+                # The schema knows the date column of the file, e.g. 'timestamp' for epoch numbers
+                date_column = (schema['date_column'] if schema is not None else None) or \
+                    next((col for col in data.columns if 'date' in col.lower()), None)
+                if date_column is not None and date_column in data.columns:
+                    if 'date' in date_column.lower():
+                        data.rename(columns={date_column: 'date'}, inplace=True)
+                        date_column = 'date'
+                    if schema is not None and schema['first_date'] is not None:
+                        # The cached schema already knows the first and last dates, no need to scan the data
+                        start_date, end_date = pd.Timestamp(schema['first_date']), pd.Timestamp(schema['last_date'])
+                    else:
+                        start_date = data[date_column].min()
+                        end_date = data[date_column].max()
                     self.start_date = start_date
                     self.end_date = end_date
                 logging.info("Parameters 'start_date', 'end_date' may not be filled, "
@@ -116,14 +921,30 @@ class DataSource:
         """
         data = None
         try:
-            if self.data_path.endswith('.csv'):
-                data = load_csv(self.data_path)
+            table = self.columnar_table()
+            if table is not None:
+                # Memory-mapped columns, the date range is a binary search and the slice is a view
+                columns = None if self.columns is None else \
+                    [name for name in table.columns if name in self.columns or name == table.time_column]
+                data = table.read(self.start_date, self.end_date, columns)
+            elif self.data_path.endswith('.csv'):
+                if self.start_date is None and self.end_date is None:
+                    data = load_csv(self.data_path, self.columns)
+                else:
+                    data = read_csv_range(self.data_path, self.start_date, self.end_date, self.date_column,
+                                          usecols=self.columns)
+            elif self.data_path.endswith('.feather'):
+                data = load_feather_range(self.data_path, self.start_date, self.end_date, self.date_column)
             elif self.data_path.endswith(('.xls', '.xlsx')):
-                data = load_excel(self.data_path)
+                data = filter_date_range(load_excel(self.data_path), self.start_date, self.end_date,
+                                         self.date_column)
+            elif self.data_path.startswith('lake://'):
+                lake, timeframe, symbols = data_lake.parse_lake_path(self.data_path)
+                data = lake.read_many(timeframe, symbols, self.start_date, self.end_date, self.columns)
             elif self.data_path.startswith('data_source://'):
-                # Assuming data_source connection string and query are specified in the data_path
-                connection_string, query = self.data_path.split('://')[1].split('/')
-                data = load_database(connection_string, query)
+                connection_string, query = parse_data_path(self.data_path)
+                data = load_database(connection_string, query, self.start_date, self.end_date,
+                                     self.date_column or 'date')
 
             if data is not None:
                 self.data = data
@@ -137,6 +958,25 @@ class DataSource:
             logging.error(f"Error loading data: {e}")
             return None
 
+    def columnar_table(self):
+        """
+        :return: The memory-mapped columnar table behind data_path (a data_store table, or the cached conversion
+                 of a CSV / Excel file), None for other sources.
+        """
+        if self.data_path is None or self.attached:
+            return None
+        if os.path.isdir(self.data_path) and data_store.is_store(self.data_path):
+            return data_store.open_table(self.data_path)
+        if self.columnar_cache and self.data_path.endswith(('.csv', '.xls', '.xlsx')):
+            return columnar_cache(self.data_path, self.cache_dir)
+        return None
+
+    def is_columnar(self):
+        """
+        :return: Whether the data is read from a memory-mapped columnar table (see data_store).
+        """
+        return self.columnar_table() is not None
+
     def get_data_column(self, column_name):
         # Get specific historical market data
         if self.data is not None and column_name in self.data.columns:
@@ -151,8 +991,77 @@ class DataSource:
     def get_end_date(self):
         return self.end_date
 
+    def attach_data(self, data):
+        """
+        Use already loaded data (e.g. shared by the optimizer) instead of reading data_path.
+
+        :param data: Pandas DataFrame containing the market data.
+        """
+        self.data = data
+        self.attached = True
+
+    def iter_historical_data(self, chunk_size=100_000, prefetch_chunks=2):
+        """
+        Stream the historical data in blocks of at most chunk_size rows, read ahead on a background thread.
+
+        CSV, feather, columnar and SQL sources are read chunk by chunk inside the date range, and data lake
+        sources partition by partition, so memory is bounded by chunk_size * (prefetch_chunks + 2) rows (or one
+        partition). Excel files and attached data are already in memory and are only split into blocks.
+
+        :param chunk_size: Number of rows per block.
+        :param prefetch_chunks: Number of blocks read ahead, 0 reads in the consumer's thread. The source is
+                                opened on the read-ahead thread, SQL sources use a connection of that thread.
+        :return: Generator of Pandas DataFrames.
+        """
+        if prefetch_chunks:
+            return prefetch(lambda: self._iter_chunks(chunk_size), prefetch_chunks)
+        return self._iter_chunks(chunk_size)
+
+    def _iter_chunks(self, chunk_size):
+        table = self.columnar_table()
+        if table is not None:
+            rows = table.locate(self.start_date, self.end_date)
+            for start in range(rows.start, rows.stop, chunk_size):
+                yield table.read_rows(slice(start, min(start + chunk_size, rows.stop)))
+        elif self.attached or self.data_path.endswith(('.xls', '.xlsx')):
+            yield from iter_frame_chunks(self.get_historical_data(), chunk_size)
+        elif self.data_path.endswith('.csv'):
+            yield from read_csv_range(self.data_path, self.start_date, self.end_date, self.date_column, chunk_size,
+                                      self.columns)
+        elif self.data_path.endswith('.feather') and pa is not None:
+            yield from iter_frame_chunks(feather_range(self.data_path, self.start_date, self.end_date,
+                                                       self.date_column), chunk_size)
+        elif self.data_path.startswith('lake://'):
+            lake, timeframe, symbols = data_lake.parse_lake_path(self.data_path)
+            for partition in lake.iter_partitions(timeframe, symbols, self.start_date, self.end_date, self.columns):
+                yield from iter_frame_chunks(partition, chunk_size)
+        elif self.data_path.startswith('data_source://'):
+            connection_string, query = parse_data_path(self.data_path)
+            yield from iter_database(connection_string, query, self.start_date, self.end_date,
+                                     self.date_column or 'date', chunk_size)
+        else:
+            yield from iter_frame_chunks(self.get_historical_data(), chunk_size)
+
+    def iter_bars(self, chunk_size=None, prefetch_chunks=2):
+        """
+        Iterate over the historical data bar by bar, as dictionaries.
+
+        :param chunk_size: Stream the data in blocks of this many rows, None loads it at once.
+        :param prefetch_chunks: Number of blocks read ahead on a background thread.
+        :return: Generator of bars.
+        """
+        if chunk_size is None:
+            chunks = [self.get_historical_data()]
+        else:
+            chunks = self.iter_historical_data(chunk_size, prefetch_chunks)
+        for chunk in chunks:
+            if chunk is not None:
+                yield from chunk.to_dict('records')
+
     def get_historical_data(self):
         try:
+            if self.attached:
+                return filter_date_range(self.data, self.start_date, self.end_date, self.date_column)
             historical_data = self.load_data()
             return historical_data
         except Exception as e:
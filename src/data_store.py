@@ -0,0 +1,224 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Columnar, memory-mapped store for historical market data.
+
+Every table (one symbol and timeframe) is a directory holding one .npy file per column and a meta.json
+describing the columns. Tables are sorted by time and opened with memory mapping, so date-range slices are
+index lookups that return views, and every process reading the same table shares the same OS page cache.
+
+Layout:
+    <root>/<symbol>/<timeframe>/meta.json
+    <root>/<symbol>/<timeframe>/<column>.npy
+"""
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+META_FILE = 'meta.json'
+
+
+def safe_name(symbol):
+    """
+    :return: Symbol usable as a directory name, e.g. 'BTC/USDT:USDT' -> 'BTC-USDT-USDT'.
+    """
+    return symbol.replace('/', '-').replace(':', '-')
+
+
+def store_path(root, symbol, timeframe):
+    """
+    :return: Directory of the table for a symbol and timeframe, e.g. <root>/BTC-USDT-USDT/1h.
+    """
+    return os.path.join(root, safe_name(symbol), timeframe)
+
+
+def file_digest(file_path, block_size=1 << 20):
+    """
+    :return: SHA-256 hex digest of a file's content, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_store(path):
+    """
+    :return: Whether the path is a table written by write_table.
+    """
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def write_table(path, data, time_column='date'):
+    """
+    Write a DataFrame as a columnar table, sorted by time.
+
+    :param path: Directory of the table.
+    :param data: Pandas DataFrame containing the market data.
+    :param time_column: Name of the time column used for date-range lookups, None keeps the row order and
+                        disables date ranges.
+    :return: path
+    """
+    os.makedirs(path, exist_ok=True)
+    if time_column is not None:
+        data = data.sort_values(time_column, kind='stable')
+    columns = []
+    for position, name in enumerate(data.columns):
+        values = data[name].to_numpy()
+        kind = 'values'
+        if name == time_column or values.dtype.kind == 'M':
+            values = pd.to_datetime(data[name]).to_numpy(dtype='datetime64[ns]').view(np.int64)
+            kind = 'datetime'
+        elif isinstance(data[name].dtype, pd.CategoricalDtype):
+            # Stored as strings like other text columns, read back as category
+            values = values.astype(str)
+            kind = 'category'
+        elif values.dtype.kind not in 'biuf':
+            # Strings are stored as fixed-width unicode so they can be memory mapped as well
+            values = values.astype(str)
+
+        file_name = f'{position}.npy'
+        np.save(os.path.join(path, file_name), np.ascontiguousarray(values))
+        columns.append({'name': name, 'file': file_name, 'kind': kind})
+
+    meta = {'rows': len(data), 'time_column': time_column, 'columns': columns}
+    with open(os.path.join(path, META_FILE), 'w') as file:
+        json.dump(meta, file)
+    logging.info(f"Wrote {len(data)} rows to columnar table {path}")
+    return path
+
+
+def write_symbols(root, data, timeframe, symbol_column='symbol', time_column='timestamp'):
+    """
+    Split a long table (e.g. written by okx.CryptoDataFetcher) into one columnar table per symbol.
+
+    :param root: Root directory of the store.
+    :param data: Long table with a symbol column.
+    :param timeframe: Bar interval, e.g. '1h'.
+    :param symbol_column: Name of the symbol column.
+    :param time_column: Name of the time column.
+    :return: Dictionary mapping symbols to table paths.
+    """
+    paths = {}
+    for symbol, group in data.groupby(symbol_column, sort=False):
+        paths[symbol] = write_table(store_path(root, symbol, timeframe), group.drop(columns=symbol_column),
+                                    time_column)
+    return paths
+
+
+class ColumnarTable:
+    def __init__(self, path):
+        """
+        Open a columnar table with memory mapping. No column is read until it is used.
+
+        :param path: Directory of the table.
+        """
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as file:
+            self.meta = json.load(file)
+        self.time_column = self.meta['time_column']
+        self.categories = {column['name'] for column in self.meta['columns'] if column['kind'] == 'category'}
+        self.columns = {}
+        for column in self.meta['columns']:
+            values = np.load(os.path.join(path, column['file']), mmap_mode='r')
+            if column['kind'] == 'datetime':
+                values = values.view('datetime64[ns]')
+            self.columns[column['name']] = values
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def locate(self, start_date=None, end_date=None):
+        """
+        Find the row range of a date range with a binary search on the sorted time column.
+
+        :param start_date: First date included, None for the beginning of the table.
+        :param end_date: Last date included, None for the end of the table.
+        :return: slice of rows.
+        """
+        if self.time_column is None:
+            return slice(0, len(self))
+        times = self.columns[self.time_column]
+        start = 0 if start_date is None else np.searchsorted(times, np.datetime64(pd.Timestamp(start_date), 'ns'),
+                                                             side='left')
+        stop = len(times) if end_date is None else np.searchsorted(times, np.datetime64(pd.Timestamp(end_date), 'ns'),
+                                                                   side='right')
+        return slice(int(start), int(stop))
+
+    def read(self, start_date=None, end_date=None, columns=None):
+        """
+        Read a date range as a DataFrame whose columns are views on the mapped files.
+
+        :param start_date: First date included.
+        :param end_date: Last date included.
+        :param columns: Optional list of columns to read.
+        :return: Pandas DataFrame.
+        """
+        return self.read_rows(self.locate(start_date, end_date), columns)
+
+    def read_rows(self, rows, columns=None):
+        """
+        Read a slice of rows as a DataFrame whose columns are views on the mapped files. Category columns are
+        decoded from their stored strings.
+
+        :param rows: slice of rows.
+        :param columns: Optional list of columns to read.
+        :return: Pandas DataFrame.
+        """
+        names = columns or list(self.columns.keys())
+        frame = pd.DataFrame({name: self.columns[name][rows] for name in names}, copy=False)
+        for name in self.categories.intersection(names):
+            frame[name] = frame[name].astype('category')
+        frame.index = pd.RangeIndex(rows.start, rows.stop)
+        return frame
+
+    def date_range(self):
+        """
+        :return: (first date, last date) of the table.
+        """
+        if self.time_column is None or not len(self):
+            return None, None
+        times = self.columns[self.time_column]
+        if not len(times):
+            return None, None
+        return pd.Timestamp(times[0]), pd.Timestamp(times[-1])
+
+
+_open_tables = {}
+
+
+def open_table(path):
+    """
+    Open a table once per process and reuse it, so repeated backtests do not map the files again.
+
+    :param path: Directory of the table.
+    :return: ColumnarTable
+    """
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(os.path.join(path, META_FILE))
+    cached = _open_tables.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, ColumnarTable(path))
+        _open_tables[path] = cached
+    return cached[1]
+
+
+# Test
+if __name__ == "__main__":
+    import tempfile
+
+    test_data = pd.DataFrame({
+        'date': pd.date_range('2014-01-01', periods=24 * 365 * 10, freq='h'),
+        'close': np.random.default_rng(0).normal(0, 1, 24 * 365 * 10).cumsum() + 1000,
+    })
+    with tempfile.TemporaryDirectory() as root:
+        table_path = write_table(store_path(root, 'BTC/USDT', '1h'), test_data)
+        table = open_table(table_path)
+        month = table.read('2020-03-01', '2020-03-31 23:00')
+        print(len(table), table.date_range(), len(month), np.shares_memory(month['close'].to_numpy(),
+                                                                           table.columns['close']))
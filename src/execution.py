@@ -2,11 +2,14 @@
 # -*- coding: utf-8 -*-
 import queue
 import threading
+import zlib
 # execution.py
 
 from datetime import datetime
 import logging
 
+from lib import matching, order_book
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)  # Set the desired log level
 
@@ -228,6 +231,50 @@ def monitor_order_status(order_id):
     logging.info(f"Monitoring order {order_id} status.")
 
 
+def group_orders(orders, default_exchange=None):
+    """
+    Group orders by exchange and symbol, keeping their order within each group.
+
+    Args:
+        orders (list): Order objects, an order's exchange is read from its 'exchange' attribute.
+        default_exchange (str): Exchange of the orders without one.
+
+    Returns:
+        dict: {(exchange, symbol): [orders]}
+    """
+    groups = {}
+    for order in orders:
+        exchange = getattr(order, 'exchange', None) or default_exchange
+        groups.setdefault((exchange, order.get_symbol()), []).append(order)
+    return groups
+
+
+def consolidate_responses(responses, groups=None):
+    """
+    Merge the responses of a batch into one response.
+
+    Args:
+        responses (list): Per-order responses, each with an order_id and a status.
+        groups (dict): Optional {(exchange, symbol): [orders]} the batch was split into.
+
+    Returns:
+        dict: Overall status (the common status of the orders, or 'MIXED'), time, message, the per-order responses
+        by order id and the order ids of every group.
+    """
+    statuses = {response['status'] for response in responses}
+    status = statuses.pop() if len(statuses) == 1 else ('MIXED' if statuses else 'SUCCESS')
+    counts = {}
+    for response in responses:
+        counts[response['status']] = counts.get(response['status'], 0) + 1
+    return {
+        'status': status,
+        'time': datetime.now(),
+        'message': ', '.join(f"{count} {name}" for name, count in counts.items()) or 'Empty batch',
+        'orders': {response['order_id']: response for response in responses},
+        'groups': {key: [order.get_order_id() for order in group] for key, group in (groups or {}).items()},
+    }
+
+
 class ExecutionSettings:
     def __init__(self, transaction_fee, slippage):
         """
@@ -260,46 +307,128 @@ class ExecutionSettings:
 
 class OrderExecutionThread(threading.Thread):
     def __init__(self, executing_system, order_queue):
-        super().__init__()
+        super().__init__(daemon=True)
         self.executing_system = executing_system
         self.order_queue = order_queue
         self.stop_event = threading.Event()
 
     def run(self):
-        while not self.stop_event.is_set():
+        while True:
+            # Block until an order or the stop sentinel arrives, no polling
+            order = self.order_queue.get()
             try:
-                order = self.order_queue.get(timeout=1)  # 获取订单，设置超时时间
-                if order is not None:
+                if order is None:
+                    break
+                if not self.stop_event.is_set():
                     # 执行订单
                     self.executing_system.execute_order(order)
-            except queue.Empty:
-                continue
+            except Exception as e:
+                handle_error(e)
+            finally:
+                self.order_queue.task_done()
+
+    def stop(self, drain=True):
+        """
+        Stop after the orders already queued, or skip them if drain is False.
+        """
+        if not drain:
+            self.stop_event.set()
+        self.order_queue.put(None)
+
+
+class ShardedOrderExecutor:
+    def __init__(self, executing_system, num_workers=1, queue_size=0):
+        """
+        Pool of order execution threads, each with its own queue. Orders are routed by a hash of their symbol, so
+        the orders of one symbol are executed in sequence by the same worker while different symbols run in
+        parallel.
+
+        Args:
+            executing_system (ExecutingSystem): System executing the orders.
+            num_workers (int): Number of worker threads.
+            queue_size (int): Capacity of each worker's queue, 0 for unbounded. A full queue blocks submit.
+        """
+        self.executing_system = executing_system
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(max(1, num_workers))]
+        self.workers = []
+
+    def start(self):
+        self.workers = [OrderExecutionThread(self.executing_system, order_queue) for order_queue in self.queues]
+        for worker in self.workers:
+            worker.start()
+
+    def is_alive(self):
+        return any(worker.is_alive() for worker in self.workers)
+
+    def shard(self, symbol):
+        """
+        Worker index of a symbol, stable across runs (unlike hash()).
+        """
+        return zlib.crc32(str(symbol).encode()) % len(self.queues)
+
+    def submit(self, order, block=True, timeout=None):
+        """
+        Queue an order on the worker of its symbol.
+
+        Args:
+            order(Object): Object containing all args and methods of an order
+            block (bool): Wait for room when the worker's queue is full.
+            timeout (float): Longest wait in seconds, None waits as long as needed.
+
+        Raises:
+            queue.Full: If the queue stayed full (backpressure for the producer).
+        """
+        self.queues[self.shard(order.get_symbol())].put(order, block, timeout)
 
-    def stop(self):
-        self.stop_event.set()
+    def join(self):
+        """
+        Wait until every queued order has been executed.
+        """
+        for order_queue in self.queues:
+            order_queue.join()
+
+    def stop(self, drain=True):
+        """
+        Stop the workers and wait for them.
+
+        Args:
+            drain (bool): Execute the orders already queued first, otherwise drop them.
+        """
+        for worker in self.workers:
+            worker.stop(drain)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
 
 
 class ExecutingSystem:
-    def __init__(self, order_waitlist=None, system_status='on'):
+    def __init__(self, order_waitlist=None, system_status='on', exec_settings=None, participation_rate=0.1,
+                 num_workers=1, queue_size=0):
         """
         Initialize the ExecutingSystem.
 
         Args:
-            order_waitlist (list): List of orders to wait for execution.
+            order_waitlist (list): Orders to wait for execution, kept in an indexed order_book.OrderRegistry.
             system_status (str): The system status.
+            exec_settings (ExecutionSettings): Fee and slippage for every simulated fill, None uses each order's.
+            participation_rate (float): Largest fraction of a bar's volume simulated fills may take per symbol.
+            num_workers (int): Number of order execution threads, orders are sharded across them by symbol.
+            queue_size (int): Capacity of each worker's queue, 0 for unbounded.
         """
         self.current_volume = None
         self.current_price = None
+        # Current market of single symbols: {symbol: {'volume': ..., 'price': ...}}, see set_current_market
+        self.markets = {}
+        self._symbol_locks = {}
 
-        if order_waitlist is None:
-            order_waitlist = []
-        self.order_waitlist = order_waitlist
+        self.order_waitlist = order_book.OrderRegistry(order_waitlist or ())
+        self.matching_engine = matching.MatchingEngine(self.order_waitlist, participation_rate, exec_settings)
         self.system_status = system_status
 
-        # define execution_thread
-        self.execution_thread = None
-        self.lock = threading.Lock()
-        self.order_queue = queue.Queue()
+        # define execution threads. The lock guards the waitlist and the shared market, the market of a single
+        # symbol has its own lock, so orders of different symbols execute in parallel
+        self.executor = ShardedOrderExecutor(self, num_workers, queue_size)
+        self.lock = threading.RLock()
 
     def run(self):
         """
@@ -310,31 +439,36 @@ class ExecutingSystem:
         try:
             if self.system_status == 'on':
                 # 启动订单执行线程
-                self.execution_thread = OrderExecutionThread(self, self.order_queue)
-                self.execution_thread.start()
+                self.executor.start()
             else:
                 logging.error("Cannot start system: System status is not 'on'.")
 
         except Exception as e:
             handle_error(e)
 
-    def stop(self):
+    def stop(self, drain=True):
         """
         Stop the system.
 
-        This method stops the order execution thread if it is running.
+        This method stops the order execution threads if they are running, after the queued orders unless drain
+        is False.
         """
         try:
-            if self.execution_thread and self.execution_thread.is_alive():
+            if self.executor.is_alive():
                 # 停止订单执行线程
-                self.execution_thread.stop()
-                self.execution_thread.join()
+                self.executor.stop(drain)
             else:
                 logging.warning("No active execution thread to stop.")
 
         except Exception as e:
             handle_error(e)
 
+    def submit_order(self, order, block=True, timeout=None):
+        """
+        Queue an order for the execution threads, see ShardedOrderExecutor.submit.
+        """
+        self.executor.submit(order, block, timeout)
+
     def set_sys_status(self, status):
         """
         Set the system status.
@@ -344,34 +478,192 @@ class ExecutingSystem:
         """
         self.system_status = status
 
-    def set_current_market(self, current_volume=None, current_price=None):
+    def set_current_market(self, current_volume=None, current_price=None, symbol=None):
         """
         Set the current market parameters.
 
         Args:
             current_volume (float): The new current volume.
             current_price (float): The new current price.
+            symbol (str): Symbol the market belongs to, None sets the market shared by the symbols without one.
         """
         if current_volume is not None and current_price is not None:
-            self.current_volume = current_volume
-            self.current_price = current_price
+            if symbol is None:
+                with self.lock:
+                    self.current_volume = current_volume
+                    self.current_price = current_price
+            else:
+                with self._symbol_lock(symbol):
+                    self.markets[symbol] = {'volume': current_volume, 'price': current_price}
         else:
             logging.warning("Invalid parameters provided for updating current market parameters.")
 
-    def executing_order(self, order_id, order_quantity):
+    def _symbol_lock(self, symbol):
+        lock = self._symbol_locks.get(symbol)
+        if lock is None:
+            with self.lock:
+                lock = self._symbol_locks.setdefault(symbol, threading.Lock())
+        return lock
+
+    def take_volume(self, symbol, quantity):
+        """
+        Consume up to quantity of the current volume of a symbol, or of the shared market if the symbol has none.
+
+        Args:
+            symbol (str): Trading symbol.
+            quantity (float): Quantity to execute.
+
+        Returns:
+            float: Executed quantity, 0 when no volume is left.
+        """
+        if symbol in self.markets:
+            with self._symbol_lock(symbol):
+                market = self.markets[symbol]
+                executed = max(0, min(market['volume'], quantity))
+                market['volume'] -= executed
+                return executed
+        with self.lock:
+            if self.current_volume is None:
+                raise ValueError(f"No current market for {symbol}, call set_current_market first")
+            executed = max(0, min(self.current_volume, quantity))
+            self.current_volume -= executed
+            return executed
+
+    def place_order(self, order):
+        """
+        Rest an order in the waitlist until a bar reaches its price, see match_bars.
+
+        Args:
+            order(Object): Object containing all args and methods of an order
+        """
+        with self.lock:
+            self.order_waitlist.add(order)
+
+    def match_bars(self, bars, time=None):
+        """
+        Match the resting orders against the bars of one period with the matching engine.
+
+        Args:
+            bars (dict or DataFrame): Bar (open, high, low, close, volume) of each symbol.
+            time (datetime): Time of the bars.
+
+        Returns:
+            List of execution responses, one per filled order.
+        """
+        try:
+            with self.lock:
+                fills = self.matching_engine.match(bars, time)
+            logging.info(f"{len(fills)} orders filled, {len(self.order_waitlist)} orders resting.")
+            return fills
+        except Exception as e:
+            handle_error(e)
+            return []
+
+    def submit_batch(self, orders, bars=None, time=None):
+        """
+        Submit a batch of orders, e.g. the rebalancing orders of a cross-sectional portfolio, and match the whole
+        batch in one pass of the matching engine.
+
+        Args:
+            orders (list): Order objects.
+            bars (dict or DataFrame): Bar of each symbol to match against, None leaves the orders resting until
+                match_bars is called with the bars of their symbols.
+            time (datetime): Time of the bars.
+
+        Returns:
+            dict: Consolidated response (see consolidate_responses) with the status of every order, and under
+            'fills' every fill of the pass, including those of orders already resting on the batch's symbols.
+        """
+        groups = group_orders(orders)
+        time = time or datetime.now()
+        added = []
+        try:
+            symbols = {symbol for _, symbol in groups}
+            bars = matching.bars_by_symbol(bars) if bars is not None else {}
+            bars = {symbol: bar for symbol, bar in bars.items() if symbol in symbols}
+
+            with self.lock:
+                for order in orders:
+                    if order not in self.order_waitlist:
+                        added.append(order)
+                    self.order_waitlist.add(order)
+                fill_list = self.matching_engine.match(bars, time) if bars else []
+            fills = {fill['order_id']: fill for fill in fill_list}
+
+            responses = []
+            for order in orders:
+                order_id = order.get_order_id()
+                fill = fills.get(order_id)
+                responses.append(fill or {'status': order.get_status(), 'order_id': order_id, 'time': time,
+                                          'message': 'Order is resting', 'executed_quantity': 0})
+            response = consolidate_responses(responses, groups)
+            response['fills'] = fill_list
+            logging.info(f"Batch of {len(orders)} orders in {len(groups)} groups: {response['message']}, "
+                         f"{len(fill_list)} fills.")
+            return response
+
+        except Exception as e:
+            handle_error(e)
+            with self.lock:
+                # Withdraw the orders of this batch that did not trade, the others keep their real status
+                for order in added:
+                    if not getattr(order, 'filled_quantity', 0):
+                        self.order_waitlist.discard(order)
+            responses = []
+            for order in orders:
+                resting = order in self.order_waitlist or getattr(order, 'filled_quantity', 0)
+                responses.append({'status': order.get_status() if resting else 'FAILED',
+                                  'order_id': order.get_order_id(), 'time': time, 'message': str(e),
+                                  'executed_quantity': getattr(order, 'filled_quantity', 0) if resting else 0})
+            response = consolidate_responses(responses, groups)
+            response['fills'] = []
+            return response
+
+    def cancel_batch(self, orders):
+        """
+        Cancel a batch of resting orders in one pass.
+
+        Args:
+            orders (list): Order objects.
+
+        Returns:
+            dict: Consolidated response (see consolidate_responses) with the status of every cancellation.
+        """
+        groups = group_orders(orders)
+        cancellation_time = datetime.now()
+        responses = []
+        with self.lock:
+            for order in orders:
+                order_id = order.get_order_id()
+                if order in self.order_waitlist and order.get_status() in order_book.RESTING_STATUSES:
+                    self.order_waitlist.remove(order)
+                    order.set_status('CANCELLED')
+                    order.set_cancellation_time(cancellation_time)
+                    responses.append({'status': 'SUCCESS', 'order_id': order_id, 'time': cancellation_time,
+                                      'message': 'Order canceled successfully'})
+                else:
+                    responses.append({'status': 'FAILED', 'order_id': order_id, 'time': cancellation_time,
+                                      'message': 'Order is not resting'})
+        response = consolidate_responses(responses, groups)
+        logging.info(f"Cancelled batch of {len(orders)} orders: {response['message']}.")
+        return response
+
+    def executing_order(self, order_id, order_quantity, symbol=None):
         """
         Execute the order.
 
         Args:
             order_id (str): The ID of the order.
             order_quantity (float): The quantity of assets in the order.
+            symbol (str): Symbol of the order, its volume is taken from the symbol's market (see take_volume).
 
         Returns:
             Tuple containing execution response and current volume after execution.
         """
         try:
-            # Check if there is enough volume to execute the order
-            if self.current_volume <= 0:
+            # Take what the current volume allows
+            executed_quantity = self.take_volume(symbol, order_quantity)
+            if executed_quantity <= 0:
                 logging.warning("Current volume is zero or negative. Exiting executing_order.")
                 status = "PENDING"
                 execution_time = datetime.now()
@@ -385,16 +677,14 @@ class ExecutingSystem:
                 remain_quantity = order_quantity
                 return exec_response, status, execution_time, remain_quantity
 
-            # Execute the order
-            executed_quantity = min(self.current_volume, order_quantity)
-            self.current_volume -= executed_quantity
             execution_time = datetime.now()
 
             # Define execution status and message
             if executed_quantity == order_quantity:
                 status = "SUCCESS"
                 message = 'Simulated execution is executed successfully'
-                self.order_waitlist.remove(order_id)
+                with self.lock:
+                    self.order_waitlist.remove(order_id)
             else:
                 status = "PARTIAL"
                 message = 'Simulated execution is partially executed'
@@ -482,9 +772,16 @@ class ExecutingSystem:
             # Placeholder for placing the order *
             # order_response = place_order(platform_connection, order)
 
-            # Simulate order execution
-            exec_response, status, execution_time, quantity = self.executing_order(order_id, order_quantity)
-            order.execute(status, execution_time, quantity)
+            # Simulate order execution, only the waitlist updates hold the shared lock
+            with self.lock:
+                self.order_waitlist.add(order)
+            exec_response, status, execution_time, quantity = self.executing_order(order_id, order_quantity,
+                                                                                   order.get_symbol())
+            with self.lock:
+                order.execute(status, execution_time, quantity)
+                if order in self.order_waitlist:
+                    # Partially executed, the order keeps resting with its new status
+                    self.order_waitlist.refresh(order)
 
             # Log execution result
             process_execution_response(exec_response)
@@ -511,8 +808,9 @@ class ExecutingSystem:
             # order_response = place_order(platform_connection, order)
 
             # Simulate order modification
-            modify_response, order_id, creation_time = self.modifying_order(order_id)
-            order.modify(order_args)
+            with self.lock:
+                modify_response, order_id, creation_time = self.modifying_order(order_id)
+                order.modify(order_args)
 
             process_modification_response(modify_response)
 
@@ -538,8 +836,9 @@ class ExecutingSystem:
             # order_response = place_order(platform_connection, order)
 
             # Simulate order cancellation
-            cancel_response, status, cancellation_time = self.cancelling_order(order_id)
-            order.cancel(status, cancellation_time)
+            with self.lock:
+                cancel_response, status, cancellation_time = self.cancelling_order(order_id)
+                order.cancel(status, cancellation_time)
 
             process_cancellation_response(cancel_response)
 
@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+因子计算缓存
+
+每条序列 (symbol, timeframe, 因子函数, 参数, 首根K线) 对应一个可增长的结果缓冲区，
+内存中为 LRU，可选的磁盘层以 .npy（内存映射读取）+ 元数据 pickle 的形式保存，
+每条序列只有一对文件，在条目被淘汰或 flush 时覆盖写入。
+输入数据在已缓存数据之后追加了新K线时，只用流式状态续算新增部分。
+每个条目保存已缓存K线的前缀摘要（按位置加权的校验和，追加K线时只累加新增部分），
+历史中任意一根K线被修正都会使摘要不一致并触发重算。
+返回的 Series / DataFrame 与缓存共享只读缓冲区，调用方不能原地修改缓存内容。
+"""
+import hashlib
+import logging
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from lib import factors_lib, factors_stream
+
+# 因子函数对应的流式状态类，用于续算追加的K线
+STREAM_STATES = {
+    'sma': factors_stream.SMAState,
+    'ma': factors_stream.MAState,
+    'rsi': factors_stream.RSIState,
+    'vwap': factors_stream.VWAPState,
+    'atr': factors_stream.ATRState,
+    'SuperTrend': factors_stream.SuperTrendState,
+    'aroon': factors_stream.AroonState,
+    'BB': factors_stream.BBState,
+}
+
+
+def row_fingerprint(data, fields, position):
+    """
+    计算一根K线参与计算的字段的指纹
+
+    :param data: 包含价格数据的 DataFrame
+    :param fields: 参与计算的列
+    :param position: 行号
+    :return: 十六进制指纹
+    """
+    values = np.array([data[field].iat[position] for field in fields], dtype=np.float64)
+    return hashlib.sha256(values.tobytes()).hexdigest()
+
+
+# 奇数乘子：模 2^64 下每个元素的贡献是双射，任意单个值的改动都会改变摘要
+_DIGEST_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def prefix_digest(data, fields, start=0, stop=None, digest=0):
+    """
+    计算 [start, stop) 行参与计算的字段按位置加权的校验和，并累加到已有摘要上
+
+    摘要只依赖行号和数值，对 [0, n) 的摘要续加 [n, m) 与直接计算 [0, m) 的结果相同。
+
+    :param data: 包含价格数据的 DataFrame
+    :param fields: 参与计算的列
+    :param start: 起始行号
+    :param stop: 结束行号（不含），None 表示到最后一行
+    :param digest: 前面各行的摘要
+    :return: 整数摘要
+    """
+    stop = len(data) if stop is None else stop
+    if stop <= start:
+        return digest
+    values = np.column_stack([data[field].iloc[start:stop].to_numpy(dtype=np.float64) for field in fields])
+    bits = np.ascontiguousarray(values).view(np.uint64)
+    positions = np.arange(start * len(fields), stop * len(fields), dtype=np.uint64).reshape(bits.shape)
+    # uint64 数组运算按模 2^64 回绕
+    weights = (positions * np.uint64(2) + np.uint64(1)) * _DIGEST_MULTIPLIER
+    return (digest + int((bits * weights).sum(dtype=np.uint64))) % (1 << 64)
+
+
+class FactorCache:
+    def __init__(self, cache_dir=None, max_entries=128):
+        """
+        Initialize the factor cache.
+
+        :param cache_dir: 磁盘缓存目录，None 表示只使用内存缓存
+        :param max_entries: 内存中最多保留的序列数
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.extensions = 0
+
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get(self, data, name, params=None, symbol=None, timeframe=None):
+        """
+        获取因子计算结果，命中缓存时直接返回，追加了新K线时只续算新增部分
+
+        :param data: 包含价格数据的 DataFrame
+        :param name: factors_lib 中的因子函数名
+        :param params: 因子参数字典
+        :param symbol: 交易对，如 'BTC/USDT'
+        :param timeframe: K线周期，如 '1m'
+        :return: 与 factors_lib 中对应函数相同形式的 Series 或 DataFrame
+        """
+        params = params or {}
+        length = len(data)
+        if not length:
+            return self._to_pandas(self._compute(data, name, params)['values'], name, data.index)
+        fields = factors_lib.FACTOR_ARRAYS[name][1]
+        key = (symbol, timeframe, name, tuple(sorted(params.items())), row_fingerprint(data, fields, 0))
+
+        entry = self._lookup(key, count_disk_hit=True)
+        cached = entry['length'] if entry is not None else 0
+        if entry is not None and cached <= length and \
+                entry.get('digest') == prefix_digest(data, fields, 0, cached):
+            if cached == length:
+                self.hits += 1
+            else:
+                entry = self._extend(key, entry, data, name, params)
+                self.extensions += 1
+        else:
+            entry = self._compute(data, name, params)
+            self.misses += 1
+
+        self._remember(key, entry)
+        return self._to_pandas(entry['values'][:length], name, data.index)
+
+    def _lookup(self, key, count_disk_hit=False):
+        """
+        依次在内存和磁盘中查找缓存条目
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        path = self._path(key)
+        if path is not None and os.path.exists(path + '.pkl'):
+            try:
+                with open(path + '.pkl', 'rb') as file:
+                    entry = pickle.load(file)
+                entry['values'] = np.load(path + '.npy', mmap_mode='r')
+            except (OSError, ValueError, EOFError, pickle.UnpicklingError) as e:
+                logging.warning(f"Ignoring unreadable factor cache file {path}: {str(e)}")
+                return None
+            if len(entry['values']) < entry['length']:
+                return None
+            entry['dirty'] = False
+            if count_disk_hit:
+                self.disk_hits += 1
+            self._remember(key, entry)
+            return entry
+        return None
+
+    def _compute(self, data, name, params):
+        columns = factors_lib.FACTOR_COLUMNS[name]
+        values = factors_lib.compute_factors(data, [(name, params)]).to_numpy()
+        fields = factors_lib.FACTOR_ARRAYS[name][1]
+        return {'length': len(data), 'digest': prefix_digest(data, fields), 'values': values, 'columns': columns, 'state': None,
+                'dirty': True}
+
+    def _extend(self, key, entry, data, name, params):
+        """
+        用流式状态续算新增的K线，写入可增长的缓冲区（容量按倍数增长，均摊 O(1)），
+        状态只在第一次续算时由历史数据的尾部恢复
+        """
+        length, columns = entry['length'], entry['columns']
+        try:
+            state = entry['state']
+            if state is None:
+                last_snapshot = dict(zip(columns, entry['values'][length - 1])) if length else None
+                state = STREAM_STATES[name](**params).resume(data.iloc[:length], last_snapshot)
+
+            new_rows = []
+            for bar in data.iloc[length:].to_dict('records'):
+                value = state.update(bar)
+                new_rows.append([value[column] for column in columns] if isinstance(value, dict) else [value])
+        except Exception:
+            # 状态可能已推进了一部分，丢弃该序列
+            self._memory.pop(key, None)
+            raise
+
+        values = entry['values']
+        if len(data) > len(values) or not values.flags.writeable:
+            grown = np.empty((max(len(data), 2 * len(values)), len(columns)), dtype=np.float64)
+            grown[:length] = values[:length]
+            values = grown
+        values[length:len(data)] = np.asarray(new_rows, dtype=np.float64)
+
+        fields = factors_lib.FACTOR_ARRAYS[name][1]
+        entry.update({'length': len(data), 'digest': prefix_digest(data, fields, length, len(data), entry['digest']),
+                      'values': values, 'state': state, 'dirty': True})
+        return entry
+
+    def _persist(self, key, entry):
+        """
+        覆盖写入序列的磁盘文件，先写临时文件再替换，读取方不会看到写了一半的文件
+        """
+        path = self._path(key)
+        if path is None or not entry.get('dirty'):
+            return
+        try:
+            with open(path + '.npy.tmp', 'wb') as file:
+                np.save(file, np.ascontiguousarray(entry['values'][:entry['length']]))
+            meta = {k: v for k, v in entry.items() if k not in ('values', 'dirty')}
+            with open(path + '.pkl.tmp', 'wb') as file:
+                pickle.dump(meta, file)
+            os.replace(path + '.npy.tmp', path + '.npy')
+            os.replace(path + '.pkl.tmp', path + '.pkl')
+            entry['dirty'] = False
+        except OSError as e:
+            logging.warning(f"Could not save factor cache file {path}: {str(e)}")
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._persist(*self._memory.popitem(last=False))
+
+    def flush(self):
+        """
+        将内存中有更新的序列写入磁盘缓存
+        """
+        for key, entry in self._memory.items():
+            self._persist(key, entry)
+
+    def _path(self, key):
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, hashlib.sha256(repr(key).encode()).hexdigest()[:32])
+
+    @staticmethod
+    def _to_pandas(values, name, index):
+        # 只读视图：调用方原地写入时报错，而不是悄悄改掉缓存
+        values = values.view()
+        values.flags.writeable = False
+        columns = factors_lib.FACTOR_COLUMNS[name]
+        if name in ('aroon', 'BB', 'SuperTrend'):
+            return pd.DataFrame(values, index=index, columns=columns)
+        return pd.Series(values[:, 0], index=index)
+
+    def stats(self):
+        """
+        缓存命中统计
+
+        :return: 含 hits、disk_hits、extensions、misses 和 hit_rate 的字典
+        """
+        requests = self.hits + self.extensions + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'extensions': self.extensions,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.extensions) / requests if requests else 0.0,
+            'entries': len(self._memory),
+        }
+
+    def log_stats(self):
+        logging.info(f"Factor cache stats: {self.stats()}")
+
+    def clear(self):
+        """
+        清空内存缓存和命中统计，磁盘缓存保留（有更新的序列先写入磁盘）
+        """
+        self.flush()
+        self._memory.clear()
+        self.hits = self.disk_hits = self.misses = self.extensions = 0
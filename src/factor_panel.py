@@ -0,0 +1,248 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+多币种面板因子引擎
+
+把 okx.CryptoDataFetcher 生成的长表（timestamp, symbol, open, high, low, close, volume）
+一次性透视为 (时间 × 品种) 数组，再用 factors_lib 的数组版本同时计算全部币种的因子，
+输出可直接用于 groupby('time') 排名的长表，不再需要逐币种的 groupby 循环。
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from lib import data_lake, factors_lib
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def _compute_arrays(fields, factors):
+    results = []
+    for name, params in factors:
+        func, inputs = factors_lib.FACTOR_ARRAYS[name]
+        output = func(*(fields[field] for field in inputs), **(params or {}))
+        results.extend(output if isinstance(output, tuple) else (output,))
+    return results
+
+
+def _compute_block(fields, factors, valid=None):
+    """
+    在一个币种分块上计算全部因子，供进程池调用
+
+    每个币种只在自己有K线的行上计算，缺失的行不参与滑动窗口，结果与逐币种调用 compute_factors 一致。
+    有K线的行完全相同的币种作为一组，压缩掉缺失行后一起向量化计算。
+
+    :param fields: {字段名: (时间 × 分块币种数) 数组}
+    :param factors: [(因子函数名, 参数字典), ...]
+    :param valid: (时间 × 分块币种数) 布尔数组，标记币种在该时间是否有K线，None 表示全部都有
+    :return: 与 factors_lib.factor_columns(factors) 顺序一致的数组列表，缺失的行为 NaN
+    """
+    if valid is None or valid.all():
+        return _compute_arrays(fields, factors)
+
+    groups = {}
+    for column in range(valid.shape[1]):
+        groups.setdefault(valid[:, column].tobytes(), []).append(column)
+
+    results = None
+    for columns in groups.values():
+        rows = np.flatnonzero(valid[:, columns[0]])
+        if not len(rows):
+            continue
+        block = np.ix_(rows, columns)
+        outputs = _compute_arrays({field: values[block] for field, values in fields.items()}, factors)
+        if results is None:
+            results = [np.full(valid.shape, np.nan) for _ in outputs]
+        for result, output in zip(results, outputs):
+            result[block] = output
+    if results is None:
+        results = [np.full(valid.shape, np.nan) for _ in factors_lib.factor_columns(factors)]
+    return results
+
+
+class FactorPanel:
+    def __init__(self, times, symbols, fields, valid=None):
+        """
+        Initialize a (time × symbol) panel.
+
+        :param times: 排好序的时间数组，对应面板的行
+        :param symbols: 币种数组，对应面板的列
+        :param fields: {字段名: (时间 × 币种) float64 数组}，某币种在某时间没有K线时为 NaN
+        :param valid: 可选的 (时间 × 币种) 布尔数组，标记币种在该时间是否有K线，None 表示全部都有
+        """
+        self.times = times
+        self.symbols = symbols
+        self.fields = fields
+        self.valid = valid
+
+    @classmethod
+    def from_frame(cls, data, fields=PRICE_FIELDS, time_column='timestamp', symbol_column='symbol',
+                   duplicates='raise'):
+        """
+        把长表一次性透视为面板
+
+        :param data: 含时间列、币种列和价格字段的长表 DataFrame
+        :param fields: 需要透视的价格字段
+        :param time_column: 时间列名
+        :param symbol_column: 币种列名
+        :param duplicates: 同一 (时间, 币种) 出现多行时的处理：'raise' 抛出 ValueError，'first' / 'last' 保留第一行 / 最后一行
+        :return: FactorPanel
+        """
+        times, time_index = np.unique(data[time_column].to_numpy(), return_inverse=True)
+        symbols, symbol_index = np.unique(data[symbol_column].to_numpy(), return_inverse=True)
+        time_index, symbol_index = time_index.ravel(), symbol_index.ravel()
+
+        rows = np.arange(len(data))
+        cells = time_index * len(symbols) + symbol_index
+        unique_cells, first_rows = np.unique(cells, return_index=True)
+        if len(unique_cells) < len(cells):
+            if duplicates == 'raise':
+                raise ValueError(f"{len(cells) - len(unique_cells)} duplicate ({time_column}, {symbol_column}) rows, "
+                                 f"pass duplicates='first' or 'last' to keep one of them")
+            if duplicates == 'first':
+                rows = first_rows
+            elif duplicates == 'last':
+                _, last_rows = np.unique(cells[::-1], return_index=True)
+                rows = len(cells) - 1 - last_rows
+            else:
+                raise ValueError(f"Unknown duplicates option: {duplicates}")
+            time_index, symbol_index = time_index[rows], symbol_index[rows]
+
+        valid = np.zeros((len(times), len(symbols)), dtype=bool)
+        valid[time_index, symbol_index] = True
+        arrays = {}
+        for field in fields:
+            values = np.full((len(times), len(symbols)), np.nan)
+            values[time_index, symbol_index] = data[field].to_numpy(dtype=np.float64)[rows]
+            arrays[field] = values
+        return cls(times, symbols, arrays, None if valid.all() else valid)
+
+    @classmethod
+    def from_feather(cls, file_path, fields=PRICE_FIELDS, symbols=None):
+        """
+        读取 CryptoDataFetcher 写出的 feather 文件并透视为面板
+
+        :param file_path: feather 文件路径
+        :param fields: 需要读取的价格字段
+        :param symbols: 可选的币种列表，只保留这些币种
+        :return: FactorPanel
+        """
+        data = pd.read_feather(file_path, columns=['timestamp', 'symbol', *fields])
+        if symbols is not None:
+            data = data[data['symbol'].isin(symbols)]
+        return cls.from_frame(data, fields)
+
+    @classmethod
+    def from_lake(cls, lake, timeframe, fields=PRICE_FIELDS, symbols=None, start=None, end=None):
+        """
+        从分区数据湖读取并透视为面板，只打开清单中与币种和时间范围重叠的分区
+
+        :param lake: data_lake.MarketDataLake，或数据湖根目录
+        :param timeframe: K线周期，如 '12h'
+        :param fields: 需要读取的价格字段
+        :param symbols: 可选的币种列表
+        :param start: 起始时间
+        :param end: 结束时间
+        :return: FactorPanel
+        """
+        if not isinstance(lake, data_lake.MarketDataLake):
+            lake = data_lake.MarketDataLake(lake)
+        return cls.from_frame(lake.read_many(timeframe, symbols, start, end, list(fields)), fields)
+
+    def compute(self, name, **params):
+        """
+        对全部币种计算单个因子
+
+        :param name: factors_lib 中的因子函数名，如 'BB'、'atr'
+        :param params: 因子参数
+        :return: {输出列名: (时间 × 币种) 数组}
+        """
+        columns = factors_lib.FACTOR_COLUMNS[name]
+        return dict(zip(columns, _compute_block(self.fields, [(name, params)], self.valid)))
+
+    def compute_many(self, factors, workers=None, block_size=None):
+        """
+        对全部币种计算一组因子，按币种分块分发到进程池
+
+        :param factors: [(因子函数名, 参数字典), ...]
+        :param workers: 进程数，None 表示使用 CPU 核数，1 表示在当前进程计算
+        :param block_size: 每个分块的币种数，默认按进程数均分
+        :return: {输出列名: (时间 × 币种) 数组}
+        """
+        columns = factors_lib.factor_columns(factors)
+        workers = workers or os.cpu_count() or 1
+        num_symbols = len(self.symbols)
+
+        if workers == 1 or num_symbols < 2:
+            return dict(zip(columns, _compute_block(self.fields, factors, self.valid)))
+
+        block_size = block_size or -(-num_symbols // workers)
+        blocks = [slice(start, start + block_size) for start in range(0, num_symbols, block_size)]
+        outputs = {column: np.empty((len(self.times), num_symbols)) for column in columns}
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_compute_block,
+                                       {field: values[:, block] for field, values in self.fields.items()},
+                                       factors, None if self.valid is None else self.valid[:, block])
+                       for block in blocks]
+            for block, future in zip(blocks, futures):
+                for column, values in zip(columns, future.result()):
+                    outputs[column][:, block] = values
+
+        logging.info(f"Computed {len(columns)} factor columns for {num_symbols} symbols in {len(blocks)} blocks")
+        return outputs
+
+    def to_frame(self, outputs, dropna_field='close'):
+        """
+        把面板因子展开成长表，便于按时间截面排名
+
+        :param outputs: compute / compute_many 的结果
+        :param dropna_field: 该字段为 NaN 的行（币种在该时间没有K线）会被丢弃，None 表示保留全部
+        :return: 含 time、symbol 及各因子列的 DataFrame，按 time、symbol 排序
+        """
+        num_times, num_symbols = len(self.times), len(self.symbols)
+        table = pd.DataFrame({
+            'time': np.repeat(self.times, num_symbols),
+            'symbol': np.tile(self.symbols, num_times),
+        })
+        for column, values in outputs.items():
+            table[column] = values.ravel()
+
+        if dropna_field is not None:
+            table = table[~np.isnan(self.fields[dropna_field].ravel())].reset_index(drop=True)
+        return table
+
+
+def compute_panel_factors(file_path, factors, workers=None, symbols=None):
+    """
+    从长表 feather 文件计算全部币种的因子表
+
+    :param file_path: CryptoDataFetcher 写出的 feather 文件
+    :param factors: [(因子函数名, 参数字典), ...]
+    :param workers: 进程数
+    :param symbols: 可选的币种列表
+    :return: 含 time、symbol 及各因子列的 DataFrame
+    """
+    panel = FactorPanel.from_feather(file_path, symbols=symbols)
+    return panel.to_frame(panel.compute_many(factors, workers=workers))
+
+
+# Test
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    frames = []
+    for symbol in ['BTC/USDT:USDT', 'ETH/USDT:USDT', 'SOL/USDT:USDT']:
+        close = 100 + np.cumsum(rng.normal(0, 1, 50))
+        frames.append(pd.DataFrame({
+            'timestamp': pd.date_range('2024-01-01', periods=50, freq='12h'),
+            'open': close, 'high': close + 1, 'low': close - 1, 'close': close,
+            'volume': rng.uniform(1, 10, 50), 'symbol': symbol,
+        }))
+
+    test_panel = FactorPanel.from_frame(pd.concat(frames, ignore_index=True))
+    factor_table = test_panel.to_frame(test_panel.compute_many([('BB', {'window': 20}), ('atr', {'period': 14})],
+                                                               workers=2))
+    print(factor_table.tail())
@@ -3,153 +3,544 @@
 
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 
+try:
+    from numba import njit
+except ImportError:  # numba 为可选依赖，缺失时退回纯 NumPy 循环
+    njit = None
 
-def sma(data, window=10):
+
+def _column(data, name):
+    """
+    取出只读的 float64 列视图，不复制也不修改调用方的 DataFrame
+
+    :param data: 包含价格数据的 DataFrame
+    :param name: 列名
+    :return: 只读的 numpy 数组
+    """
+    values = np.asarray(data[name], dtype=np.float64).view()
+    values.flags.writeable = False
+    return values
+
+
+def _output(out, shape):
+    """
+    返回可写入的输出缓冲区：未提供时新分配，提供时检查形状后直接复用
+    """
+    if out is None:
+        return np.empty(shape, dtype=np.float64)
+    if out.shape != shape:
+        raise ValueError(f"out has shape {out.shape}, expected {shape}")
+    return out
+
+
+# 不超过该窗口时逐个窗口偏移累加（O(n·window)，无中间矩阵）更快，更大的窗口改用 pandas 的 O(n) 滑动算法
+MEAN_LOOP_MAX_WINDOW = 32
+STD_LOOP_MAX_WINDOW = 16
+
+
+def _rolling_pandas(values, window, out, min_periods=None, how='mean'):
+    """
+    用 pandas 的 O(n) 滑动窗口计算沿第 0 轴的 mean 或 std，结果写入 out
+    """
+    rolling = pd.DataFrame(values.reshape(values.shape[0], -1)).rolling(window, min_periods=min_periods)
+    result = rolling.mean() if how == 'mean' else rolling.std()
+    np.copyto(out, result.to_numpy().reshape(values.shape))
+    return out
+
+
+def _rolling_mean(values, window, out, min_periods=None):
+    """
+    沿第 0 轴的滑动平均，结果直接写入 out，不生成 (时间 × 窗口) 的中间矩阵
+
+    :param values: 一维数组或 (时间 × 品种) 二维数组
+    :param window: 窗口大小
+    :param out: 与 values 形状相同的输出缓冲区
+    :param min_periods: 为 None 时前 window - 1 个位置为 NaN；为 1 时用已有数据求平均（输入不能含 NaN）
+    :return: out
+    """
+    if window > MEAN_LOOP_MAX_WINDOW:
+        return _rolling_pandas(values, window, out, min_periods)
+    n = values.shape[0]
+    m = n - window + 1
+    head = out[:min(window - 1, n)]
+    if min_periods is None:
+        head[...] = np.nan
+    elif head.shape[0]:
+        np.cumsum(values[:head.shape[0]], axis=0, out=head)
+        head /= np.arange(1, head.shape[0] + 1).reshape((-1,) + (1,) * (values.ndim - 1))
+    if m <= 0:
+        return out
+
+    body = out[window - 1:]
+    np.copyto(body, values[:m])
+    for k in range(1, window):
+        np.add(body, values[k:k + m], out=body)
+    body /= window
+    return out
+
+
+def _rolling_std(values, window, mean, out):
+    """
+    沿第 0 轴的滑动样本标准差（ddof=1），基于已算好的滑动平均做两遍法，数值上与 pandas 一致
+
+    :param values: 一维数组或 (时间 × 品种) 二维数组
+    :param window: 窗口大小
+    :param mean: values 的滑动平均
+    :param out: 与 values 形状相同的输出缓冲区
+    :return: out
+    """
+    if window > STD_LOOP_MAX_WINDOW:
+        return _rolling_pandas(values, window, out, how='std')
+    n = values.shape[0]
+    m = n - window + 1
+    out[:min(window - 1, n)] = np.nan
+    if m <= 0:
+        return out
+    if window < 2:
+        out[...] = np.nan
+        return out
+
+    body = out[window - 1:]
+    body[...] = 0
+    deviation = np.empty(body.shape, dtype=np.float64)
+    for k in range(window):
+        np.subtract(values[k:k + m], mean[window - 1:], out=deviation)
+        np.multiply(deviation, deviation, out=deviation)
+        body += deviation
+    body /= window - 1
+    np.sqrt(body, out=body)
+    return out
+
+
+def _cumsum_skipna(values, out):
+    """
+    沿第 0 轴累加并跳过 NaN，NaN 所在位置仍为 NaN，与 pandas 的 cumsum 一致
+    """
+    nan_mask = np.isnan(values)
+    np.nancumsum(values, axis=0, out=out)
+    out[nan_mask] = np.nan
+    return out
+
+
+def sma_arrays(close, window=10, out=None):
+    """
+    基于数组计算简单移动平均线（SMA）
+
+    :param close: 收盘价数组
+    :param window: 移动平均窗口大小
+    :param out: 可选的预分配输出数组
+    :return: SMA 数组
+    """
+    return _rolling_mean(close, window, _output(out, close.shape))
+
+
+def sma(data, window=10, out=None):
     """
     计算简单移动平均线（SMA）
 
     :param data: 包含股票价格数据的 DataFrame
     :param window: 移动平均窗口大小
-    :return: 在原始数据上添加了SMA列的 DataFrame
+    :param out: 可选的预分配输出数组，提供时结果写入其中并返回该数组
+    :return: SMA 的 Series
     """
 
-    result = data['close'].rolling(window=window).mean()
-    return result
+    result = sma_arrays(_column(data, 'close'), window, out)
+    return result if out is not None else pd.Series(result, index=data.index)
+
+
+def rsi_arrays(close, window=14, out=None):
+    """
+    基于数组计算相对强度指数（RSI）
+
+    :param close: 收盘价数组
+    :param window: RSI 窗口大小
+    :param out: 可选的预分配输出数组
+    :return: RSI 数组
+    """
+    out = _output(out, close.shape)
+
+    gain = np.zeros(close.shape, dtype=np.float64)
+    np.subtract(close[1:], close[:-1], out=gain[1:])
+    loss = np.negative(gain)
+    # fmax 把缺失的价格变化当作 0，与 pandas 的 where 一致
+    np.fmax(gain, 0, out=gain)
+    np.fmax(loss, 0, out=loss)
+
+    avg_gain = _rolling_mean(gain, window, out, min_periods=1)
+    avg_loss = _rolling_mean(loss, window, gain, min_periods=1)
 
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(avg_gain, avg_loss, out=out)
+        out += 1
+        np.divide(100, out, out=out)
+        np.subtract(100, out, out=out)
+    return out
 
-def rsi(data, window=14):
+
+def rsi(data, window=14, out=None):
     """
     计算相对强度指数（RSI）
 
     :param data: 包含股票价格数据的 DataFrame
     :param window: RSI 窗口大小
-    :return: 在原始数据上添加了RSI列的 DataFrame
+    :param out: 可选的预分配输出数组，提供时结果写入其中并返回该数组
+    :return: RSI 的 Series
     """
 
-    delta = data['close'].diff()
-    gain = delta.where(delta > 0, 0)
-    loss = -delta.where(delta < 0, 0)
+    result = rsi_arrays(_column(data, 'close'), window, out)
+    return result if out is not None else pd.Series(result, index=data.index)
+
 
-    avg_gain = gain.rolling(window=window, min_periods=1).mean()
-    avg_loss = loss.rolling(window=window, min_periods=1).mean()
+def vwap_arrays(close, low, high, volume, out=None):
+    """
+    基于数组计算成交量加权平均价（VWAP）
+
+    :param close: 收盘价数组
+    :param low: 最低价数组
+    :param high: 最高价数组
+    :param volume: 成交量数组
+    :param out: 可选的预分配输出数组
+    :return: VWAP 数组
+    """
+    out = _output(out, close.shape)
 
-    result = 100 - (100 / (1 + avg_gain / avg_loss))
-    return result
+    np.add(close, low, out=out)
+    out += high
+    out /= 3
+    out *= volume
+    _cumsum_skipna(out, out)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out /= _cumsum_skipna(volume, np.empty(volume.shape, dtype=np.float64))
+    return out
 
 
-def vwap(data):
+def vwap(data, out=None):
     """
     计算成交量加权平均价（VWAP）
 
     :param data: 包含股票价格和成交量数据的 DataFrame，必须包含 'close'（收盘价）和 'volume'（成交量）列
-    :return: 在原始数据上添加了 VWAP 列的 DataFrame
+    :param out: 可选的预分配输出数组，提供时结果写入其中并返回该数组
+    :return: VWAP 的 Series
     """
 
-    result = (((data['close'] + data['low'] + data['high']) / 3 * data['volume']).cumsum() /
-              data['volume'].cumsum())
-    return result
+    result = vwap_arrays(_column(data, 'close'), _column(data, 'low'), _column(data, 'high'),
+                         _column(data, 'volume'), out)
+    return result if out is not None else pd.Series(result, index=data.index)
 
 
-def atr(data, period=14):
+def atr_arrays(high, low, close, period=14, out=None):
+    """
+    基于数组计算平均真实范围（ATR）
+
+    :param high: 最高价数组
+    :param low: 最低价数组
+    :param close: 收盘价数组
+    :param period: ATR 计算的周期，默认为 14
+    :param out: 可选的预分配输出数组
+    :return: ATR 数组
+    """
+    out = _output(out, close.shape)
+
+    # 计算 True Range（TR），用 fmax 忽略首根K线缺失的前收盘价
+    true_range = np.subtract(high, low)
+    np.abs(true_range, out=true_range)
+    if close.shape[0] > 1:
+        gap = np.empty(close[1:].shape, dtype=np.float64)
+        for price in (high, low):
+            np.subtract(price[1:], close[:-1], out=gap)
+            np.abs(gap, out=gap)
+            np.fmax(true_range[1:], gap, out=true_range[1:])
+
+    # 计算 ATR
+    return _rolling_mean(true_range, period, out)
+
+
+def atr(data, period=14, out=None):
     """
     计算平均真实范围（ATR）
 
     :param data: 包含股票价格数据的 DataFrame，必须包含 'high'（最高价）、'low'（最低价）和 'close'（收盘价）列
     :param period: ATR 计算的周期，默认为 14
-    :return: 在原始数据上添加了 ATR 列的 DataFrame
+    :param out: 可选的预分配输出数组，提供时结果写入其中并返回该数组
+    :return: ATR 的 Series
     """
 
-    # 计算 True Range（TR）
-    data['tr0'] = abs(data['high'] - data['low'])
-    data['tr1'] = abs(data['high'] - data['close'].shift())
-    data['tr2'] = abs(data['low'] - data['close'].shift())
-    true_range = data[['tr0', 'tr1', 'tr2']].max(axis=1)
+    result = atr_arrays(_column(data, 'high'), _column(data, 'low'), _column(data, 'close'), period, out)
+    return result if out is not None else pd.Series(result, index=data.index)
 
-    # 计算 ATR
-    result = true_range.rolling(window=period).mean()
 
-    return result
+def _supertrend_loop(close, upper_band, lower_band, out):
+    """
+    SuperTrend 递推内核，只处理 float64 数组
+
+    :param close: 收盘价数组
+    :param upper_band: 上轨数组
+    :param lower_band: 下轨数组
+    :param out: 输出数组，无法确定的位置写入 NaN
+    """
+    n = close.shape[0]
+    if n == 0:
+        return
+    out[0] = np.nan
+    for i in range(1, n):
+        if close[i - 1] <= upper_band[i - 1]:
+            out[i] = upper_band[i]
+        elif close[i - 1] >= lower_band[i - 1]:
+            out[i] = lower_band[i]
+        else:
+            out[i] = out[i - 1]
+
+
+# 安装了 numba 时使用 JIT 编译的内核，否则直接运行 NumPy 版本。不使用 cache=True：磁盘缓存按文件路径查找、
+# 按模块名加载，本文件先后以 factors_lib 和 lib.factors_lib 导入时加载缓存会失败
+_supertrend_kernel = njit(_supertrend_loop) if njit is not None else _supertrend_loop
+
 
+def supertrend_arrays(high, low, close, period=14, multiplier=3, out=None):
+    """
+    基于数组计算 SuperTrend 指标
 
-def SuperTrend(data, period=14, multiplier=3):
+    :param high: 最高价数组
+    :param low: 最低价数组
+    :param close: 收盘价数组
+    :param period: ATR 计算的周期，默认为 14
+    :param multiplier: SuperTrend 的倍数，默认为 3
+    :param out: 可选的预分配输出数组
+    :return: SuperTrend 数组
+    """
+    out = _output(out, close.shape)
+
+    # 上一根K线的 ATR 乘以倍数，作为当前K线上下轨的宽度
+    band_width = np.empty(close.shape, dtype=np.float64)
+    band_width[:1] = np.nan
+    atr_arrays(high[:-1], low[:-1], close[:-1], period, out=band_width[1:])
+    band_width *= multiplier
+
+    # 计算基础 Super-trend
+    hl2 = np.add(high, low)
+    hl2 /= 2
+    upper_band = np.add(hl2, band_width)
+    lower_band = np.subtract(hl2, band_width, out=band_width)
+
+    if close.ndim == 1:
+        _supertrend_kernel(close, upper_band, lower_band, out)
+    else:
+        # (时间 × 品种) 二维数组按列递推
+        for column in range(close.shape[1]):
+            _supertrend_kernel(close[:, column], upper_band[:, column], lower_band[:, column], out[:, column])
+    return out
+
+
+def SuperTrend(data, period=14, multiplier=3, out=None):
     """
     计算 SuperTrend 指标
 
     :param data: 包含股票价格数据的 DataFrame，必须包含 'high'（最高价）、'low'（最低价）和 'close'（收盘价）列
     :param period: ATR 计算的周期，默认为 14
     :param multiplier: SuperTrend 的倍数，默认为 3
-    :return: 在原始数据上添加了 SuperTrend 列的 DataFrame
+    :param out: 可选的预分配输出数组，提供时结果写入其中并返回该数组
+    :return: 含 SuperTrend 列的 DataFrame
     """
 
-    result = pd.DataFrame(index=data.index)  # Initialize result DataFrame with the same index as data
+    result = supertrend_arrays(_column(data, 'high'), _column(data, 'low'), _column(data, 'close'),
+                               period, multiplier, out)
+    if out is not None:
+        return result
+    return pd.DataFrame({'SuperTrend': result}, index=data.index)
 
-    # 计算 ATR
-    ATR = atr(data, period)
 
-    # 计算基础 Super-trend
-    upper_band = (data['high'] + data['low']) / 2 + multiplier * ATR.shift()
-    lower_band = (data['high'] + data['low']) / 2 - multiplier * ATR.shift()
-
-    result['SuperTrend'] = None
-    for i in range(1, len(data)):
-        if data['close'][i - 1] <= upper_band[i - 1]:
-            result['SuperTrend'][i] = upper_band[i]
-        elif data['close'][i - 1] >= lower_band[i - 1]:
-            result['SuperTrend'][i] = lower_band[i]
-        else:
-            result['SuperTrend'][i] = result['SuperTrend'][i - 1]
+def _rolling_arg_extreme(values, window, arg_func, out):
+    """
+    滑动窗口内极值的位置（0 为窗口中最早的K线），基于步长视图一次完成，不回调 Python
 
-    return result
+    :param values: 一维数组或 (时间 × 品种) 二维数组
+    :param window: 窗口大小
+    :param arg_func: np.argmax 或 np.argmin，相同极值取最早出现的位置
+    :param out: 与 values 形状相同的输出缓冲区，窗口不完整或含 NaN 时为 NaN
+    :return: out
+    """
+    out[:min(window - 1, values.shape[0])] = np.nan
+    if window < 1 or values.shape[0] < window:
+        out[...] = np.nan
+        return out
+
+    windows = sliding_window_view(values, window, axis=0)
+    body = out[window - 1:]
+    body[...] = arg_func(windows, axis=-1)
+
+    # 用累计计数判断窗口内是否含 NaN，避免生成 (时间 × 窗口) 的布尔矩阵
+    nan_count = np.cumsum(np.isnan(values), axis=0)
+    window_nan = nan_count[window - 1:].copy()
+    window_nan[1:] -= nan_count[:-window]
+    body[window_nan > 0] = np.nan
+    return out
 
 
-def aroon(data, window=14):
+def aroon_arrays(high, low, window=14, out=None):
+    """
+    基于数组计算 Aroon 指标，支持 (时间 × 品种) 二维数组批量计算
+
+    :param high: 最高价数组
+    :param low: 最低价数组
+    :param window: Aroon 计算的周期，默认为 14
+    :param out: 可选的 (aroon_up, aroon_down) 预分配输出数组
+    :return: (aroon_up, aroon_down) 两个数组
+    """
+    out = (None, None) if out is None else out
+    results = (_output(out[0], high.shape), _output(out[1], low.shape))
+    for values, arg_func, result in zip((high, low), (np.argmax, np.argmin), results):
+        _rolling_arg_extreme(values, window, arg_func, result)
+        np.subtract(window + 1, result, out=result)
+        result *= 100 / window
+    return results
+
+
+def aroon(data, window=14, out=None):
     """
     计算 Aroon 指标
 
     :param data: 包含股票价格数据的 DataFrame，必须包含 'high'（最高价）和 'low'（最低价）列
     :param window: Aroon 计算的周期，默认为 14
-    :return: 在原始数据上添加了 Aroon Up 和 Aroon Down 列的 DataFrame
+    :param out: 可选的 (行数 × 2) 预分配输出数组，提供时结果写入其中并返回该数组
+    :return: 含 aroon_up 和 aroon_down 列的 DataFrame
     """
 
-    result = pd.DataFrame(index=data.index)  # Initialize result DataFrame with the same index as data
-    result['aroon_up'] = (window - data['high'].rolling(window=window).apply(np.argmax) + 1) / window * 100
-    result['aroon_down'] = (window - data['low'].rolling(window=window).apply(np.argmin) + 1) / window * 100
-    return result
+    columns = None if out is None else (out[:, 0], out[:, 1])
+    aroon_up, aroon_down = aroon_arrays(_column(data, 'high'), _column(data, 'low'), window, columns)
+    if out is not None:
+        return out
+    return pd.DataFrame({'aroon_up': aroon_up, 'aroon_down': aroon_down}, index=data.index)
 
 
-def ma(data, window=20):
+def ma_arrays(close, window=20, out=None):
+    """
+    基于数组计算移动平均线（MA）
+
+    :param close: 收盘价数组
+    :param window: 移动平均窗口大小，默认为 20
+    :param out: 可选的预分配输出数组
+    :return: MA 数组
+    """
+    return sma_arrays(close, window, out)
+
+
+def ma(data, window=20, out=None):
     """
     计算移动平均线（MA）
 
     :param data: 包含股票价格数据的 DataFrame，必须包含 'close'（收盘价）列
     :param window: 移动平均窗口大小，默认为 20
-    :return: MA 列的 DataFrame
+    :param out: 可选的预分配输出数组，提供时结果写入其中并返回该数组
+    :return: MA 的 Series
+    """
+
+    result = ma_arrays(_column(data, 'close'), window, out)
+    return result if out is not None else pd.Series(result, index=data.index)
+
+
+def bb_arrays(close, window=20, num_std_dev=2, out=None):
+    """
+    基于数组计算布林带指标
+
+    :param close: 收盘价数组
+    :param window: 移动平均窗口大小，默认为 20
+    :param num_std_dev: 布林带宽度为移动平均的标准差倍数，默认为 2
+    :param out: 可选的 (upper_band, lower_band, middle_band) 预分配输出数组
+    :return: (upper_band, lower_band, middle_band) 三个数组
     """
+    out = (None, None, None) if out is None else out
+    upper_band, lower_band, middle_band = (_output(buffer, close.shape) for buffer in out)
 
-    result = data['close'].rolling(window=window).mean()
-    return result
+    _rolling_mean(close, window, middle_band)
+    # 先把标准差乘以倍数放在上轨缓冲区，再据此得到上下轨
+    _rolling_std(close, window, middle_band, upper_band)
+    upper_band *= num_std_dev
+    np.subtract(middle_band, upper_band, out=lower_band)
+    upper_band += middle_band
+    return upper_band, lower_band, middle_band
 
 
-def BB(data, window=20, num_std_dev=2):
+def BB(data, window=20, num_std_dev=2, out=None):
     """
     计算布林带指标
 
     :param data: 包含股票价格数据的 DataFrame，必须包含 'close'（收盘价）列
     :param window: 移动平均窗口大小，默认为 20
     :param num_std_dev: 布林带宽度为移动平均的标准差倍数，默认为 2
+    :param out: 可选的 (行数 × 3) 预分配输出数组，提供时结果写入其中并返回该数组
     :return: 含上轨、中轨和下轨列的 DataFrame
     """
-    result = pd.DataFrame(index=data.index)  # Initialize result DataFrame with the same index as data
 
-    MA = (ma(data, window=window))
-    data['std'] = data['close'].rolling(window=window).std()
+    columns = None if out is None else (out[:, 0], out[:, 1], out[:, 2])
+    upper_band, lower_band, middle_band = bb_arrays(_column(data, 'close'), window, num_std_dev, columns)
+    if out is not None:
+        return out
+    return pd.DataFrame({'upper_band': upper_band, 'lower_band': lower_band, 'middle_band': middle_band},
+                        index=data.index)
+
+
+# 因子函数及其输出列名，用于把一组因子写入同一个预分配矩阵
+FACTOR_COLUMNS = {
+    'sma': ['sma'],
+    'ma': ['ma'],
+    'rsi': ['rsi'],
+    'vwap': ['vwap'],
+    'atr': ['atr'],
+    'SuperTrend': ['SuperTrend'],
+    'aroon': ['aroon_up', 'aroon_down'],
+    'BB': ['upper_band', 'lower_band', 'middle_band'],
+}
+
+
+# 因子函数对应的数组版本及其需要的价格字段，数组版本均支持 (时间 × 品种) 二维输入
+FACTOR_ARRAYS = {
+    'sma': (sma_arrays, ('close',)),
+    'ma': (ma_arrays, ('close',)),
+    'rsi': (rsi_arrays, ('close',)),
+    'vwap': (vwap_arrays, ('close', 'low', 'high', 'volume')),
+    'atr': (atr_arrays, ('high', 'low', 'close')),
+    'SuperTrend': (supertrend_arrays, ('high', 'low', 'close')),
+    'aroon': (aroon_arrays, ('high', 'low')),
+    'BB': (bb_arrays, ('close',)),
+}
+
+
+def factor_columns(factors):
+    """
+    生成因子矩阵的列名，参数值拼接在列名之后，如 'atr_14'、'upper_band_20_2'
 
-    result['upper_band'] = MA + num_std_dev * data['std']
-    result['lower_band'] = MA - num_std_dev * data['std']
-    result['middle_band'] = MA
+    :param factors: [(因子函数名, 参数字典), ...]
+    :return: 列名列表
+    """
+    columns = []
+    for name, params in factors:
+        suffix = ''.join(f"_{value}" for value in (params or {}).values())
+        columns.extend(f"{column}{suffix}" for column in FACTOR_COLUMNS[name])
+    return columns
 
-    return result
+
+def compute_factors(data, factors, out=None):
+    """
+    把一组因子计算到同一个预分配矩阵中，每个因子直接写入自己的列，不产生中间 DataFrame
+
+    :param data: 包含价格数据的 DataFrame
+    :param factors: [(因子函数名, 参数字典), ...]，如 [('BB', {'window': 20}), ('atr', {'period': 14})]
+    :param out: 可选的 (行数 × 总列数) 预分配矩阵，可在多次调用间复用
+    :return: 与矩阵共享内存的因子 DataFrame
+    """
+    columns = factor_columns(factors)
+    out = _output(out, (len(data), len(columns)))
+
+    position = 0
+    for name, params in factors:
+        width = len(FACTOR_COLUMNS[name])
+        target = out[:, position] if width == 1 else out[:, position:position + width]
+        globals()[name](data, out=target, **(params or {}))
+        position += width
+
+    return pd.DataFrame(out, index=data.index, columns=columns, copy=False)
 
 
 # Test
@@ -163,31 +554,36 @@ if __name__ == "__main__":
     })
 
     # SMA
-    data_with_sma = sma(data.copy(), window=3)
+    data_with_sma = sma(data, window=3)
     print("Data with SMA:")
     print(data_with_sma)
 
     # RSI
-    data_with_rsi = rsi(data.copy(), window=4)
+    data_with_rsi = rsi(data, window=4)
     print("\nData with RSI:")
     print(data_with_rsi)
 
     # VWAP
-    data_with_vwap = vwap(data.copy())
+    data_with_vwap = vwap(data)
     print("Data with VWAP:")
     print(data_with_vwap)
 
     # ATR
-    data_with_atr = atr(data.copy(), period=4)
+    data_with_atr = atr(data, period=4)
     print("Data with ATR:")
     print(data_with_atr)
 
     # SuperTrend
-    data_with_supertrend = SuperTrend(data.copy(), period=4, multiplier=3)
+    data_with_supertrend = SuperTrend(data, period=4, multiplier=3)
     print("Data with Supertrend:")
     print(data_with_supertrend)
 
     # Bolling bands
-    data_with_factors = BB(data.copy(), window=4, num_std_dev=2)
+    data_with_factors = BB(data, window=4, num_std_dev=2)
     print("Data with Bollinger Bands, Aroon, and MA:")
     print(data_with_factors)
+
+    # Factor matrix
+    factor_matrix = compute_factors(data, [('BB', {'window': 4}), ('atr', {'period': 4}), ('aroon', {'window': 4})])
+    print("Factor matrix:")
+    print(factor_matrix)
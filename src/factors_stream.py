@@ -0,0 +1,403 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+factors_lib 指标的增量（流式）版本
+
+每个状态对象通过 update(bar) 逐根K线更新，单次更新为 O(1)，
+snapshot() 返回当前指标值；结果与 factors_lib 中的批量函数一致。
+bar 可以是 dict、pandas Series 或任何支持 bar['close'] 取值的对象。
+"""
+import math
+from collections import deque
+
+import numpy as np
+
+
+def _field(bar, name):
+    return float(bar[name])
+
+
+def _safe_div(numerator, denominator):
+    """与 NumPy 浮点除法一致：除零得到 inf 或 NaN 而不是抛出异常"""
+    if denominator == 0:
+        if numerator == 0 or math.isnan(numerator):
+            return math.nan
+        return math.copysign(math.inf, numerator)
+    return numerator / denominator
+
+
+class IndicatorState:
+    """
+    流式指标的基类
+
+    lookback 为重建状态所需回放的最近K线数量，续算已缓存的批量结果时只需回放这一段
+    """
+    lookback = 0
+
+    def update(self, bar):
+        raise NotImplementedError
+
+    def snapshot(self):
+        raise NotImplementedError
+
+    def update_many(self, data):
+        """
+        用历史数据预热状态
+
+        :param data: 包含价格数据的 DataFrame
+        :return: 最后一根K线对应的指标值
+        """
+        value = None
+        for bar in data.to_dict('records'):
+            value = self.update(bar)
+        return value
+
+    def resume(self, history, last_snapshot=None):
+        """
+        从批量计算过的历史数据恢复状态，只回放最后 lookback 根K线
+
+        :param history: 已计算过指标的历史K线 DataFrame
+        :param last_snapshot: 最后一根K线的指标值，格式与 snapshot() 相同
+        :return: self
+        """
+        self.update_many(history.iloc[-self.lookback:] if self.lookback else history.iloc[:0])
+        return self
+
+
+class _RollingWindow:
+    """
+    固定长度窗口内的滑动求和与 Welford 方差，窗口内出现 NaN 时结果为 NaN
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.nan_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.count = 0
+
+    def push(self, value):
+        self.values.append(value)
+        self._add(value)
+        if len(self.values) > self.window:
+            self._remove(self.values.popleft())
+
+    def _add(self, value):
+        if math.isnan(value):
+            self.nan_count += 1
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def _remove(self, value):
+        if math.isnan(value):
+            self.nan_count -= 1
+            return
+        self.count -= 1
+        if self.count == 0:
+            self.mean, self.m2 = 0.0, 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self.m2 -= delta * (value - self.mean)
+
+    @property
+    def full(self):
+        return len(self.values) == self.window and self.nan_count == 0
+
+    def get_mean(self, min_periods=None):
+        if min_periods is None:
+            return self.mean if self.full else math.nan
+        return self.mean if self.count >= min_periods else math.nan
+
+    def get_std(self):
+        if not self.full or self.count < 2:
+            return math.nan
+        return math.sqrt(max(self.m2, 0.0) / (self.count - 1))
+
+
+class SMAState(IndicatorState):
+    def __init__(self, window=10):
+        """
+        简单移动平均线（SMA）的流式版本
+
+        :param window: 移动平均窗口大小
+        """
+        self.window = window
+        self.lookback = window
+        self._rolling = _RollingWindow(window)
+        self.value = math.nan
+
+    def update(self, bar):
+        self._rolling.push(_field(bar, 'close'))
+        self.value = self._rolling.get_mean()
+        return self.value
+
+    def snapshot(self):
+        return {'sma': self.value}
+
+
+class MAState(SMAState):
+    def __init__(self, window=20):
+        """
+        移动平均线（MA）的流式版本
+
+        :param window: 移动平均窗口大小，默认为 20
+        """
+        super().__init__(window)
+
+    def snapshot(self):
+        return {'ma': self.value}
+
+
+class RSIState(IndicatorState):
+    def __init__(self, window=14):
+        """
+        相对强度指数（RSI）的流式版本
+
+        :param window: RSI 窗口大小
+        """
+        self.window = window
+        self.lookback = window + 1
+        self._gain = _RollingWindow(window)
+        self._loss = _RollingWindow(window)
+        self.prev_close = None
+        self.value = math.nan
+
+    def update(self, bar):
+        close = _field(bar, 'close')
+        delta = math.nan if self.prev_close is None else close - self.prev_close
+        self.prev_close = close
+
+        self._gain.push(delta if delta > 0 else 0.0)
+        self._loss.push(-delta if delta < 0 else 0.0)
+
+        avg_gain = self._gain.get_mean(min_periods=1)
+        avg_loss = self._loss.get_mean(min_periods=1)
+        self.value = 100 - _safe_div(100, 1 + _safe_div(avg_gain, avg_loss))
+        return self.value
+
+    def snapshot(self):
+        return {'rsi': self.value}
+
+
+class VWAPState(IndicatorState):
+    def __init__(self):
+        """
+        成交量加权平均价（VWAP）的流式版本
+        """
+        self.cum_pv = 0.0
+        self.cum_volume = 0.0
+        self.value = math.nan
+
+    def update(self, bar):
+        volume = _field(bar, 'volume')
+        typical_price = (_field(bar, 'close') + _field(bar, 'low') + _field(bar, 'high')) / 3
+        pv = typical_price * volume
+        # 与批量版本的 _cumsum_skipna 一致：NaN 项不计入累计量，只有当根K线的结果为 NaN
+        if not math.isnan(pv):
+            self.cum_pv += pv
+        if not math.isnan(volume):
+            self.cum_volume += volume
+        self.value = math.nan if math.isnan(pv) else _safe_div(self.cum_pv, self.cum_volume)
+        return self.value
+
+    def snapshot(self):
+        return {'vwap': self.value}
+
+    def resume(self, history, last_snapshot=None):
+        # 累计量无法靠回放少量K线得到，直接对历史数据做一次向量化求和
+        volume = history['volume'].to_numpy(dtype=np.float64)
+        typical_price = (history['close'] + history['low'] + history['high']).to_numpy(dtype=np.float64) / 3
+        self.cum_pv = float(np.nansum(typical_price * volume))
+        self.cum_volume = float(np.nansum(volume))
+        self.value = _safe_div(self.cum_pv, self.cum_volume)
+        return self
+
+
+class ATRState(IndicatorState):
+    def __init__(self, period=14):
+        """
+        平均真实范围（ATR）的流式版本
+
+        :param period: ATR 计算的周期，默认为 14
+        """
+        self.period = period
+        self.lookback = period + 1
+        self._rolling = _RollingWindow(period)
+        self.prev_close = None
+        self.value = math.nan
+
+    def update(self, bar):
+        high, low = _field(bar, 'high'), _field(bar, 'low')
+        ranges = [abs(high - low)]
+        if self.prev_close is not None:
+            ranges += [abs(high - self.prev_close), abs(low - self.prev_close)]
+        ranges = [r for r in ranges if not math.isnan(r)]
+        true_range = max(ranges) if ranges else math.nan
+        self.prev_close = _field(bar, 'close')
+
+        self._rolling.push(true_range)
+        self.value = self._rolling.get_mean()
+        return self.value
+
+    def snapshot(self):
+        return {'atr': self.value}
+
+
+class SuperTrendState(IndicatorState):
+    def __init__(self, period=14, multiplier=3):
+        """
+        SuperTrend 指标的流式版本
+
+        :param period: ATR 计算的周期，默认为 14
+        :param multiplier: SuperTrend 的倍数，默认为 3
+        """
+        self.period = period
+        self.multiplier = multiplier
+        self.lookback = period + 2
+        self._atr = ATRState(period)
+        self.prev_atr = math.nan
+        self.prev_close = None
+        self.prev_upper = math.nan
+        self.prev_lower = math.nan
+        self.value = math.nan
+
+    def update(self, bar):
+        hl2 = (_field(bar, 'high') + _field(bar, 'low')) / 2
+        upper_band = hl2 + self.multiplier * self.prev_atr
+        lower_band = hl2 - self.multiplier * self.prev_atr
+
+        if self.prev_close is not None:
+            if self.prev_close <= self.prev_upper:
+                self.value = upper_band
+            elif self.prev_close >= self.prev_lower:
+                self.value = lower_band
+
+        self.prev_close = _field(bar, 'close')
+        self.prev_upper, self.prev_lower = upper_band, lower_band
+        self.prev_atr = self._atr.update(bar)
+        return self.value
+
+    def snapshot(self):
+        return {'SuperTrend': self.value}
+
+    def resume(self, history, last_snapshot=None):
+        # 回放得到 ATR 和上下轨，SuperTrend 本身可能沿用更早的值，以批量结果为准
+        super().resume(history, last_snapshot)
+        if last_snapshot is not None:
+            self.value = float(last_snapshot['SuperTrend'])
+        return self
+
+
+class AroonState(IndicatorState):
+    def __init__(self, window=14):
+        """
+        Aroon 指标的流式版本，使用单调队列维护窗口内最高价和最低价的位置
+
+        :param window: Aroon 计算的周期，默认为 14
+        """
+        self.window = window
+        self.lookback = window
+        self.count = 0
+        self._max = deque()  # (序号, 最高价)，价格单调不增
+        self._min = deque()  # (序号, 最低价)，价格单调不减
+        # 最高价、最低价各自的 NaN 位置，与 aroon_arrays 一样分别判断两个序列的窗口
+        self._high_nan = deque()
+        self._low_nan = deque()
+        self.aroon_up = math.nan
+        self.aroon_down = math.nan
+
+    def update(self, bar):
+        high, low = _field(bar, 'high'), _field(bar, 'low')
+        index = self.count
+        self.count += 1
+        start = index - self.window + 1
+
+        if math.isnan(high):
+            self._high_nan.append(index)
+        if math.isnan(low):
+            self._low_nan.append(index)
+        # 相同价格保留最早出现的位置，与 np.argmax / np.argmin 一致
+        if not math.isnan(high):
+            while self._max and self._max[-1][1] < high:
+                self._max.pop()
+            self._max.append((index, high))
+        if not math.isnan(low):
+            while self._min and self._min[-1][1] > low:
+                self._min.pop()
+            self._min.append((index, low))
+
+        while self._max and self._max[0][0] < start:
+            self._max.popleft()
+        while self._min and self._min[0][0] < start:
+            self._min.popleft()
+        for nan_index in (self._high_nan, self._low_nan):
+            while nan_index and nan_index[0] < start:
+                nan_index.popleft()
+
+        if start < 0 or self._high_nan:
+            self.aroon_up = math.nan
+        else:
+            self.aroon_up = (self.window - (self._max[0][0] - start) + 1) / self.window * 100
+        if start < 0 or self._low_nan:
+            self.aroon_down = math.nan
+        else:
+            self.aroon_down = (self.window - (self._min[0][0] - start) + 1) / self.window * 100
+        return self.snapshot()
+
+    def snapshot(self):
+        return {'aroon_up': self.aroon_up, 'aroon_down': self.aroon_down}
+
+
+class BBState(IndicatorState):
+    def __init__(self, window=20, num_std_dev=2):
+        """
+        布林带指标的流式版本
+
+        :param window: 移动平均窗口大小，默认为 20
+        :param num_std_dev: 布林带宽度为移动平均的标准差倍数，默认为 2
+        """
+        self.window = window
+        self.lookback = window
+        self.num_std_dev = num_std_dev
+        self._rolling = _RollingWindow(window)
+        self.upper_band = math.nan
+        self.lower_band = math.nan
+        self.middle_band = math.nan
+
+    def update(self, bar):
+        self._rolling.push(_field(bar, 'close'))
+        middle = self._rolling.get_mean()
+        std = self._rolling.get_std()
+        self.middle_band = middle
+        self.upper_band = middle + self.num_std_dev * std
+        self.lower_band = middle - self.num_std_dev * std
+        return self.snapshot()
+
+    def snapshot(self):
+        return {'upper_band': self.upper_band, 'lower_band': self.lower_band, 'middle_band': self.middle_band}
+
+
+# Test
+if __name__ == "__main__":
+    import pandas as pd
+    import factors_lib
+
+    # test data
+    data = pd.DataFrame({
+        'close': [10, 12, 8, 15, 13, 14, 11, 9, 10, 12],
+        'volume': [1000, 1200, 800, 1500, 1300, 1400, 1100, 900, 1000, 1200],
+        'high': [12, 15, 10, 18, 14, 16, 13, 11, 12, 15],
+        'low': [8, 10, 7, 12, 9, 11, 9, 8, 9, 10],
+    })
+
+    state = BBState(window=4, num_std_dev=2)
+    streamed = pd.DataFrame([state.update(bar) for bar in data.to_dict('records')])
+    print("Streamed Bollinger Bands:")
+    print(streamed)
+    print(np.allclose(streamed.to_numpy(dtype=float), factors_lib.BB(data.copy(), window=4).to_numpy(dtype=float),
+                      equal_nan=True))
@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Bar-level matching engine for the simulated executor.
+
+At each bar, the resting orders of a symbol are matched against the bar's open, high, low, close and volume:
+
+* Market orders and stops that already triggered fill at the open.
+* Limit and take-profit orders fill when the bar trades at their price: at the limit, or at the open when the bar
+  gaps through it.
+* Stop and stop-loss orders trigger when the bar trades through their price and fill at the stop, or at the open
+  when the bar gaps through it. Trailing stops follow the bar extremes between bars.
+
+The candidates come from the price books of order_book.OrderRegistry, so only orders whose price the bar reached
+are visited. Fill prices, liquidity allocation and fees are then computed for all of them at once with array
+operations. The filled quantity of a bar is capped at a participation rate of its volume and allocated by
+priority: market orders first, then triggered stops, then limits, each by price priority and then time priority.
+"""
+import logging
+from datetime import datetime
+
+import numpy as np
+
+from lib import order_book
+
+# Kind codes, also the first priority key
+MARKET, STOP, LIMIT = 0, 1, 2
+
+
+def bars_by_symbol(bars):
+    """
+    :param bars: Dictionary mapping symbols to bars, or a DataFrame with a symbol column and one row per symbol.
+    :return: Dictionary mapping symbols to bars.
+    """
+    if hasattr(bars, 'to_dict') and 'symbol' in getattr(bars, 'columns', ()):
+        return {bar['symbol']: bar for bar in bars.to_dict('records')}
+    return bars
+
+
+class MatchingEngine:
+    def __init__(self, registry, participation_rate=0.1, exec_settings=None):
+        """
+        :param registry: order_book.OrderRegistry holding the resting orders.
+        :param participation_rate: Largest fraction of a bar's volume the orders of a symbol may fill, None for no
+                                   cap.
+        :param exec_settings: Optional execution.ExecutionSettings applied to every order, None uses the fee and
+                              slippage of each order.
+        """
+        self.registry = registry
+        self.participation_rate = participation_rate
+        self.exec_settings = exec_settings
+
+    def match(self, bars, time=None):
+        """
+        Match one bar of every symbol.
+
+        :param bars: Dictionary mapping symbols to bars (dictionaries with open, high, low, close and volume), or a
+                     DataFrame with a symbol column and one row per symbol.
+        :param time: Time of the bar, recorded as the execution time.
+        :return: List of fill responses.
+        """
+        fills = []
+        for symbol, bar in bars_by_symbol(bars).items():
+            fills.extend(self.match_bar(symbol, bar, time))
+        return fills
+
+    def match_bar(self, symbol, bar, time=None):
+        """
+        Match the resting orders of one symbol against one bar.
+
+        :param symbol: Trading symbol.
+        :param bar: Dictionary with open, high, low, close and volume.
+        :param time: Time of the bar, recorded as the execution time.
+        :return: List of fill responses with the order id, status, executed quantity, price and fee.
+        """
+        time = time if time is not None else datetime.now()
+        open_price, high, low = float(bar['open']), float(bar['high']), float(bar['low'])
+        self._start_trailing_stops(symbol, open_price)
+
+        orders = list(self.registry.marketable.get(symbol, {}).values()) + self.registry.triggered(symbol, low, high)
+        fills = self._fill(orders, open_price, float(bar.get('volume', np.inf)), time) if orders else []
+
+        self._trail_stops(symbol, high, low)
+        return fills
+
+    def _fill(self, orders, open_price, volume, time):
+        count = len(orders)
+        side = np.fromiter((1.0 if order.get_action().upper() == 'BUY' else -1.0 for order in orders), float, count)
+        kind = np.empty(count, dtype=np.int8)
+        price = np.full(count, np.nan)
+        for i, order in enumerate(orders):
+            trigger = order_book.trigger_price(order)
+            if trigger is None:
+                kind[i] = MARKET
+            else:
+                kind[i] = STOP if trigger[0] == 'STOP' else LIMIT
+                price[i] = trigger[1]
+        remaining = np.fromiter((order.get_quantity() for order in orders), float, count)
+        sequence = np.fromiter((self.registry.sequence(order.get_order_id()) for order in orders), np.int64, count)
+        if self.exec_settings is not None:
+            fee_rate = np.full(count, self.exec_settings.transaction_fee)
+            slippage = np.full(count, self.exec_settings.slippage)
+        else:
+            fee_rate = np.fromiter((order.get_transaction_fee() or 0.0 for order in orders), float, count)
+            slippage = np.fromiter((order.get_slippage() or 0.0 for order in orders), float, count)
+
+        buy = side > 0
+        # Fill at the trigger price, or at the open when the bar gapped through it
+        base = np.select([kind == MARKET, (kind == STOP) & buy, kind == STOP, buy],
+                         [open_price, np.maximum(open_price, price), np.minimum(open_price, price),
+                          np.minimum(open_price, price)],
+                         np.maximum(open_price, price))
+        # Market and stop fills pay slippage, limit fills never trade worse than their limit
+        fill_price = np.where(kind == LIMIT, base, base * (1 + side * slippage))
+
+        # Price priority: highest buy limit, lowest sell limit, and the stops the price path reaches first
+        price_key = np.where(kind == MARKET, 0.0, np.where((kind == LIMIT) == buy, -price, price))
+        priority = np.lexsort((sequence, price_key, kind))
+
+        available = np.inf if self.participation_rate is None else self.participation_rate * volume
+        ranked = remaining[priority]
+        before = np.cumsum(ranked) - ranked
+        filled = np.empty(count)
+        filled[priority] = np.clip(available - before, 0.0, ranked)
+        left = remaining - filled
+        fee = filled * fill_price * fee_rate
+
+        fills = []
+        for i in np.flatnonzero((filled > 0) | (kind == STOP)):
+            order = orders[i]
+            if kind[i] == STOP:
+                # A triggered stop becomes a market order, what is not filled now trades at the next open
+                order.triggered = True
+            if filled[i] <= 0:
+                self.registry.refresh(order)
+                continue
+
+            status = 'SUCCESS' if left[i] <= 1e-12 else 'PARTIAL'
+            order.set_status(status)
+            order.set_quantity(float(left[i]))
+            order.set_execution_time(time)
+            order.filled_quantity = getattr(order, 'filled_quantity', 0.0) + float(filled[i])
+            order.fill_price = float(fill_price[i])
+            if status == 'SUCCESS':
+                self.registry.remove(order)
+            else:
+                self.registry.refresh(order)
+
+            fills.append({
+                'status': status,
+                'order_id': order.get_order_id(),
+                'symbol': order.get_symbol(),
+                'action': order.get_action(),
+                'time': time,
+                'message': f'Simulated {"full" if status == "SUCCESS" else "partial"} fill at bar price',
+                'executed_quantity': float(filled[i]),
+                'price': float(fill_price[i]),
+                'fee': float(fee[i]),
+            })
+        logging.debug(f"Matched {len(orders)} orders, {len(fills)} fills")
+        return fills
+
+    def _trailing_stops(self, symbol):
+        return [order for order in self.registry.select(symbol=symbol, order_type='TRAILING_STOP')
+                if order.get_status() in order_book.RESTING_STATUSES and not getattr(order, 'triggered', False)]
+
+    def _start_trailing_stops(self, symbol, open_price):
+        """
+        Place the first stop of new trailing stops relative to the open.
+        """
+        for order in self._trailing_stops(symbol):
+            if order.stop_price is None:
+                direction = 1 if order.get_action().upper() == 'BUY' else -1
+                order.stop_price = open_price * (1 + direction * order.stop_percent)
+                self.registry.refresh(order)
+
+    def _trail_stops(self, symbol, high, low):
+        """
+        Move trailing stops after a bar: sell stops up behind the high, buy stops down behind the low.
+        """
+        orders = self._trailing_stops(symbol)
+        if not orders:
+            return
+        buy = np.array([order.get_action().upper() == 'BUY' for order in orders])
+        percent = np.array([order.stop_percent for order in orders], dtype=float)
+        stop = np.array([order.stop_price for order in orders], dtype=float)
+        trailed = np.where(buy, np.minimum(stop, low * (1 + percent)), np.maximum(stop, high * (1 - percent)))
+        for i in np.flatnonzero(trailed != stop):
+            orders[i].stop_price = float(trailed[i])
+            self.registry.refresh(orders[i])
@@ -3,23 +3,84 @@
 """CryptoDataFetcher：
 用于获取okx永续数据
 """
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import pandas as pd
 import ccxt
 from datetime import datetime, timedelta
 import os
 from tqdm import tqdm
 
+from lib import data_lake
+
 pd.set_option('expand_frame_repr', False)  # 当列太多时不换行
 pd.set_option('display.max_rows', 500)  # 最多显示数据的行数
 
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        """
+        线程安全的令牌桶限速器，所有抓取线程共享一个实例
+
+        :param rate: 每秒补充的令牌数，即平均请求速率
+        :param capacity: 桶容量，即允许的最大突发请求数，默认为 rate
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        取出令牌，令牌不足时阻塞等待
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
 
 class CryptoDataFetcher:
-    def __init__(self, time_interval='12h'):
-        self.exchange = ccxt.okx()
+    def __init__(self, time_interval='12h', exchange=None, max_workers=8, rate_limit=None, max_retries=5,
+                 limit=99, data_dir=None):
+        """
+        :param time_interval: K线周期
+        :param exchange: ccxt 交易所实例，默认为 ccxt.okx()，也可传入 ccxt.binanceusdm() 等，
+                         测试时可传入返回固定K线的假交易所
+        :param max_workers: 同时抓取的币种数
+        :param rate_limit: 每秒请求数上限，默认由交易所的 rateLimit（毫秒/请求）换算
+        :param max_retries: 网络错误的最大重试次数，重试间隔指数增长
+        :param limit: 每次 fetch_ohlcv 请求的K线数量
+        :param data_dir: 数据湖根目录，按 交易所/周期/币种/月份 分区存储，默认为 data_lake.DEFAULT_ROOT
+        """
+        # 限速由共享的令牌桶完成，ccxt 自带的限速在多线程下不能跨线程协调
+        self.exchange = exchange or ccxt.okx({'enableRateLimit': False})
         self.time_interval = time_interval
         self.start_time = None
         self.end_time = datetime.utcnow()
-        self.filename = rf'C:\Users\PythonWork\bitcoin\data\{self.time_interval}_data.feather'
+        # 不同交易所的数据存放在数据湖的不同目录下
+        self.lake = data_lake.MarketDataLake(data_dir, getattr(self.exchange, 'id', None) or 'okx')
+        self.filename = os.path.join(self.lake.root, f'{self.time_interval}_data.feather')
+
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.limit = limit
+        if rate_limit is None:
+            rate_limit = 1000 / (getattr(self.exchange, 'rateLimit', None) or 100)
+        self.rate_limiter = TokenBucket(rate_limit)
+        self.failed_symbols = {}
 
     def set_time_range(self, start, end=None):
         self.start_time = datetime.strptime(start, '%Y-%m-%d %H:%M:%S')
@@ -28,80 +89,187 @@ class CryptoDataFetcher:
         else:
             self.end_time = datetime.utcnow()
 
-    def fetch_data(self):
-        all_symbols = self.exchange.load_markets()
-        perpetual_symbols = [symbol for symbol in all_symbols if symbol.endswith('/USDT:USDT')]
-        all_symbol_data = []
-        for symbol in tqdm(perpetual_symbols, desc="Fetching symbols"):
+    def request(self, method, *args, **kwargs):
+        """
+        经过限速器调用交易所接口，网络错误和限频错误按指数退避重试
+
+        :param method: 交易所方法名，如 'fetch_ohlcv'
+        :return: 接口返回值
+        """
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
             try:
-                # print(f"Fetching  interval data for {symbol}")
-                since = self.exchange.parse8601(self.start_time.strftime('%Y-%m-%dT%H:%M:%SZ'))
-                end = self.exchange.parse8601(self.end_time.strftime('%Y-%m-%dT%H:%M:%SZ'))
-
-                symbol_data = []
-                while since < end:
-                    data = self.exchange.fetch_ohlcv(symbol, timeframe=self.time_interval, since=since, limit=99)
-                    if data:
-                        # 如果获取到数据，则扩展symbol_data并更新since为最新的数据时间戳
-                        symbol_data.extend(data)
-                        last_data_timestamp = data[-1][0]
-                        since = last_data_timestamp
-                    else:
-                        # 如果没有获取到数据，则增加一个时间间隔后再尝试
-                        since += self.exchange.parse_timeframe(self.time_interval) * 1000
-                        # print(pd.to_datetime(since, unit='ms'))
-
-                if symbol_data:
-                    df = pd.DataFrame(symbol_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-                    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-                    df['symbol'] = symbol
-                    all_symbol_data.append(df)
-            except Exception as e:
-                print(f"Error fetching data for {symbol}: {str(e)}")
-        # 合并所有币种的数据并存储
-        full_data = pd.concat(all_symbol_data, ignore_index=True)
-        full_data.to_feather(self.filename)
+                return getattr(self.exchange, method)(*args, **kwargs)
+            except ccxt.NetworkError:
+                if attempt == self.max_retries:
+                    raise
+                # 指数退避并加入随机抖动，避免所有线程同时重试
+                time.sleep(min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random()))
+
+    def perpetual_symbols(self):
+        all_symbols = self.request('load_markets')
+        return [symbol for symbol in all_symbols if symbol.endswith('/USDT:USDT')]
+
+    def fetch_symbol(self, symbol, since, end):
+        """
+        分页抓取单个币种 [since, end) 区间的K线
+
+        :param symbol: 交易对，如 'BTC/USDT:USDT'
+        :param since: 起始时间戳（毫秒）
+        :param end: 结束时间戳（毫秒）
+        :return: 含 timestamp、OHLCV 和 symbol 列的 DataFrame，无数据时为 None
+        """
+        timeframe = ccxt.Exchange.parse_timeframe(self.time_interval) * 1000
+        symbol_data = []
+        while since < end:
+            data = self.request('fetch_ohlcv', symbol, timeframe=self.time_interval, since=since, limit=self.limit)
+            data = [candle for candle in data if since <= candle[0] < end] if data else []
+            if data:
+                # 从最后一根K线的下一根开始，避免相邻两页重复
+                symbol_data.extend(data)
+                since = data[-1][0] + timeframe
+            else:
+                # 这一页没有数据，跳过整页的时间范围
+                since += timeframe * self.limit
+
+        if not symbol_data:
+            return None
+        df = pd.DataFrame(symbol_data, columns=OHLCV_COLUMNS)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        df['symbol'] = symbol
+        return df
+
+    def fetch_symbols(self, ranges):
+        """
+        用线程池并发抓取多个币种，共享同一个限速器
+
+        :param ranges: {symbol: (since, end)}，时间戳为毫秒
+        :return: {symbol: DataFrame}，抓取失败的币种记录在 self.failed_symbols
+        """
+        return self.fetch_ranges([(symbol, since, end) for symbol, (since, end) in ranges.items()])
+
+    def fetch_ranges(self, tasks):
+        """
+        并发抓取任意多个 (币种, 区间)，同一币种的多个区间合并为一个 DataFrame
+
+        :param tasks: [(symbol, since, end), ...]，时间戳为毫秒
+        :return: {symbol: DataFrame}，抓取失败的币种记录在 self.failed_symbols
+        """
+        frames = {}
+        self.failed_symbols = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.fetch_symbol, symbol, since, end): symbol for symbol, since, end in tasks}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Fetching symbols"):
+                symbol = futures[future]
+                try:
+                    df = future.result()
+                    if df is not None:
+                        frames.setdefault(symbol, []).append(df)
+                except Exception as e:
+                    self.failed_symbols[symbol] = str(e)
+                    print(f"Error fetching data for {symbol}: {str(e)}")
+        return {symbol: pd.concat(dfs, ignore_index=True) if len(dfs) > 1 else dfs[0] for symbol, dfs in frames.items()}
+
+    def closed_end(self, end):
+        """
+        把结束时间截到尚未收盘的K线开盘时刻，正在形成的K线不会被写入存储
+
+        :param end: 结束时间戳（毫秒）
+        :return: 不晚于 end 的、当前未收盘K线的开盘时间戳（毫秒）
+        """
+        timeframe = ccxt.Exchange.parse_timeframe(self.time_interval) * 1000
+        now = int(pd.Timestamp(datetime.utcnow()).value // 10 ** 6)
+        return min(end, now // timeframe * timeframe)
+
+    def fetch_data(self):
+        """
+        抓取全部永续合约 [start_time, end_time] 区间的K线，写入分区存储
+
+        :return: 合并后的长表 DataFrame
+        """
+        since = int(pd.Timestamp(self.start_time).value // 10 ** 6)
+        end = self.closed_end(int(pd.Timestamp(self.end_time).value // 10 ** 6))
+        results = self.fetch_symbols({symbol: (since, end) for symbol in self.perpetual_symbols()})
+        self.lake.append_many(self.time_interval, results)
+        return pd.concat(list(results.values()), ignore_index=True) if results else None
 
     def update_data(self):
+        """
+        增量更新：每个币种从已存储的最新K线（高水位）开始抓取，新数据追加到对应月份的分区，
+        更新成本只与新增K线数量有关。高水位K线会被重新抓取并覆盖（旧版本可能存下了未收盘的K线），
+        只抓取已收盘的K线。没有历史数据的新币种从 start_time 开始抓取。
+
+        :return: 新增的K线数量
+        """
         try:
-            # 读取现有数据
-            existing_data = pd.read_feather(self.filename)
-
-            # 确定最新的时间戳
-            last_update = existing_data['timestamp'].max()
-            self.set_time_range(last_update.strftime('%Y-%m-%d %H:%M:%S'))
-
-            # 获取并添加新数据
-            self.fetch_data()
-
-            # 读取新数据并与现有数据合并
-            new_data = pd.read_feather(self.filename)
-            updated_data = pd.concat([existing_data, new_data]).drop_duplicates().reset_index(drop=True)
-            if len(updated_data) > len(existing_data):
-                # 如果有新数据被添加
-                updated_data.to_feather(self.filename)
-                print("数据已更新。")
+            end = self.closed_end(int(pd.Timestamp(datetime.utcnow()).value // 10 ** 6))
+            ranges = {}
+            for symbol in self.perpetual_symbols():
+                high_water_mark = self.lake.high_water_mark(self.time_interval, symbol)
+                if high_water_mark is not None:
+                    since = int(high_water_mark.value // 10 ** 6)
+                elif self.start_time is not None:
+                    since = int(pd.Timestamp(self.start_time).value // 10 ** 6)
+                else:
+                    continue
+                if since < end:
+                    ranges[symbol] = (since, end)
+
+            results = self.fetch_symbols(ranges)
+            # 清单在整批写入后只写一次，成本不随币种数量成倍增长
+            added = self.lake.append_many(self.time_interval, results)
+            if added:
+                print(f"数据已更新，新增 {added} 根K线。")
             else:
-                # 如果没有新数据被添加
                 print("数据已经是最新的，无需更新。")
+            return added
 
         except Exception as e:
             print(f"Error updating data: {str(e)}")
+            return 0
+
+    def backfill(self, symbols=None):
+        """
+        补齐已存储数据中缺失的K线：由数据湖清单和时间戳差分找出缺口，只请求缺口对应的区间，
+        不需要为了修补几个缺口重新抓取全部历史。交易所本身没有数据的缺口会保留。
+
+        :param symbols: 可选的币种列表，默认为已存储的全部币种
+        :return: 补齐的K线数量
+        """
+        timeframe = ccxt.Exchange.parse_timeframe(self.time_interval) * 1000
+        tasks = []
+        for symbol in symbols or self.lake.symbols(self.time_interval):
+            for first, last in self.lake.gaps(self.time_interval, symbol, pd.Timedelta(milliseconds=timeframe)):
+                tasks.append((symbol, int(first.value // 10 ** 6), int(last.value // 10 ** 6) + timeframe))
+        if not tasks:
+            print("没有发现缺失的K线。")
+            return 0
+
+        results = self.fetch_ranges(tasks)
+        added = self.lake.append_many(self.time_interval, results)
+        print(f"发现 {len(tasks)} 个缺口，补齐 {added} 根K线。")
+        return added
+
+    def export(self, filename=None, symbols=None, start=None, end=None):
+        """
+        把分区数据合并为一个长表 feather 文件，供 factor_panel.compute_panel_factors 等使用
+
+        :param filename: 输出文件，默认为 self.filename
+        :param symbols: 可选的币种列表，默认为已存储的全部币种
+        :return: 合并后的 DataFrame
+        """
+        full_data = self.lake.read_many(self.time_interval, symbols, start, end)
+        full_data.to_feather(filename or self.filename)
+        return full_data
 
 
 if __name__ == "__main__":
     # 创建CryptoDataFetcher实例
     data_fetcher = CryptoDataFetcher(time_interval='12h')
-    if not os.path.exists(data_fetcher.filename):
-        print("未找到现有数据文件，开始初次数据抓取...")
-        # 设置初始的时间范围以抓取数据
-        data_fetcher.set_time_range("2020-01-01 00:00:00")
-        # 初次抓取数据
-        data_fetcher.fetch_data()
-        print("初次数据抓取完成。")
-    # 设置要抓取数据的时间范围
-    else:
-        print("开始数据更新...")
-        # 更新数据
-        data_fetcher.update_data()
-        print("数据更新完成。")
+    # 没有历史数据的币种从这个时间开始抓取，已有数据的币种从各自的最新K线之后继续
+    data_fetcher.set_time_range("2020-01-01 00:00:00")
+    print("开始数据更新...")
+    data_fetcher.update_data()
+    data_fetcher.backfill()
+    data_fetcher.export()
+    print("数据更新完成。")
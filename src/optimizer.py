@@ -0,0 +1,547 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Parallel parameter optimizer for BacktestEngine.
+
+Every parameter combination runs in its own BacktestEngine inside a process pool. The market data is
+loaded once by the parent process and placed in shared memory, workers attach to it instead of receiving
+a pickled copy. Results are streamed back as soon as they finish and the search can stop early.
+
+Search strategies decide which combinations are evaluated: exhaustive grid, random search, Latin hypercube
+sampling, successive halving over growing date ranges and a lightweight quadratic surrogate model.
+"""
+import itertools
+import logging
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from lib import backtest_engine
+
+
+def share_frame(data):
+    """
+    Copy the numeric and datetime columns of a DataFrame into one shared memory block.
+
+    :param data: Pandas DataFrame with the loaded market data.
+    :return: Tuple of the SharedMemory object (owned by the caller) and a picklable spec for attach_frame.
+    """
+    columns, offset = [], 0
+    for name in data.columns:
+        values = data[name].to_numpy()
+        if values.dtype.kind in 'biufcmM':
+            columns.append((name, values.dtype.str, offset, None))
+            offset += values.nbytes
+        else:
+            # Object columns (e.g. symbols) are small and are simply pickled with the spec
+            columns.append((name, None, None, values))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, dtype, start, _ in columns:
+        if dtype is not None:
+            target = np.ndarray((len(data),), dtype=dtype, buffer=shm.buf, offset=start)
+            target[:] = data[name].to_numpy()
+
+    spec = {'name': shm.name, 'length': len(data), 'columns': columns, 'index': data.index}
+    return shm, spec
+
+
+def attach_frame(spec):
+    """
+    Rebuild a DataFrame whose numeric columns are views on the shared memory block.
+
+    :param spec: Spec returned by share_frame.
+    :return: Tuple of the attached SharedMemory object and the DataFrame.
+    """
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    data = {}
+    for name, dtype, start, values in spec['columns']:
+        if dtype is None:
+            data[name] = values
+        else:
+            data[name] = np.ndarray((spec['length'],), dtype=dtype, buffer=shm.buf, offset=start)
+    return shm, pd.DataFrame(data, index=spec['index'], copy=False)
+
+
+def metric_value(metrics, metric):
+    """
+    Extract a scalar metric from the result of run_backtest.
+
+    :param metrics: Dictionary or single-row DataFrame of performance metrics.
+    :param metric: Name of the metric.
+    :return: float, NaN if the metric is not available.
+    """
+    try:
+        value = metrics[metric]
+        if isinstance(value, pd.Series):
+            value = value.iloc[0]
+        return float(value)
+    except Exception as e:
+        logging.warning(f"Metric '{metric}' is not available: {str(e)}")
+        return math.nan
+
+
+def run_combination(engine_kwargs, data_spec, params, metric, date_range=None):
+    """
+    Run one parameter combination in an isolated BacktestEngine.
+
+    :param engine_kwargs: Keyword arguments used to build the BacktestEngine.
+    :param data_spec: Shared memory spec of the market data, or None to let the engine load it itself.
+    :param params: Dictionary of strategy parameters for this run.
+    :param metric: Name of the metric to optimize.
+    :param date_range: Optional (start_date, end_date) for this run.
+    :return: Tuple of params and the metric value.
+    """
+    shm = None
+    try:
+        engine = backtest_engine.BacktestEngine(**engine_kwargs)
+        engine.set_parameters({'parameters': params})
+        with engine:
+            if data_spec is not None:
+                shm, data = attach_frame(data_spec)
+                engine.data_source.attach_data(data)
+            if date_range is not None:
+                engine.data_source.set_date_range(*date_range)
+            metrics = engine.run_backtest(reset=False)
+        return params, metric_value(metrics, metric)
+    finally:
+        if shm is not None:
+            shm.close()
+
+
+class ParallelOptimizer:
+    def __init__(self, engine_kwargs, data=None, metric='sharpe_ratio', maximize=True, n_jobs=None, patience=None,
+                 target=None, date_range=None):
+        """
+        Initialize the parallel optimizer.
+
+        :param engine_kwargs: Keyword arguments used to build a BacktestEngine for every combination.
+        :param data: Pandas DataFrame with the loaded market data, shared with the workers. None lets every
+                     engine load data_path by itself.
+        :param metric: Name of the metric to optimize.
+        :param maximize: Whether a larger metric is better.
+        :param n_jobs: Number of worker processes, None uses the CPU count, 1 runs in the current process.
+        :param patience: Stop after this many finished runs without improvement.
+        :param target: Stop as soon as the best metric reaches this value.
+        :param date_range: Full (start_date, end_date) of the backtest, used by budgeted searches.
+        """
+        self.engine_kwargs = engine_kwargs
+        self.data = data
+        self.metric = metric
+        self.maximize = maximize
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.patience = patience
+        self.target = target
+        self.date_range = date_range
+
+        self.best_params, self.best_metric = None, None
+        self.results = []
+        self.stopped = False
+        # Full-budget runs since the last improvement, kept across the batches and rungs of one search
+        self.since_improvement = 0
+        # Shared data and worker pool of the current search, see start
+        self._shm, self._spec, self._executor = None, None, None
+
+    def is_better(self, value, best):
+        if math.isnan(value):
+            return False
+        if best is None or math.isnan(best):
+            return True
+        return value > best if self.maximize else value < best
+
+    def _reached_target(self):
+        if self.target is None or self.best_metric is None:
+            return False
+        return self.best_metric >= self.target if self.maximize else self.best_metric <= self.target
+
+    def full_date_range(self):
+        """
+        :return: (start_date, end_date) of the whole backtest, taken from the data when not given explicitly.
+        """
+        if self.date_range is not None and None not in self.date_range:
+            return tuple(pd.Timestamp(date) for date in self.date_range)
+        if self.data is not None:
+            date_column = next((col for col in self.data.columns if 'date' in col.lower() or 'time' in col.lower()),
+                               None)
+            if date_column is not None:
+                dates = pd.to_datetime(self.data[date_column])
+                return dates.min(), dates.max()
+        raise ValueError("A date range is required: pass date_range or data with a date column.")
+
+    def start(self):
+        """
+        Share the data and start the worker pool once, every batch of the search reuses them. Called by run.
+        """
+        if self._shm is None and self._spec is None and self.data is not None:
+            self._shm, self._spec = share_frame(self.data)
+        if self._executor is None and self.n_jobs > 1:
+            self._executor = ProcessPoolExecutor(max_workers=self.n_jobs)
+
+    def shutdown(self):
+        """
+        Stop the worker pool and free the shared data.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+        self._shm, self._spec = None, None
+
+    def iter_results(self, candidates, date_range=None, budget=1.0):
+        """
+        Evaluate parameter combinations and yield (params, metric) as soon as each one finishes.
+
+        Outside of run, the data is shared and the pool started for this call only.
+
+        :param candidates: Iterable of parameter dictionaries, consumed lazily.
+        :param date_range: Optional (start_date, end_date) applied to every run.
+        :param budget: Fraction of the full date range used by these runs. Only full-budget runs can become
+                       the best result.
+        """
+        if self.stopped:
+            return
+        started = self._spec is None and self._executor is None
+        if started:
+            self.start()
+        candidates = iter(candidates)
+        try:
+            if self._executor is None:
+                for params in candidates:
+                    result = run_combination(self.engine_kwargs, self._spec, params, self.metric, date_range)
+                    self._record(result, budget)
+                    yield result
+                    if self._should_stop():
+                        self.stopped = True
+                        break
+                return
+
+            pending = set()
+            try:
+                while True:
+                    # Keep a bounded number of runs in flight instead of submitting the whole grid
+                    while not self.stopped and len(pending) < 2 * self.n_jobs:
+                        params = next(candidates, None)
+                        if params is None:
+                            break
+                        pending.add(self._executor.submit(run_combination, self.engine_kwargs, self._spec, params,
+                                                          self.metric, date_range))
+                    if not pending:
+                        break
+
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            logging.error(f"Error in optimization worker: {str(e)}")
+                            continue
+                        self._record(result, budget)
+                        yield result
+
+                    if not self.stopped and self._should_stop():
+                        logging.info("Early stopping parameter optimization.")
+                        self.stopped = True
+                        for future in pending:
+                            future.cancel()
+            finally:
+                # The pool outlives this batch, do not leave runs of an abandoned batch queued on it
+                for future in pending:
+                    future.cancel()
+        finally:
+            if started:
+                self.shutdown()
+
+    def _record(self, result, budget=1.0):
+        params, value = result
+        self.results.append({**params, self.metric: value, 'budget': budget})
+        if budget < 1:
+            return
+        if self.is_better(value, self.best_metric):
+            self.best_params, self.best_metric = params, value
+            self.since_improvement = 0
+        else:
+            self.since_improvement += 1
+
+    def _should_stop(self):
+        return self._reached_target() or (self.patience is not None and self.since_improvement >= self.patience)
+
+    def run(self, parameter_ranges, search=None):
+        """
+        Search the parameter space.
+
+        :param parameter_ranges: Dictionary mapping parameter names to range() arguments, e.g. {'window': (10, 30, 5)}.
+        :param search: SearchStrategy instance or name in SEARCH_STRATEGIES, grid search by default.
+        :return: Tuple of best metric, best parameters and the full results table.
+        """
+        search = make_search(search)
+        self.stopped, self.since_improvement = False, 0
+        self.start()
+        try:
+            search.search(self, parameter_grid(parameter_ranges))
+        finally:
+            self.shutdown()
+
+        logging.info(f"Best parameters: {self.best_params}")
+        logging.info(f"Best metric: {self.best_metric}")
+        return self.best_metric, self.best_params, self.results_table()
+
+    def results_table(self):
+        """
+        :return: Pandas DataFrame with one row per finished run, best first.
+        """
+        table = pd.DataFrame(self.results)
+        if not table.empty:
+            table = table.sort_values(self.metric, ascending=not self.maximize, na_position='last')
+        return table.reset_index(drop=True)
+
+
+def parameter_grid(parameter_ranges):
+    """
+    :param parameter_ranges: Dictionary mapping parameter names to range() arguments.
+    :return: Dictionary mapping parameter names to the list of candidate values.
+    """
+    return {name: list(range(*param_range)) for name, param_range in parameter_ranges.items()}
+
+
+def grid_size(grid):
+    return math.prod(len(values) for values in grid.values())
+
+
+def to_params(grid, index):
+    """
+    Convert a tuple of per-parameter value positions into a parameter dictionary.
+    """
+    return {name: values[int(i)] for (name, values), i in zip(grid.items(), index)}
+
+
+class SearchStrategy:
+    """
+    Base class of the search strategies. A strategy drives ParallelOptimizer.iter_results, which records every
+    result and keeps track of the best one.
+    """
+
+    def search(self, optimizer, grid):
+        """
+        :param optimizer: ParallelOptimizer evaluating the candidates.
+        :param grid: Dictionary mapping parameter names to the list of candidate values.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def evaluate(optimizer, candidates, date_range=None, budget=1.0):
+        return list(optimizer.iter_results(candidates, date_range, budget))
+
+
+class GridSearch(SearchStrategy):
+    """
+    Exhaustive search over every combination, generated lazily.
+    """
+
+    def search(self, optimizer, grid):
+        names = list(grid.keys())
+        for _ in optimizer.iter_results(dict(zip(names, values)) for values in itertools.product(*grid.values())):
+            pass
+
+
+class RandomSearch(SearchStrategy):
+    def __init__(self, n_iter=50, seed=None):
+        """
+        Evaluate randomly drawn combinations without repetition.
+
+        :param n_iter: Number of combinations to evaluate.
+        :param seed: Random seed.
+        """
+        self.n_iter = n_iter
+        self.rng = np.random.default_rng(seed)
+
+    def sample(self, grid, n):
+        """
+        :return: List of distinct index tuples into the grid.
+        """
+        sizes = [len(values) for values in grid.values()]
+        total = grid_size(grid)
+        if n >= total:
+            return list(itertools.product(*[range(size) for size in sizes]))
+        if total <= 1_000_000:
+            return list(zip(*np.unravel_index(self.rng.choice(total, n, replace=False), sizes)))
+
+        chosen = set()
+        while len(chosen) < n:
+            chosen.add(tuple(int(self.rng.integers(size)) for size in sizes))
+        return list(chosen)
+
+    def search(self, optimizer, grid):
+        for _ in optimizer.iter_results(to_params(grid, index) for index in self.sample(grid, self.n_iter)):
+            pass
+
+
+class LatinHypercubeSearch(RandomSearch):
+    """
+    Random search where every parameter's range is split into n_iter strata and each stratum is used once,
+    so the samples cover every parameter evenly.
+    """
+
+    def sample(self, grid, n):
+        sizes = [len(values) for values in grid.values()]
+        total = grid_size(grid)
+        if n >= total:
+            return list(itertools.product(*[range(size) for size in sizes]))
+
+        columns = []
+        for size in sizes:
+            strata = (self.rng.permutation(n) + self.rng.random(n)) / n
+            columns.append(np.minimum((strata * size).astype(int), size - 1))
+
+        # Collisions are possible on small grids, top them up with random draws
+        chosen = list(dict.fromkeys(zip(*columns)))
+        for index in super().sample(grid, n):
+            if len(chosen) >= n:
+                break
+            if index not in chosen:
+                chosen.append(index)
+        return chosen
+
+
+class SuccessiveHalving(SearchStrategy):
+    def __init__(self, n_candidates=27, eta=3, min_fraction=0.05, sampler=None, seed=None):
+        """
+        Evaluate many candidates on a short, recent date range and promote the best 1/eta of them to
+        ranges eta times longer, until the survivors run on the full range.
+
+        :param n_candidates: Number of candidates in the first rung.
+        :param eta: Reduction factor between rungs.
+        :param min_fraction: Smallest fraction of the full date range used by the first rung.
+        :param sampler: RandomSearch-like object drawing the initial candidates, Latin hypercube by default.
+        :param seed: Random seed of the default sampler.
+        """
+        self.n_candidates = n_candidates
+        self.eta = eta
+        self.min_fraction = min_fraction
+        self.sampler = sampler or LatinHypercubeSearch(n_candidates, seed)
+
+    def search(self, optimizer, grid):
+        start_date, end_date = optimizer.full_date_range()
+        candidates = [to_params(grid, index) for index in self.sampler.sample(grid, self.n_candidates)]
+
+        # Each rung keeps 1/eta of the candidates and multiplies the date range by eta
+        num_rungs = 1
+        while self.eta ** num_rungs <= len(candidates) and self.eta ** -num_rungs >= self.min_fraction:
+            num_rungs += 1
+
+        for rung in range(num_rungs):
+            fraction = 1.0 if len(candidates) == 1 else float(self.eta) ** (rung - num_rungs + 1)
+            date_range = (end_date - (end_date - start_date) * fraction, end_date)
+            results = self.evaluate(optimizer, candidates, date_range, fraction)
+            logging.info(f"Successive halving rung {rung}: {len(candidates)} candidates on {fraction:.0%} of the data")
+            if fraction == 1.0 or optimizer.stopped:
+                break
+
+            keep = max(1, len(results) // self.eta)
+            results.sort(key=lambda result: _sort_key(result[1], optimizer.maximize))
+            candidates = [params for params, _ in results[:keep]]
+
+
+class SurrogateSearch(SearchStrategy):
+    def __init__(self, n_iter=50, n_init=10, batch_size=None, n_candidates=500, exploration=0.1, ridge=1e-3,
+                 seed=None):
+        """
+        Bayesian-lite search: fit a quadratic ridge regression of the metric on the normalized parameters and
+        evaluate the candidates with the best predicted metric plus a bonus for being far from evaluated points.
+
+        :param n_iter: Total number of combinations to evaluate.
+        :param n_init: Number of Latin hypercube samples before the surrogate model is used.
+        :param batch_size: Number of combinations proposed per round, the number of workers by default.
+        :param n_candidates: Number of random unevaluated combinations scored by the model per round.
+        :param exploration: Weight of the distance bonus, relative to the metric's standard deviation.
+        :param ridge: Ridge regularization of the surrogate model.
+        :param seed: Random seed.
+        """
+        self.n_iter = n_iter
+        self.n_init = n_init
+        self.batch_size = batch_size
+        self.n_candidates = n_candidates
+        self.exploration = exploration
+        self.ridge = ridge
+        self.sampler = LatinHypercubeSearch(n_init, seed)
+
+    @staticmethod
+    def features(x):
+        """
+        Quadratic features: constant, linear, squared and pairwise interaction terms.
+        """
+        columns = [np.ones(len(x)), *x.T, *(x ** 2).T]
+        columns += [x[:, i] * x[:, j] for i, j in itertools.combinations(range(x.shape[1]), 2)]
+        return np.column_stack(columns)
+
+    def search(self, optimizer, grid):
+        sizes = np.array([len(values) for values in grid.values()])
+        scale = np.maximum(sizes - 1, 1)
+        total = grid_size(grid)
+        batch_size = self.batch_size or optimizer.n_jobs
+
+        evaluated = {}
+        for params, value in self.evaluate(optimizer, [to_params(grid, index) for index in
+                                                       self.sampler.sample(grid, min(self.n_init, self.n_iter))]):
+            evaluated[tuple(grid[name].index(params[name]) for name in grid)] = value
+
+        while len(evaluated) < min(self.n_iter, total) and not optimizer.stopped:
+            points = np.array(list(evaluated.keys()), dtype=float) / scale
+            values = np.array(list(evaluated.values()), dtype=float)
+            valid = ~np.isnan(values)
+
+            pool = [index for index in self.sampler.sample(grid, min(self.n_candidates, total))
+                    if index not in evaluated]
+            if not pool:
+                break
+            candidates = np.array(pool, dtype=float) / scale
+
+            score = np.zeros(len(pool))
+            if valid.sum() > 1:
+                sign = 1 if optimizer.maximize else -1
+                target = sign * values[valid]
+                std = target.std() or 1.0
+                phi = self.features(points[valid])
+                weights = np.linalg.solve(phi.T @ phi + self.ridge * np.eye(phi.shape[1]),
+                                          phi.T @ ((target - target.mean()) / std))
+                score = self.features(candidates) @ weights
+
+            distance = np.min(np.linalg.norm(candidates[:, None, :] - points[None, :, :], axis=-1), axis=1)
+            score += self.exploration * distance / np.sqrt(len(sizes))
+
+            batch = [pool[i] for i in np.argsort(-score)[:min(batch_size, self.n_iter - len(evaluated))]]
+            for params, value in self.evaluate(optimizer, [to_params(grid, index) for index in batch]):
+                evaluated[tuple(grid[name].index(params[name]) for name in grid)] = value
+
+
+def _sort_key(value, maximize):
+    if math.isnan(value):
+        return math.inf
+    return -value if maximize else value
+
+
+SEARCH_STRATEGIES = {
+    'grid': GridSearch,
+    'random': RandomSearch,
+    'lhs': LatinHypercubeSearch,
+    'halving': SuccessiveHalving,
+    'surrogate': SurrogateSearch,
+}
+
+
+def make_search(search=None, **options):
+    """
+    :param search: SearchStrategy instance, name in SEARCH_STRATEGIES or None for grid search.
+    :param options: Constructor arguments when search is a name.
+    :return: SearchStrategy instance.
+    """
+    if search is None:
+        return GridSearch()
+    if isinstance(search, SearchStrategy):
+        return search
+    return SEARCH_STRATEGIES[search](**options)
@@ -0,0 +1,243 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Indexed registry of the orders handled by the ExecutingSystem.
+
+Orders are stored in a dictionary keyed by order id, with secondary indexes by symbol, side, status and order
+type, so a lookup, insert or removal is O(1) instead of a scan of the whole waitlist. Resting orders with a trigger price
+(limit, take-profit, stop, stop-loss and trailing stop orders) are also kept in one price-sorted book per
+symbol, side and trigger kind, so matching a bar only visits the orders whose price the bar actually reached.
+"""
+import bisect
+import itertools
+import uuid
+from collections import defaultdict
+
+# Statuses of orders that can still trade and therefore sit in the price books
+RESTING_STATUSES = ('PENDING', 'PARTIAL')
+
+# Orders that trigger at their price or better (buy at or below, sell at or above)
+LIMIT_TYPES = ('LIMIT', 'ICEBERG', 'TAKE_PROFIT')
+# Orders that trigger once the market trades through their price (buy at or above, sell at or below)
+STOP_TYPES = ('STOP', 'STOP_LOSS', 'TRAILING_STOP')
+
+
+def trigger_price(order):
+    """
+    :return: Tuple of the trigger kind ('LIMIT' or 'STOP') and the trigger price of an order, None for orders
+             without a price (market orders, stops that already triggered, trailing stops before their first
+             bar).
+    """
+    order_type = order.get_order_type()
+    if getattr(order, 'triggered', False):
+        return None
+    if order_type in LIMIT_TYPES:
+        price = getattr(order, 'take_profit_price', None) if order_type == 'TAKE_PROFIT' else order.get_price()
+        kind = 'LIMIT'
+    elif order_type in STOP_TYPES:
+        price = getattr(order, 'stop_price', None)
+        kind = 'STOP'
+    else:
+        return None
+    return None if price is None else (kind, float(price))
+
+
+class PriceBook:
+    def __init__(self):
+        """
+        Orders sorted by price, then by arrival. Entries are (price, sequence, order_id) tuples, so bisect finds
+        both a price level and a single order in O(log n).
+        """
+        self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, price, sequence, order_id):
+        bisect.insort(self.entries, (price, sequence, order_id))
+
+    def remove(self, price, sequence):
+        position = bisect.bisect_left(self.entries, (price, sequence))
+        if position < len(self.entries) and self.entries[position][:2] == (price, sequence):
+            del self.entries[position]
+
+    def between(self, low=None, high=None):
+        """
+        :return: Ids of the orders priced inside [low, high], in ascending price then arrival order.
+        """
+        start = 0 if low is None else bisect.bisect_left(self.entries, (low,))
+        stop = len(self.entries) if high is None else bisect.bisect_left(self.entries, (high, float('inf')))
+        return [entry[2] for entry in self.entries[start:stop]]
+
+    def prices(self):
+        return [entry[0] for entry in self.entries]
+
+
+class OrderRegistry:
+    def __init__(self, orders=()):
+        """
+        :param orders: Optional iterable of orders to register.
+        """
+        self.orders = {}
+        # Secondary indexes, dictionaries keep insertion order and give O(1) removal
+        self.by_symbol = defaultdict(dict)
+        self.by_side = defaultdict(dict)
+        self.by_status = defaultdict(dict)
+        self.by_type = defaultdict(dict)
+        # (symbol, side, kind) -> PriceBook of resting orders
+        self.books = defaultdict(PriceBook)
+        # symbol -> resting orders that trade at the next price: market orders and triggered stops
+        self.marketable = defaultdict(dict)
+        # order_id -> (index keys, book key, price, sequence) as registered, to undo on removal
+        self._keys = {}
+        self._sequence = itertools.count()
+        for order in orders:
+            self.add(order)
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __iter__(self):
+        return iter(list(self.orders.values()))
+
+    def __contains__(self, order_or_id):
+        return self._order_id(order_or_id) in self.orders
+
+    @staticmethod
+    def _order_id(order_or_id):
+        return order_or_id.get_order_id() if hasattr(order_or_id, 'get_order_id') else order_or_id
+
+    def get(self, order_id, default=None):
+        return self.orders.get(order_id, default)
+
+    def add(self, order):
+        """
+        Register an order, or refresh its indexes if it is already registered. Orders without an id (an Order gets
+        one in __enter__) are given a unique id, otherwise they would all share the key None.
+        """
+        order_id = order.get_order_id()
+        if order_id is None:
+            order_id = uuid.uuid4().hex
+            order.set_order_id(order_id)
+        if order_id in self.orders:
+            self.refresh(order)
+            return
+        self.orders[order_id] = order
+        self._index(order_id, order, next(self._sequence))
+
+    # The registry replaces a plain list, keep the list method existing callers use
+    append = add
+
+    def remove(self, order_or_id):
+        """
+        Unregister an order, by order or by id.
+
+        :raise ValueError: If the order is not registered, like list.remove.
+        """
+        order_id = self._order_id(order_or_id)
+        if order_id not in self.orders:
+            raise ValueError(f"Order {order_id} is not in the registry")
+        self._unindex(order_id)
+        return self.orders.pop(order_id)
+
+    def discard(self, order_or_id):
+        """
+        Unregister an order if it is registered.
+        """
+        order_id = self._order_id(order_or_id)
+        if order_id in self.orders:
+            self.remove(order_id)
+
+    def refresh(self, order):
+        """
+        Re-index an order after its status, side or prices changed. Orders that are no longer resting leave the
+        price books.
+        """
+        order_id = order.get_order_id()
+        sequence = self._keys[order_id][3]
+        self._unindex(order_id)
+        self._index(order_id, order, sequence)
+
+    def _index(self, order_id, order, sequence):
+        action = (order.get_action() or '').upper()
+        keys = (order.get_symbol(), action, order.get_status(), order.get_order_type())
+        for index, key in zip(self._indexes(), keys):
+            index[key][order_id] = order
+
+        book_key, price = None, None
+        if keys[2] in RESTING_STATUSES:
+            trigger = trigger_price(order)
+            if trigger is not None:
+                book_key, price = (keys[0], action, trigger[0]), trigger[1]
+                self.books[book_key].add(price, sequence, order_id)
+            elif keys[3] == 'MARKET' or getattr(order, 'triggered', False):
+                book_key = keys[0]
+                self.marketable[book_key][order_id] = order
+        self._keys[order_id] = (keys, book_key, price, sequence)
+
+    def _indexes(self):
+        return self.by_symbol, self.by_side, self.by_status, self.by_type
+
+    def _unindex(self, order_id):
+        keys, book_key, price, sequence = self._keys.pop(order_id)
+        for index, key in zip(self._indexes(), keys):
+            index[key].pop(order_id, None)
+            if not index[key]:
+                del index[key]
+        if book_key is not None and price is None:
+            self.marketable[book_key].pop(order_id, None)
+            if not self.marketable[book_key]:
+                del self.marketable[book_key]
+        elif book_key is not None:
+            self.books[book_key].remove(price, sequence)
+            if not self.books[book_key]:
+                del self.books[book_key]
+
+    def select(self, symbol=None, side=None, status=None, order_type=None):
+        """
+        Orders matching all the given criteria, starting from the smallest index.
+
+        :param symbol: Trading symbol.
+        :param side: 'BUY' or 'SELL'.
+        :param status: Order status, e.g. 'PENDING'.
+        :param order_type: Order type, e.g. 'TRAILING_STOP'.
+        :return: List of orders, in registration order.
+        """
+        keys = (symbol, side and side.upper(), status, order_type)
+        candidates = [index.get(key, {}) for index, key in zip(self._indexes(), keys) if key is not None]
+        if not candidates:
+            return list(self.orders.values())
+        candidates.sort(key=len)
+        smallest, others = candidates[0], candidates[1:]
+        return [order for order_id, order in smallest.items() if all(order_id in other for other in others)]
+
+    def symbols(self):
+        return list(self.by_symbol)
+
+    def book(self, symbol, side, kind):
+        """
+        :param kind: 'LIMIT' or 'STOP'.
+        :return: PriceBook of the resting orders, empty if there are none.
+        """
+        return self.books.get((symbol, side.upper(), kind)) or PriceBook()
+
+    def triggered(self, symbol, low, high):
+        """
+        Resting orders of a symbol whose trigger price the range [low, high] reached, e.g. a bar's low and high.
+
+        Buy limits at or above the low, sell limits at or below the high, buy stops at or below the high and sell
+        stops at or above the low. Only the matching slice of each price book is visited.
+
+        :return: List of orders.
+        """
+        order_ids = (self.book(symbol, 'BUY', 'LIMIT').between(low=low) +
+                     self.book(symbol, 'SELL', 'LIMIT').between(high=high) +
+                     self.book(symbol, 'BUY', 'STOP').between(high=high) +
+                     self.book(symbol, 'SELL', 'STOP').between(low=low))
+        return [self.orders[order_id] for order_id in order_ids]
+
+    def sequence(self, order_id):
+        """
+        :return: Arrival rank of a registered order, used for time priority.
+        """
+        return self._keys[order_id][3]
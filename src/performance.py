@@ -168,6 +168,225 @@ def get_metrics(asset):
     return metrics_df
 
 
+class PerformanceAccumulator:
+    def __init__(self, initial_equity=None, risk_free_rate=0.0, periods_per_year=365):
+        """
+        Incremental performance metrics, updated in O(1) per bar or trade.
+
+        :param initial_equity: float, equity before the first bar, None uses the first update.
+        :param risk_free_rate: float, risk-free rate per bar.
+        :param periods_per_year: int, number of bars per year, used for the annual return and annualized_sharpe.
+        """
+        self.initial_equity = initial_equity
+        self.risk_free_rate = risk_free_rate
+        self.periods_per_year = periods_per_year
+        self.reset()
+
+    def reset(self):
+        """
+        Reset the running state.
+        """
+        self.equity = self.initial_equity
+        self.peak = self.initial_equity
+        self.max_drawdown = 0.0
+        self.num_bars = 0
+
+        # Running central moments of the excess returns (Welford / Terriberry)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+
+        self.num_trades = 0
+        self.num_winning = 0
+        self.num_losing = 0
+        self.total_profit = 0.0
+        self.total_holding_days = 0.0
+        self.num_holding = 0
+
+        # Open position of every symbol fed through record_fill: signed quantity, average price, fees paid to
+        # open it and the time it was opened
+        self.positions = {}
+        # Cash paid or received by the fills, fees included, and the last price of every symbol
+        self.cash_flow = 0.0
+        self.marks = {}
+
+    def update(self, equity):
+        """
+        Feed the portfolio equity at the end of a bar.
+
+        :param equity: float, current equity.
+        """
+        if self.equity is None:
+            self.equity = self.peak = self.initial_equity = equity
+        else:
+            self._add_return(equity / self.equity - 1 - self.risk_free_rate)
+            self.equity = equity
+        self.num_bars += 1
+
+        if equity > self.peak:
+            self.peak = equity
+        elif self.peak:
+            self.max_drawdown = min(self.max_drawdown, (equity - self.peak) / self.peak)
+
+    def _add_return(self, value):
+        n1 = self.count
+        self.count += 1
+        n = self.count
+        delta = value - self.mean
+        delta_n = delta / n
+        term = delta * delta_n * n1
+        self.mean += delta_n
+        self.m4 += term * delta_n * delta_n * (n * n - 3 * n + 3) + 6 * delta_n * delta_n * self.m2 - \
+            4 * delta_n * self.m3
+        self.m3 += term * delta_n * (n - 2) - 3 * delta_n * self.m2
+        self.m2 += term
+
+    def record_trade(self, profit, entry_date=None, exit_date=None):
+        """
+        Feed a closed trade.
+
+        :param profit: float, profit of the trade.
+        :param entry_date: datetime, optional entry date.
+        :param exit_date: datetime, optional exit date.
+        """
+        self.num_trades += 1
+        self.total_profit += profit
+        if profit > 0:
+            self.num_winning += 1
+        elif profit < 0:
+            self.num_losing += 1
+        if entry_date is not None and exit_date is not None:
+            # Only dates give a holding period, e.g. not the epoch numbers of some data sources
+            days = getattr(exit_date - entry_date, 'days', None)
+            if days is not None:
+                self.total_holding_days += days
+                self.num_holding += 1
+
+    def record_trades(self, trades):
+        """
+        Feed a list of closed trades with 'profit' and optionally 'entry_date' / 'exit_date' keys.
+
+        :param trades: list of dict, or None.
+        """
+        for trade in trades or []:
+            self.record_trade(trade['profit'], trade.get('entry_date'), trade.get('exit_date'))
+
+    def record_fill(self, symbol, action, quantity, price, fee=0.0, time=None):
+        """
+        Feed an execution. Fills are netted per symbol at the average entry price, every fill that reduces or
+        closes a position is recorded as a closed trade with its realized profit, net of fees.
+
+        :param symbol: str, traded symbol.
+        :param action: str, 'BUY' or 'SELL'.
+        :param quantity: float, filled quantity.
+        :param price: float, fill price.
+        :param fee: float, fee paid for the fill.
+        :param time: datetime, optional time of the fill, used for the holding period.
+        """
+        if not quantity:
+            return
+        signed = quantity if action.upper() == 'BUY' else -quantity
+        self.cash_flow -= signed * price + fee
+        self.marks.setdefault(symbol, price)
+        position, average, open_fees, entry_time = self.positions.get(symbol, (0.0, 0.0, 0.0, None))
+
+        if position == 0 or (position > 0) == (signed > 0):
+            total = position + signed
+            average = (position * average + signed * price) / total
+            self.positions[symbol] = (total, average, open_fees + fee, entry_time if position else time)
+            return
+
+        closed = min(abs(signed), abs(position))
+        share = closed / abs(position)
+        fill_share = closed / abs(signed)
+        profit = closed * (price - average) * (1 if position > 0 else -1) - open_fees * share - fee * fill_share
+        self.record_trade(profit, entry_time, time)
+
+        remaining = position + (closed if signed > 0 else -closed)
+        if abs(remaining) > 1e-12:
+            self.positions[symbol] = (remaining, average, open_fees * (1 - share), entry_time)
+        elif abs(signed) > closed:
+            # The fill reversed the position, the rest opens a new one
+            self.positions[symbol] = (signed + position, price, fee * (1 - fill_share), time)
+        else:
+            self.positions.pop(symbol, None)
+
+    def record_fills(self, fills):
+        """
+        Feed the execution responses of a bar, e.g. the fills of execution.ExecutingSystem.match_bars, with
+        'symbol', 'action', 'executed_quantity', 'price' and optionally 'fee' and 'time' keys.
+
+        :param fills: list of dict, or None.
+        """
+        for fill in fills or []:
+            if fill.get('executed_quantity') and fill.get('price') is not None:
+                self.record_fill(fill['symbol'], fill['action'], fill['executed_quantity'], fill['price'],
+                                 fill.get('fee') or 0.0, fill.get('time'))
+
+    def mark(self, symbol, price):
+        """
+        Set the price the open position of a symbol is valued at, e.g. the close of its latest bar.
+
+        :param symbol: str, traded symbol.
+        :param price: float, current price.
+        """
+        self.marks[symbol] = price
+
+    def marked_equity(self, base_equity=0.0):
+        """
+        Equity including the fills fed through record_fill: the base equity plus the cash flow of the fills and the
+        open positions valued at their marks.
+
+        :param base_equity: float, equity without the fills, e.g. the portfolio's initial cash and positions.
+        :return: float, marked-to-market equity.
+        """
+        return base_equity + self.cash_flow + sum(position * self.marks[symbol]
+                                                  for symbol, (position, _, _, _) in self.positions.items())
+
+    def report(self):
+        """
+        Build the metrics from the running state, with the same names as get_metrics.
+
+        :return: dict, performance metrics.
+        """
+        nan = float('nan')
+        total_return = self.equity / self.initial_equity - 1 if self.initial_equity else nan
+        variance = self.m2 / self.count if self.count else nan
+        std = np.sqrt(variance) if self.count else nan
+        num_years = self.num_bars / self.periods_per_year
+
+        if self.count > 1 and self.m2 > 0:
+            # Same bias-corrected estimators as pandas skew() and kurtosis()
+            n = self.count
+            g1 = np.sqrt(n) * self.m3 / self.m2 ** 1.5
+            g2 = n * self.m4 / self.m2 ** 2 - 3
+            skewness = g1 * np.sqrt(n * (n - 1)) / (n - 2) if n > 2 else nan
+            kurtosis = ((n + 1) * g2 + 6) * (n - 1) / ((n - 2) * (n - 3)) if n > 3 else nan
+        else:
+            skewness = kurtosis = nan
+
+        return {
+            'cumulative_return': total_return,
+            'max_drawdown': self.max_drawdown,
+            'sharpe_ratio': self.mean / std if self.count and std > 0 else nan,
+            'annualized_sharpe': self.mean / std * np.sqrt(self.periods_per_year) if self.count and std > 0 else nan,
+            'annual_return': annualized_return(total_return, num_years) if num_years > 0 else nan,
+            'trade_times': self.num_trades,
+            'average_profit_per_trade': self.total_profit / self.num_trades if self.num_trades else nan,
+            'average_hold_period': self.total_holding_days / self.num_holding if self.num_holding else nan,
+            'winning_percentage': self.num_winning / self.num_trades if self.num_trades else nan,
+            'losing_percentage': self.num_losing / self.num_trades if self.num_trades else nan,
+            'return_analysis': {
+                'mean_return': self.mean if self.count else nan,
+                'std_deviation': std,
+                'skewness': skewness,
+                'kurtosis': kurtosis,
+            },
+        }
+
+
 class Performance:
     def __init__(self, portfolio=None, initial_data=None):
         """
@@ -142,6 +142,21 @@ class Portfolio:
             handle_error("Error occurred while handling trading signals.", _)
             raise
 
+    def get_equity(self, prices=None):
+        """
+        Get the total value of the portfolio.
+
+        :param prices: dict-like, asset name to price (or to a bar with a 'close' price), None values positions at 0.
+        :return: float, cash plus marked-to-market positions.
+        """
+        equity = 0.0
+        for asset in self.asset_list:
+            price = prices.get(asset.asset_name) if prices is not None and hasattr(prices, 'get') else None
+            if price is not None and hasattr(price, 'get'):
+                price = price.get('close')
+            equity += (asset.initial_cash or 0.0) + (asset.initial_position or 0.0) * (price or 0.0)
+        return equity
+
     def add_new_asset(self, asset):
         """
         Add a new asset to the portfolio.
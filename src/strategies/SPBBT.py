@@ -1,7 +1,7 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 import logging
-from lib import factors_lib,auto_order,BN_market
+from lib import factors_lib,factors_stream,auto_order,BN_market
 
 
 class SPBBT:
@@ -24,6 +24,14 @@ class SPBBT:
         self.order_timer = None
         self.order_timeout = order_timeout
 
+        # 流式指标状态，用历史K线预热后每根新K线只需 O(1) 更新
+        self.vwap_state = factors_stream.VWAPState()
+        self.spt_state = factors_stream.SuperTrendState()
+        self.bb_state = factors_stream.BBState()
+        if coin_data is not None:
+            for state in (self.vwap_state, self.spt_state, self.bb_state):
+                state.update_many(coin_data)
+
     def open_position(self, signal, price, exe_price):
         # Open position logic
         auto_order.place_limit_order()
@@ -139,13 +147,13 @@ class SPBBT:
 
 # 交易逻辑的实现，与之前的示例相同
 
-def process_trade(self, current_close, current_high, current_low, current_vwap, current_spt, bb_upper, bb_lower):
-    current_vwap = factors_lib.vwap(self.all_data)
-    current_spt = factors_lib.SuperTrend(self.all_data)
-    bb = factors_lib.BB(self.all_data)
+def process_trade(self, bar):
+    current_vwap = self.vwap_state.update(bar)
+    current_spt = self.spt_state.update(bar)
+    bb = self.bb_state.update(bar)
 
-    self.trade_logic(current_close, current_high, current_low, current_vwap, current_spt, bb["upper_band"],
-                     bb["upper_band"])
+    self.trade_logic(bar['close'], bar['high'], bar['low'], current_vwap, current_spt, bb["upper_band"],
+                     bb["lower_band"])
 
     # 更新订单计时器
     # if self.order_signal is not None:
@@ -155,4 +163,4 @@ def process_trade(self, current_close, current_high, current_low, current_vwap,
 # 使用示例
 # strategy = lib.SPBBT()
 # 在每个新的K线上调用交易逻辑
-# strategy.process_trade(current_close, current_high, current_low, current_vwap, current_spt, bb_upper, bb_lower)
+# strategy.process_trade(bar)
@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized backtest for strategies that express their signals as target weights.
+
+The strategy returns a (time × asset) matrix of target portfolio weights decided at each bar's close. Returns,
+turnover, fees, slippage and the equity curve are computed with array operations instead of a per-bar event loop.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from lib import factor_panel, performance
+
+
+def price_matrix(data, price_column='close', time_column='timestamp', symbol_column='symbol'):
+    """
+    Build a (time × asset) price matrix from historical data.
+
+    :param data: Long table with time, symbol and price columns, or a single-asset table.
+    :param price_column: Name of the price column.
+    :param time_column: Name of the time column.
+    :param symbol_column: Name of the symbol column.
+    :return: Pandas DataFrame indexed by time with one column per asset.
+    """
+    if symbol_column in data.columns:
+        panel = factor_panel.FactorPanel.from_frame(data, (price_column,), time_column, symbol_column)
+        return pd.DataFrame(panel.fields[price_column], index=panel.times, columns=panel.symbols)
+
+    index = data[time_column] if time_column in data.columns else data.index
+    return pd.DataFrame({price_column: data[price_column].to_numpy(dtype=np.float64)}, index=index)
+
+
+def _per_asset(values, num_assets, name):
+    """
+    Broadcast a fee or slippage setting (None, scalar or one value per asset) to an array.
+    """
+    if values is None:
+        return np.zeros(num_assets)
+    values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+    if values.size == 1:
+        return np.full(num_assets, values[0])
+    if values.size != num_assets:
+        raise ValueError(f"{name} has {values.size} values for {num_assets} assets")
+    return values
+
+
+def run_vectorized(prices, weights, transaction_fees=None, slippages=None, initial_cash=1.0, periods_per_year=365,
+                   risk_free_rate=0.0):
+    """
+    Simulate target-weight rebalancing at every bar's close.
+
+    Weights set at bar t are held over (t, t+1]. Before rebalancing, the previous weights drift with the asset
+    returns; the traded fraction of equity is the difference between the target and the drifted weights, and is
+    charged transaction fee plus slippage.
+
+    :param prices: (time × asset) array or DataFrame of prices.
+    :param weights: (time × asset) array or DataFrame of target weights, NaN means no position. A DataFrame is
+                    aligned to the price DataFrame's index and columns, missing assets and bars hold nothing.
+    :param transaction_fees: Fee rate per traded notional, scalar or one value per asset.
+    :param slippages: Slippage as a fraction of price, scalar or one value per asset.
+    :param initial_cash: Starting equity.
+    :param periods_per_year: Number of bars per year, used to annualize.
+    :param risk_free_rate: Risk-free rate per bar.
+    :return: Dictionary with the equity, returns, turnover and cost (fees plus slippage, in cash) Series, the
+             target weights and the metrics.
+    """
+    index = prices.index if isinstance(prices, pd.DataFrame) else None
+    if isinstance(weights, pd.DataFrame) and isinstance(prices, pd.DataFrame):
+        # Align by label, not by position: the strategy may order or subset the assets differently
+        unknown = weights.columns.difference(prices.columns)
+        if len(unknown):
+            raise ValueError(f"Weights for assets without prices: {list(unknown)}")
+        weights = weights.reindex(index=prices.index, columns=prices.columns)
+    price_values = np.asarray(prices, dtype=np.float64)
+    if price_values.ndim == 1:
+        price_values = price_values[:, None]
+    weight_values = np.nan_to_num(np.asarray(weights, dtype=np.float64)).reshape(price_values.shape)
+    num_bars, num_assets = price_values.shape
+
+    cost_rates = _per_asset(transaction_fees, num_assets, 'transaction_fees') + \
+        _per_asset(slippages, num_assets, 'slippages')
+
+    # Missing bars keep the last price, so a held asset earns the whole move when trading resumes
+    price_values = pd.DataFrame(price_values).ffill().to_numpy()
+    asset_returns = np.zeros_like(price_values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        asset_returns[1:] = price_values[1:] / price_values[:-1] - 1
+    asset_returns[~np.isfinite(asset_returns)] = 0.0
+
+    # Return of the weights held over each bar, then the weights drifted by those returns
+    held = np.zeros_like(weight_values)
+    held[1:] = weight_values[:-1]
+    gross_returns = np.einsum('ij,ij->i', held, asset_returns)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drifted = held * (1 + asset_returns) / (1 + gross_returns)[:, None]
+    drifted[~np.isfinite(drifted)] = 0.0
+
+    traded = np.abs(weight_values - drifted)
+    turnover = traded.sum(axis=1)
+    costs = traded @ cost_rates
+
+    net_returns = (1 + gross_returns) * (1 - costs) - 1
+    equity = initial_cash * np.cumprod(1 + net_returns)
+    cost_amounts = costs * np.r_[initial_cash, equity[:-1]] * (1 + gross_returns)
+
+    metrics = vectorized_metrics(equity, net_returns, turnover, cost_amounts, initial_cash, periods_per_year,
+                                 risk_free_rate)
+    return {
+        'equity': pd.Series(equity, index=index, name='Equity Curve'),
+        'returns': pd.Series(net_returns, index=index),
+        'turnover': pd.Series(turnover, index=index),
+        'costs': pd.Series(cost_amounts, index=index),
+        'weights': weight_values,
+        'metrics': metrics,
+    }
+
+
+def vectorized_metrics(equity, returns, turnover, cost_amounts, initial_cash=1.0, periods_per_year=365,
+                       risk_free_rate=0.0):
+    """
+    Performance metrics of a vectorized backtest.
+
+    :return: Dictionary of metrics, with the same names and meaning as performance.get_metrics where they overlap:
+             sharpe_ratio is per bar like in the event-driven backtest, annualized_sharpe scales it by
+             sqrt(periods_per_year).
+    """
+    curve = np.r_[initial_cash, equity]
+    peak = np.maximum.accumulate(curve)
+    total_return = performance.cumulative_returns(curve)
+    num_years = len(returns) / periods_per_year
+
+    excess = returns - risk_free_rate
+    std = excess.std()
+    sharpe = float(excess.mean() / std) if std > 0 else math.nan
+    return {
+        'cumulative_return': float(total_return),
+        'max_drawdown': float(np.min(curve / peak - 1)),
+        'sharpe_ratio': sharpe,
+        'annualized_sharpe': sharpe * math.sqrt(periods_per_year),
+        'annual_return': (float(performance.annualized_return(total_return, num_years)) if num_years > 0
+                          else math.nan),
+        'trade_times': int(np.count_nonzero(turnover > 1e-12)),
+        'turnover': float(turnover.sum()),
+        'total_costs': float(cost_amounts.sum()),
+    }
+
+
+# Test
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    test_prices = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.02, (3650, 2)), axis=0)),
+                               index=pd.date_range('2014-01-01', periods=3650, freq='D'),
+                               columns=['BTC/USDT', 'ETH/USDT'])
+
+    # 20-day momentum rotation: hold the stronger asset, stay flat when both are falling
+    momentum = test_prices.pct_change(20)
+    test_weights = np.where(momentum.to_numpy() == momentum.max(axis=1).to_numpy()[:, None], 1.0, 0.0)
+    test_weights[(momentum.max(axis=1) < 0).to_numpy()] = 0.0
+
+    start = time.perf_counter()
+    result = run_vectorized(test_prices, test_weights, transaction_fees=0.001, slippages=0.0005)
+    print(f"{len(test_prices)} bars in {time.perf_counter() - start:.4f}s")
+    print(result['metrics'])
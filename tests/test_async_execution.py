@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import asyncio
+import itertools
+
+import ccxt
+
+import Order
+from lib import async_execution
+
+
+class FakeExchange:
+    """
+    Injectable stand-in for a ccxt async client, keeping the orders it accepted by client order id.
+    """
+
+    def __init__(self, fail_after_accepting=None):
+        self.has = {'createOrders': True, 'cancelOrders': True}
+        self.fail_after_accepting = fail_after_accepting
+        self.orders = {}
+        self.lookups = []
+        self.ids = itertools.count()
+
+    def _accept(self, symbol, type, side, amount, price=None, params=None):
+        result = {'id': str(next(self.ids)), 'symbol': symbol, 'status': 'open', 'filled': 0.0, 'remaining': amount,
+                  'price': price, 'clientOrderId': (params or {}).get('clientOrderId')}
+        self.orders[result['clientOrderId']] = result
+        return result
+
+    async def create_order(self, symbol, type, side, amount, price=None, params=None):
+        result = self._accept(symbol, type, side, amount, price, params)
+        if self.fail_after_accepting is not None:
+            raise self.fail_after_accepting
+        return result
+
+    async def create_orders(self, requests):
+        results = [self._accept(**request) for request in requests]
+        if self.fail_after_accepting is not None:
+            raise self.fail_after_accepting
+        return results
+
+    async def fetch_order(self, exchange_order_id, symbol, params=None):
+        self.lookups.append(params['clientOrderId'])
+        if params['clientOrderId'] not in self.orders:
+            raise ccxt.OrderNotFound(params['clientOrderId'])
+        return self.orders[params['clientOrderId']]
+
+
+def limit_order(order_id, symbol='BTC/USDT'):
+    order = Order.LimitOrder(symbol, 1, 'BUY', 100.0)
+    order.set_order_id(order_id)
+    return order
+
+
+def test_ccxt_request_timeout_is_reconciled_instead_of_failed():
+    exchange = FakeExchange(fail_after_accepting=ccxt.RequestTimeout('binance timed out'))
+    service = async_execution.AsyncExecutingSystem(clients={'binance': exchange})
+    order = limit_order('order1')
+
+    response = asyncio.run(service.place_order(order))
+
+    assert exchange.lookups == ['order1']
+    assert response['status'] == 'PENDING'
+    assert response['exchange_order_id'] == exchange.orders['order1']['id']
+    assert order in service.executing_system.order_waitlist
+
+
+def test_batch_network_error_is_reconciled_per_order():
+    exchange = FakeExchange(fail_after_accepting=ccxt.NetworkError('connection reset'))
+    service = async_execution.AsyncExecutingSystem(clients={'binance': exchange})
+    orders = [limit_order(f'order{i}') for i in range(3)]
+
+    response = asyncio.run(service.submit_batch(orders))
+
+    assert sorted(exchange.lookups) == ['order0', 'order1', 'order2']
+    assert response['status'] == 'PENDING'
+    assert len(service.executing_system.order_waitlist) == 3
+
+
+def test_lookup_failure_reports_unknown():
+    exchange = FakeExchange(fail_after_accepting=ccxt.RequestTimeout('binance timed out'))
+    service = async_execution.AsyncExecutingSystem(clients={'binance': exchange})
+    order = limit_order('order1')
+
+    async def lookup_fails(exchange_order_id, symbol, params=None):
+        raise ccxt.ExchangeNotAvailable('maintenance')
+
+    exchange.fetch_order = lookup_fails
+    response = asyncio.run(service.place_order(order))
+
+    assert response['status'] == 'UNKNOWN'
+
+
+class BatchExchange(FakeExchange):
+    """
+    Fake client answering batch requests with preset per-order entries.
+    """
+
+    def __init__(self, create_results=None, cancel_results=None):
+        super().__init__()
+        self.create_results = create_results
+        self.cancel_results = cancel_results
+
+    async def create_orders(self, requests):
+        return self.create_results
+
+    async def cancel_orders(self, exchange_order_ids, symbol):
+        return self.cancel_results
+
+
+def test_batch_cancel_only_cancels_orders_the_exchange_cancelled():
+    exchange = BatchExchange(cancel_results=[{'id': 'a', 'status': 'canceled'},
+                                             {'id': 'b', 'status': 'closed', 'filled': 1.0, 'remaining': 0.0}])
+    service = async_execution.AsyncExecutingSystem(clients={'binance': exchange})
+    cancelled, filled = limit_order('order1'), limit_order('order2')
+    for order, exchange_order_id in ((cancelled, 'a'), (filled, 'b')):
+        order.exchange_order_id = exchange_order_id
+        service.executing_system.order_waitlist.add(order)
+
+    response = asyncio.run(service.cancel_batch([cancelled, filled]))
+
+    assert response['orders']['order1']['status'] == 'SUCCESS'
+    assert response['orders']['order2']['status'] == 'FAILED'
+    assert cancelled.get_status() == 'CANCELLED'
+    assert filled.get_status() == 'SUCCESS'
+    assert len(service.executing_system.order_waitlist) == 0
+
+
+def test_rejected_batch_entries_fail_and_do_not_rest():
+    # Exchanges report rejected entries with status 'rejected', or only with the error and no order id
+    exchange = BatchExchange(create_results=[{'id': '1', 'status': 'open', 'filled': 0.0},
+                                             {'id': None, 'status': 'rejected', 'info': {'msg': 'Insufficient margin'}},
+                                             {'id': None, 'status': None, 'info': {'sCode': '51008'}}])
+    service = async_execution.AsyncExecutingSystem(clients={'binance': exchange})
+    orders = [limit_order(f'order{i}') for i in range(3)]
+
+    response = asyncio.run(service.submit_batch(orders))
+
+    assert [response['orders'][f'order{i}']['status'] for i in range(3)] == ['PENDING', 'FAILED', 'FAILED']
+    assert [order.get_status() for order in orders[1:]] == ['FAILED', 'FAILED']
+    assert list(service.executing_system.order_waitlist) == orders[:1]
@@ -1,9 +1,64 @@
 # !/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import pytest
+
+import Order
+from lib import execution, factor_cache, performance, portfolio
 from lib.backtest_engine import BacktestEngine
 
 
+class BarSource:
+    def __init__(self, bars):
+        self.bars = bars
+
+    def iter_bars(self, chunk_size=None):
+        return iter(self.bars)
+
+
+class BuyOnceStrategy:
+    def __init__(self, exec_sys):
+        self.exec_sys = exec_sys
+        self.placed = False
+
+    def generate_signals(self, bar):
+        if not self.placed:
+            order = Order.MarketOrder('BTC/USDT', 1, 'BUY')
+            order.order_id = 'buy-1'
+            self.exec_sys.order_waitlist.add(order)
+            self.placed = True
+        return []
+
+    def execute_trades(self, portfolio, trade_history):
+        pass
+
+
+class SignalPortfolio(portfolio.Portfolio):
+    def handle_signals(self, signals, bar=None):
+        return []
+
+
+def test_fill_moves_backtest_equity():
+    engine = BacktestEngine()
+    engine.exec_sys = execution.ExecutingSystem()
+    engine.strategy = BuyOnceStrategy(engine.exec_sys)
+    engine.portfolio = SignalPortfolio()
+    engine.portfolio.add_new_asset(portfolio.Asset('BTC/USDT', None, 1000.0, 'USDT', 0.0))
+    engine.accumulator = performance.PerformanceAccumulator()
+    engine.factor_cache = factor_cache.FactorCache()
+    engine.data_source = BarSource([
+        {'open': 100.0, 'high': 100.0, 'low': 100.0, 'close': 100.0, 'volume': 1000.0},
+        {'open': 100.0, 'high': 110.0, 'low': 100.0, 'close': 110.0, 'volume': 1000.0},
+        {'open': 110.0, 'high': 121.0, 'low': 110.0, 'close': 121.0, 'volume': 1000.0},
+    ])
+
+    metrics = engine.run_backtest(reset=False)
+
+    assert engine.accumulator.equity == pytest.approx(1021.0)
+    assert metrics['cumulative_return'] == pytest.approx(0.021)
+    assert metrics['max_drawdown'] == 0.0
+
+
 def main():
     """
     Main function to demonstrate the usage of the backtest engine.
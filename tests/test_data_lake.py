@@ -0,0 +1,29 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from lib.data_lake import MarketDataLake
+
+
+def candles(start, periods):
+    timestamps = pd.date_range(start, periods=periods, freq='12h')
+    return pd.DataFrame({'timestamp': timestamps, 'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.5,
+                         'volume': 10.0})
+
+
+def test_append_many_writes_manifest_once(tmp_path, monkeypatch):
+    lake = MarketDataLake(str(tmp_path))
+    lake.append('12h', 'BTC/USDT:USDT', candles('2024-01-01', 100))
+
+    writes = []
+    write_manifest = lake.write_manifest
+    monkeypatch.setattr(lake, 'write_manifest', lambda *args: writes.append(args) or write_manifest(*args))
+    frames = {symbol: candles('2024-02-15', 60) for symbol in ('BTC/USDT:USDT', 'ETH/USDT:USDT', 'SOL/USDT:USDT')}
+    added = lake.append_many('12h', frames)
+
+    assert len(writes) == 1
+    assert added == 3 * 60 - 10
+    assert lake.symbols('12h') == ['BTC/USDT:USDT', 'ETH/USDT:USDT', 'SOL/USDT:USDT']
+    assert lake.high_water_mark('12h', 'ETH/USDT:USDT') == frames['ETH/USDT:USDT']['timestamp'].iloc[-1]
+    assert len(lake.read('12h', 'BTC/USDT:USDT')) == 150
+    assert lake.verify('12h') == []
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+
+from lib import data_resource
+
+
+def write_csv(path, num_rows=50):
+    times = pd.date_range('2024-01-01', periods=num_rows, freq='h')
+    pd.DataFrame({
+        'timestamp': times.astype('int64') // 10 ** 6,
+        'symbol': np.where(np.arange(num_rows) % 2, 'BTC/USDT', 'ETH/USDT'),
+        'close': np.linspace(100, 150, num_rows),
+    }).to_csv(path, index=False)
+    return times
+
+
+def load(path, columnar_cache):
+    source = data_resource.DataSource(str(path), columnar_cache=columnar_cache)
+    return source, source.load_data()
+
+
+def test_columnar_cache_and_typed_csv_return_same_frame(tmp_path):
+    path = tmp_path / 'bars.csv'
+    write_csv(path)
+
+    _, typed = load(path, columnar_cache=False)
+    _, cached = load(path, columnar_cache=True)
+
+    assert isinstance(typed['symbol'].dtype, pd.CategoricalDtype)
+    assert typed['timestamp'].dtype == np.dtype('datetime64[ns]')
+    pdt.assert_frame_equal(cached.reset_index(drop=True), typed.reset_index(drop=True))
+
+
+def test_date_range_of_timestamp_column_comes_from_schema(tmp_path, monkeypatch):
+    path = tmp_path / 'bars.csv'
+    times = write_csv(path)
+    schema = data_resource.load_csv_schema(str(path))
+    assert (schema['first_date'], schema['last_date']) == (str(times[0]), str(times[-1]))
+
+    # A schema whose dates differ from the data shows whether the range was read from it or scanned
+    schema = dict(schema, first_date='2020-01-01', last_date='2020-12-31')
+    monkeypatch.setattr(data_resource, 'load_csv_schema', lambda file_path: schema)
+    for columnar_cache in (False, True):
+        source, _ = load(path, columnar_cache)
+        assert (source.start_date, source.end_date) == (pd.Timestamp('2020-01-01'), pd.Timestamp('2020-12-31'))
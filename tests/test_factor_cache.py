@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib import factors_lib
+from lib.factor_cache import FactorCache
+
+
+def make_bars(num_bars=300, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, num_bars))
+    return pd.DataFrame({'close': close, 'high': close + 1, 'low': close - 1,
+                         'volume': rng.uniform(1, 10, num_bars)})
+
+
+def test_corrected_bar_in_history_invalidates_entry():
+    data = make_bars()
+    cache = FactorCache()
+    cache.get(data, 'BB', {'window': 20}, symbol='BTC/USDT')
+
+    corrected = data.copy()
+    corrected.loc[150, 'close'] += 5
+    result = cache.get(corrected, 'BB', {'window': 20}, symbol='BTC/USDT')
+
+    np.testing.assert_allclose(result, factors_lib.BB(corrected.copy(), window=20), equal_nan=True)
+    assert cache.stats()['misses'] == 2
+
+
+def test_appended_bars_extend_entry():
+    data = make_bars()
+    cache = FactorCache()
+    cache.get(data.iloc[:200], 'BB', {'window': 20}, symbol='BTC/USDT')
+    result = cache.get(data, 'BB', {'window': 20}, symbol='BTC/USDT')
+
+    np.testing.assert_allclose(result, factors_lib.BB(data.copy(), window=20), equal_nan=True)
+    assert cache.stats()['extensions'] == 1
+
+
+def test_results_do_not_expose_writable_cache_buffer():
+    data = make_bars()
+    cache = FactorCache()
+    result = cache.get(data, 'sma', {'window': 10})
+
+    with pytest.raises(ValueError):
+        result.to_numpy()[-1] = 0.0
+    np.testing.assert_allclose(cache.get(data, 'sma', {'window': 10}), factors_lib.sma(data, window=10),
+                               equal_nan=True)
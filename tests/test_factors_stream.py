@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+from lib import factors_lib, factors_stream
+
+
+def make_bars(num_bars=60, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, num_bars)))
+    return pd.DataFrame({
+        'close': close,
+        'high': close * (1 + rng.uniform(0, 0.01, num_bars)),
+        'low': close * (1 - rng.uniform(0, 0.01, num_bars)),
+        'volume': rng.uniform(100, 1000, num_bars),
+    })
+
+
+def test_vwap_recovers_after_nan_bars():
+    data = make_bars()
+    data.loc[10, 'close'] = np.nan
+    data.loc[20, 'volume'] = np.nan
+    data.loc[30, ['high', 'low']] = np.nan
+
+    state = factors_stream.VWAPState()
+    streamed = np.array([state.update(bar) for bar in data.to_dict('records')])
+    expected = factors_lib.vwap(data).to_numpy()
+
+    np.testing.assert_allclose(streamed, expected, equal_nan=True)
+    assert np.isnan(streamed[[10, 20, 30]]).all()
+    assert np.isfinite(streamed[31:]).all()
+
+
+def test_aroon_handles_high_and_low_nan_separately():
+    data = make_bars()
+    data.loc[15, 'high'] = np.nan
+    data.loc[35, 'low'] = np.nan
+
+    state = factors_stream.AroonState(window=5)
+    streamed = pd.DataFrame([state.update(bar) for bar in data.to_dict('records')])
+    expected = factors_lib.aroon(data, window=5)
+
+    np.testing.assert_allclose(streamed['aroon_up'], expected['aroon_up'], equal_nan=True)
+    np.testing.assert_allclose(streamed['aroon_down'], expected['aroon_down'], equal_nan=True)
+    assert np.isfinite(streamed.loc[15:19, 'aroon_down']).all()
+    assert np.isfinite(streamed.loc[35:39, 'aroon_up']).all()
@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import Order
+from lib.order_book import OrderRegistry
+
+
+def test_orders_without_id_are_registered_separately():
+    first = Order.MarketOrder('X', 1, 'BUY')
+    second = Order.LimitOrder('Y', 2, 'SELL', 100.0)
+    registry = OrderRegistry([first, second])
+
+    assert len(registry) == 2
+    assert first.get_order_id() is not None and first.get_order_id() != second.get_order_id()
+    assert registry.symbols() == ['X', 'Y']
+    assert registry.get(second.get_order_id()) is second
+    assert registry.get(None) is None
+
+
+def test_add_keeps_existing_order_id():
+    order = Order.MarketOrder('X', 1, 'BUY')
+    order.set_order_id('client-1')
+    registry = OrderRegistry()
+    registry.add(order)
+    registry.add(order)
+
+    assert len(registry) == 1
+    assert registry.get('client-1') is order
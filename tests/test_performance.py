@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import pytest
+
+from lib.performance import PerformanceAccumulator
+
+
+def test_fill_moves_marked_equity():
+    accumulator = PerformanceAccumulator()
+    accumulator.update(accumulator.marked_equity(1000.0))
+
+    accumulator.record_fill('BTC/USDT', 'BUY', 2, 100.0, fee=1.0)
+    accumulator.mark('BTC/USDT', 110.0)
+    accumulator.update(accumulator.marked_equity(1000.0))
+
+    assert accumulator.equity == pytest.approx(1000.0 - 200.0 - 1.0 + 220.0)
+    assert accumulator.report()['cumulative_return'] == pytest.approx(0.019)
+
+
+def test_closed_position_keeps_realized_profit():
+    accumulator = PerformanceAccumulator()
+    accumulator.record_fill('BTC/USDT', 'BUY', 1, 100.0)
+    accumulator.record_fill('BTC/USDT', 'SELL', 1, 120.0, fee=0.5)
+    accumulator.mark('BTC/USDT', 90.0)
+
+    assert accumulator.marked_equity(1000.0) == pytest.approx(1019.5)
+    assert accumulator.report()['average_profit_per_trade'] == pytest.approx(19.5)